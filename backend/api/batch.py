@@ -0,0 +1,80 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from backend.api.schemas import RouteDetails
+from backend.api.solver import solve_route
+from backend.db import DB
+
+# set in every worker process by _init_worker
+_db: Optional[DB] = None
+_scoring = "bound"
+
+
+def _init_worker(db: DB, scoring: str) -> None:
+    global _db, _scoring
+    # The forked worker inherits the parent's in-memory graph and indexes copy-on-write, but must not reuse
+    # the parent's pooled connections
+    if db._engine is not None:
+        db._engine.dispose(close=False)
+    _db, _scoring = db, scoring
+
+
+def _solve(route_details: RouteDetails) -> dict:
+    try:
+        return {"path": solve_route(route_details, _db, _scoring), "error": None}
+    except Exception as e:
+        return {"path": None, "error": f"{type(e).__name__}: {e}"}
+
+
+def create_pool(db: DB, workers: Optional[int] = None, scoring: str = "bound") -> ProcessPoolExecutor:
+    """
+    Forks the pool of worker processes of solve_routes.
+
+    The workers are forked once, after the routing and POI data is loaded into `db` and before any other
+    thread is started, so they share the data with the parent and cannot inherit a lock held by another
+    thread. Forking per batch from a solver thread could copy a lock (of a cache, the metrics or the
+    connection pool) taken by another thread at that moment, which the child would then wait on forever.
+
+    Args:
+        db (DB): The database (and in-memory indexes) to use.
+        workers (Optional[int]): Number of worker processes, defaults to the number of CPUs.
+        scoring (str): How POI candidates are ranked, see PathFinder.
+
+    Returns:
+        ProcessPoolExecutor: The pool, to be shut down by the caller.
+    """
+    pool = ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count() or 1,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_init_worker,
+        initargs=(db, scoring),
+    )
+    # with fork, the first task starts all the workers, so they are forked now rather than by a later batch
+    pool.submit(os.getpid).result()
+    return pool
+
+
+def solve_routes(routes: List[RouteDetails], pool: ProcessPoolExecutor) -> dict:
+    """
+    Solves many routes in parallel on a pool of worker processes created by create_pool.
+
+    Args:
+        routes (List[RouteDetails]): The routes to solve.
+        pool (ProcessPoolExecutor): The worker processes.
+
+    Returns:
+        dict: The per-route results (a dumped Path or an error), the elapsed time in seconds and the
+        throughput in routes per second.
+    """
+    start = time.perf_counter()
+    results = list(pool.map(_solve, routes))
+    elapsed = time.perf_counter() - start
+    print(f"Batch | Solved {len(routes)} routes in {elapsed:.2f}s")
+    return {
+        "results": results,
+        "elapsed": elapsed,
+        "routes_per_second": len(routes) / elapsed if elapsed > 0 else 0.0,
+    }
@@ -1,11 +1,76 @@
-from fastapi import FastAPI
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 
 from backend.api.constants import AMENITIES
-from backend.api.schemas import AmenitiesList, Path, RouteDetails, MapPoint, POI
-from backend.pathfinder import PathFinder
+from backend.api.batch import create_pool, solve_routes
+from backend.api.route_cache import RouteCache
+from backend.api.session import SessionStore
+from backend.api.schemas import (
+    AmenitiesList,
+    BatchPaths,
+    BatchRouteDetails,
+    CacheStats,
+    CompactPath,
+    Isochrone,
+    IsochroneDetails,
+    Path,
+    ResponseFormat,
+    RouteChunk,
+    RouteDetails,
+    SessionPath,
+)
+from backend.api.solver import solve_isochrone, stream_route
+from backend.ch import ContractionHierarchy
+from backend.constants import DB_POOL_SIZE, ROUTE_CACHE_MAX_BYTES, SESSION_MAX_COUNT, SESSION_TTL
+from backend.db import DB, create_db_engine, leg_cache, snap_cache
+from backend.graph import ROUTING_METHODS
+from backend.metrics import histograms, server_timing, start_request
+from backend.storage import STORAGE_BACKENDS, LocalDB
+
+# "postgis" (default) answers the queries from the database, "local" from the map directory written by
+# `python -m backend.storage`, memory-mapped so all workers share one copy
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "postgis")
+if STORAGE_BACKEND not in STORAGE_BACKENDS:
+    raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}, expected one of {STORAGE_BACKENDS}")
+LOCAL_MAP_PATH = os.getenv("LOCAL_MAP_PATH", "map")
+# "pgrouting" (default) queries pgr_dijkstra for every leg, "dijkstra" and "astar" load the road graph
+# once at startup and route in process, "ch" loads the contraction hierarchy built by `python -m backend.ch`
+ROUTING_ENGINE = os.getenv("ROUTING_ENGINE", "pgrouting")
+CH_INDEX_PATH = os.getenv("CH_INDEX_PATH", "road_graph.ch")
+# "postgis" (default) snaps points with SQL queries, "memory" loads KD-tree snapping indexes at startup
+SNAP_ENGINE = os.getenv("SNAP_ENGINE", "postgis")
+# "postgis" (default) finds POI candidates with SQL queries, "memory" loads an amenity index at startup
+AMENITY_ENGINE = os.getenv("AMENITY_ENGINE", "postgis")
+# "postgis" (default) snaps amenity points with the other points, "memory" loads the road vertices
+# pre-snapped for them by `python -m backend.schema` at startup
+POI_SNAP_ENGINE = os.getenv("POI_SNAP_ENGINE", "postgis")
+# "bound" (default), "heuristic" or "detour", see PathFinder.rank_candidates
+CANDIDATE_SCORING = os.getenv("CANDIDATE_SCORING", "bound")
+# Number of routes solved at once, off the event loop; each solver holds at most one pooled connection
+SOLVER_WORKERS = int(os.getenv("SOLVER_WORKERS", os.getenv("DB_POOL_SIZE", DB_POOL_SIZE)))
+# Number of worker processes of /routes/batch, defaults to the number of CPUs, 0 disables the endpoint
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", os.cpu_count() or 1))
+# Responses of /route/ kept in memory, and in an SQLite file at ROUTE_CACHE_PATH (if set) across restarts
+route_cache = RouteCache(
+    max_bytes=int(os.getenv("ROUTE_CACHE_MAX_BYTES", ROUTE_CACHE_MAX_BYTES)),
+    path=os.getenv("ROUTE_CACHE_PATH"),
+)
+# Routing sessions of /route/session/, re-routed reusing the legs and candidates of their last route
+sessions = SessionStore(
+    max_count=int(os.getenv("SESSION_MAX_COUNT", SESSION_MAX_COUNT)),
+    ttl=float(os.getenv("SESSION_TTL", SESSION_TTL)),
+)
 
 app = FastAPI()
+app.state.db = None
+app.state.executor = None
+app.state.batch_pool = None
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,6 +81,85 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def timing(request: Request, call_next):
+    # The spans of the request, also the ones of the solver threads, are summed up in the Server-Timing
+    # header. A streamed response only has the ones that finished before its first chunk.
+    timings = start_request()
+    response = await call_next(request)
+    if timings:
+        response.headers["Server-Timing"] = server_timing(timings)
+    return response
+
+
+def run_in_executor(function, *args) -> asyncio.Future:
+    """Runs the function in the solver executor, in a copy of the current context (request timings)."""
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(app.state.executor, contextvars.copy_context().run, function, *args)
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """Checks if the If-None-Match header of the request matches the ETag of the response."""
+    tags = [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]
+    return "*" in tags or etag in tags
+
+
+def load_local_db() -> LocalDB:
+    """Maps the map directory of the local storage backend, with the configured routing engine."""
+    if ROUTING_ENGINE == "ch":
+        return LocalDB.load(LOCAL_MAP_PATH, router=ContractionHierarchy.load(CH_INDEX_PATH))
+    method = ROUTING_ENGINE if ROUTING_ENGINE in ROUTING_METHODS else "dijkstra"
+    return LocalDB.load(LOCAL_MAP_PATH, method=method)
+
+
+@app.on_event("startup")
+async def startup():
+    if STORAGE_BACKEND == "local":
+        app.state.db = load_local_db()
+    else:
+        engine = create_db_engine()
+        db = DB(engine)
+        router = None
+        if ROUTING_ENGINE in ROUTING_METHODS:
+            router = db.load_road_graph(method=ROUTING_ENGINE)
+        elif ROUTING_ENGINE == "ch":
+            router = ContractionHierarchy.load(CH_INDEX_PATH)
+        app.state.db = DB(
+            engine,
+            router=router,
+            snap_index=db.load_snap_index() if SNAP_ENGINE == "memory" else None,
+            amenity_index=db.load_amenity_index(AMENITIES) if AMENITY_ENGINE == "memory" else None,
+            poi_snap=db.load_poi_snap_table() if POI_SNAP_ENGINE == "memory" else None,
+        )
+    # forked once the data is loaded and before the solver threads exist, see create_pool
+    if BATCH_WORKERS > 0:
+        app.state.batch_pool = create_pool(app.state.db, BATCH_WORKERS, CANDIDATE_SCORING)
+    app.state.executor = ThreadPoolExecutor(max_workers=SOLVER_WORKERS, thread_name_prefix="solver")
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if app.state.executor is not None:
+        app.state.executor.shutdown(wait=False)
+    if app.state.batch_pool is not None:
+        app.state.batch_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def get_db() -> DB:
+    """Returns the app-lifetime DB, created lazily if the startup handler did not run."""
+    if app.state.db is None:
+        app.state.db = load_local_db() if STORAGE_BACKEND == "local" else DB()
+    return app.state.db
+
+
+def get_batch_pool() -> ProcessPoolExecutor:
+    """Returns the worker processes of /routes/batch, which are only forked by the startup handler."""
+    # forking here, with the solver threads running, could copy a lock held by one of them, see create_pool
+    if app.state.batch_pool is None:
+        raise HTTPException(status_code=503, detail="Batch routes are disabled, see BATCH_WORKERS")
+    return app.state.batch_pool
+
+
 @app.get("/")
 async def root():
     return {"message": "Hello SPDB!"}
@@ -28,59 +172,115 @@ async def amenities():
     ).model_dump()
 
 
-@app.post("/route/", response_model=Path)
-async def create_route(route_details: RouteDetails):
-    finder = PathFinder(
-        start=route_details.start,
-        end=route_details.end,
-        max_time=route_details.additional_time,
-        max_distance=route_details.additional_distance,
-        max_num_pois=len(route_details.pois),
-        pois_order=route_details.pois,
+@app.get("/cache/legs/", response_model=CacheStats)
+async def leg_cache_stats():
+    return CacheStats(**leg_cache.stats()).model_dump()
+
+
+@app.delete("/cache/legs/", response_model=CacheStats)
+async def invalidate_leg_cache():
+    leg_cache.invalidate()
+    snap_cache.invalidate()
+    return CacheStats(**leg_cache.stats()).model_dump()
+
+
+@app.get("/cache/routes/", response_model=CacheStats)
+async def route_cache_stats():
+    return CacheStats(**route_cache.memory.stats()).model_dump()
+
+
+@app.delete("/cache/routes/", response_model=CacheStats)
+async def invalidate_route_cache():
+    route_cache.invalidate()
+    return CacheStats(**route_cache.memory.stats()).model_dump()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Histograms of the durations of every stage of solving routes, in the Prometheus text format
+    return PlainTextResponse(histograms.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/route/", response_model=Path | CompactPath)
+async def create_route(
+    request: Request,
+    route_details: RouteDetails,
+    response_format: ResponseFormat = Query("full", alias="format"),
+):
+    # The solver blocks on queries and CPU-bound searches, so it runs in the bounded executor. Repeated
+    # itineraries are answered from the route cache, and with 304 if the client has the same response.
+    etag, body = await run_in_executor(
+        route_cache.solve, route_details, get_db(), CANDIDATE_SCORING, response_format
     )
+    if not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
 
-    shortest_path = finder.shortest_path
-    path = finder.curr_path
-    pois = finder.curr_pois
-    pois_ids = set([poi[0].id for poi in pois])
-
-    shortest_points = []
-    for i in range(len(shortest_path)):
-        point = shortest_path[i]
-        shortest_points.append(
-            {
-                "map_point": MapPoint(x=point.x, y=point.y),
-                "is_poi": False,
-                "poi_details": None,
-                "dist_from_start": None,
-                "time_from_start": None,
-            }
-        )
 
-    points = []
-    for i in range(len(path)):
-        point = path[i]
-        is_poi = point.id in pois_ids
-        points.append(
-            {
-                "map_point": MapPoint(x=point.x, y=point.y),
-                "is_poi": is_poi,
-                "poi_details": POI(
-                    type=pois[0][2] if is_poi else None,
-                    visit_time=pois[0][1] if is_poi else None,
-                ).model_dump(),
-                "dist_from_start": f"{pois[0][3] / 1000:.1f}" if is_poi else None,
-                "time_from_start": f"{pois[0][4] / 60:.1f}" if is_poi else None,
-            }
-        )
-        if is_poi:
-            pois.pop(0)
-
-    return Path(
-        shortest_points=shortest_points,
-        points=points,
-        path_time= f"{finder.curr_time / 60:.1f}",
-        path_distance=f"{finder.curr_cost / 1000:.1f}",
-        additional_distance=f"{finder.curr_additional_distance / 1000:.1f}",
-        additional_time=f"{finder.curr_additional_time / 60:.1f}",
-    ).model_dump()
+@app.post("/route/session/", response_model=SessionPath)
+async def create_route_session(
+    route_details: RouteDetails, response_format: ResponseFormat = Query("full", alias="format")
+):
+    return await run_in_executor(
+        sessions.solve, route_details, get_db(), None, CANDIDATE_SCORING, response_format
+    )
+
+
+@app.put("/route/session/{route_id}", response_model=SessionPath)
+async def update_route_session(
+    route_id: str,
+    route_details: RouteDetails,
+    response_format: ResponseFormat = Query("full", alias="format"),
+):
+    # Only the POIs after the first changed one are searched again
+    path = await run_in_executor(
+        sessions.solve, route_details, get_db(), route_id, CANDIDATE_SCORING, response_format
+    )
+    if path is None:
+        raise HTTPException(status_code=404, detail="Routing session not found or expired")
+    return path
+
+
+@app.delete("/route/session/{route_id}", status_code=204)
+async def delete_route_session(route_id: str):
+    if not sessions.delete(route_id):
+        raise HTTPException(status_code=404, detail="Routing session not found or expired")
+
+
+@app.post("/route/stream/")
+async def create_route_stream(
+    route_details: RouteDetails, response_format: ResponseFormat = Query("full", alias="format")
+):
+    # Newline-delimited RouteChunks, sent by the solver thread as soon as every part of the path is found
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def send(chunk: dict) -> None:
+        line = RouteChunk(**chunk).model_dump_json(exclude_unset=True) + "\n"
+        loop.call_soon_threadsafe(queue.put_nowait, line)
+
+    def solve() -> None:
+        try:
+            stream_route(route_details, get_db(), send, CANDIDATE_SCORING, response_format)
+        except Exception as e:
+            send({"type": "error", "error": f"{type(e).__name__}: {e}"})
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    run_in_executor(solve)
+
+    async def chunks():
+        while (line := await queue.get()) is not None:
+            yield line
+
+    return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+
+@app.post("/routes/batch", response_model=BatchPaths)
+async def create_routes(batch: BatchRouteDetails):
+    return await run_in_executor(solve_routes, batch.routes, get_batch_pool())
+
+
+@app.post("/isochrone/", response_model=Isochrone)
+async def create_isochrone(isochrone_details: IsochroneDetails):
+    return await run_in_executor(solve_isochrone, isochrone_details, get_db())
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import math
+from typing import List, Optional, Tuple
+
+from backend.api.schemas import POI, MapPoint, RouteDetails
+from backend.api.solver import path_finder, path_response, solve_route
+from backend.cache import DiskCache, LRUCache
+from backend.constants import ROUTE_CACHE_DISTANCE_STEP, ROUTE_CACHE_TIME_STEP
+from backend.db import DB, DBPoint
+
+
+def _floor(value: Optional[float], step: float) -> Optional[float]:
+    # rounded down, so that requests with nearby budgets share a key
+    return round(math.floor(value / step + 1e-9) * step, 6) if value is not None else None
+
+
+def _spelled(type: Optional[str]) -> Optional[str]:
+    # spelled like the /amenities/ list
+    return type and type.replace("_", " ").capitalize()
+
+
+def _etag(body: str) -> str:
+    return f'"{hashlib.sha256(body.encode()).hexdigest()[:32]}"'
+
+
+def _fits(entry: tuple, route_details: RouteDetails) -> bool:
+    # a path found for another budget rounded to the same key may not fit this one
+    _, _, additional_distance, additional_time, _ = entry
+    return (
+        additional_distance <= route_details.additional_distance * 1000
+        and additional_time <= route_details.additional_time * 60
+    )
+
+
+def _respelled(body: str, pois: List[POI], response_format: str) -> str:
+    """
+    Spells the POI types of a cached response like the POIs of a request that shares its key.
+
+    Args:
+        body (str): The JSON body of the response.
+        pois (List[POI]): The POIs of the request.
+        response_format (str): "full" or "polyline", see solve_route.
+
+    Returns:
+        str: The JSON body with the POI types of the request.
+    """
+    types = {_spelled(poi.type): poi.type for poi in pois}
+    response = json.loads(body)
+    for point in response["pois"] if response_format == "polyline" else response["points"]:
+        details = point["poi_details"]
+        if details is not None and details["type"] is not None:
+            details["type"] = types.get(_spelled(details["type"]), details["type"])
+    return json.dumps(response)
+
+
+def normalize_route(route_details: RouteDetails, db: DB) -> Optional[RouteDetails]:
+    """
+    Normalizes route details into the key of the route cache, so that requests with the same itinerary
+    share it: the start and end are snapped to their nearest points, the POI types are spelled alike and the
+    budgets are rounded down to ROUTE_CACHE_TIME_STEP minutes and ROUTE_CACHE_DISTANCE_STEP kilometers. The
+    normalized details are only the key, paths are found for the details of the request.
+
+    Args:
+        route_details (RouteDetails): The route details.
+        db (DB): The database to snap the points with.
+
+    Returns:
+        Optional[RouteDetails]: The normalized route details, or None if they should not be cached, i.e. a
+        point cannot be snapped or the route has a time budget, whose path depends on the load.
+    """
+    if route_details.time_budget is not None:
+        return None
+    start = db.get_nearest_point(DBPoint(0, route_details.start.x, route_details.start.y))
+    end = db.get_nearest_point(DBPoint(0, route_details.end.x, route_details.end.y))
+    if start is None or end is None:
+        return None
+    return route_details.model_copy(
+        update={
+            "start": MapPoint(x=start.x, y=start.y),
+            "end": MapPoint(x=end.x, y=end.y),
+            "additional_time": _floor(route_details.additional_time, ROUTE_CACHE_TIME_STEP),
+            "additional_distance": _floor(route_details.additional_distance, ROUTE_CACHE_DISTANCE_STEP),
+            "pois": [
+                POI(type=_spelled(poi.type), visit_time=poi.visit_time) for poi in route_details.pois or []
+            ],
+        }
+    )
+
+
+class RouteCache:
+    """
+    Represents a cache of route responses, keyed by the normalized route details (see normalize_route), with
+    an LRU tier in memory and an optional tier on disk. Every entry holds the ETag and the JSON body of the
+    response, the additional distance (m) and time (s) of its path and the POI types of its request.
+
+    Attributes:
+        memory (LRUCache): The in-memory tier, bounded by the size of the responses in bytes.
+        disk (Optional[DiskCache]): The on-disk tier, or None.
+    """
+
+    def __init__(self, max_bytes: int, path: Optional[str] = None, max_disk_entries: int = 100000) -> None:
+        self.memory = LRUCache(max_size=max_bytes, weigh=lambda entry: len(entry[1]))
+        self.disk = DiskCache(path, max_disk_entries) if path else None
+
+    def get(self, key: str) -> Optional[tuple]:
+        """
+        Retrieves a response, from memory or else from disk.
+
+        Args:
+            key (str): The key of the response.
+
+        Returns:
+            Optional[tuple]: The entry of the response, or None if not cached.
+        """
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                entry = tuple(json.loads(value))
+                self.memory.put(key, entry)
+        return entry
+
+    def put(
+        self, key: str, body: str, additional_distance: float, additional_time: float, types: List[str]
+    ) -> tuple:
+        """
+        Stores a response in both tiers.
+
+        Args:
+            key (str): The key of the response.
+            body (str): The JSON body of the response.
+            additional_distance (float): The additional distance of its path in meters.
+            additional_time (float): The additional time of its path in seconds.
+            types (List[str]): The POI types of its request.
+
+        Returns:
+            tuple: The entry of the response.
+        """
+        entry = (_etag(body), body, additional_distance, additional_time, types)
+        self.memory.put(key, entry)
+        if self.disk is not None:
+            self.disk.put(key, json.dumps(entry))
+        return entry
+
+    def invalidate(self) -> None:
+        """
+        Drops all responses, e.g. after the OSM data was re-imported.
+        """
+        self.memory.invalidate()
+        if self.disk is not None:
+            self.disk.invalidate()
+
+    def solve(
+        self, route_details: RouteDetails, db: DB, scoring: str = "bound", response_format: str = "full"
+    ) -> Tuple[str, str]:
+        """
+        Finds the path for the route details like solve_route, unless a request with the same normalized
+        route details was answered before with a path that fits their budgets.
+
+        Args:
+            route_details (RouteDetails): The route details.
+            db (DB): The database to query.
+            scoring (str): How POI candidates are ranked, see PathFinder.
+            response_format (str): "full" or "polyline", see solve_route.
+
+        Returns:
+            Tuple[str, str]: The ETag and the JSON body of the response.
+        """
+        normalized = normalize_route(route_details, db)
+        if normalized is None:
+            body = json.dumps(solve_route(route_details, db, scoring, response_format))
+            return _etag(body), body
+        key = json.dumps([normalized.model_dump(), scoring, response_format], sort_keys=True)
+        types = [poi.type for poi in route_details.pois or []]
+        entry = self.get(key)
+        if entry is None or not _fits(entry, route_details):
+            finder = path_finder(route_details, db, scoring)
+            body = json.dumps(path_response(finder, route_details, response_format))
+            entry = self.put(key, body, finder.curr_additional_distance, finder.curr_additional_time, types)
+        etag, body, _, _, cached_types = entry
+        if cached_types != types:
+            body = _respelled(body, route_details.pois, response_format)
+            etag = _etag(body)
+        return etag, body
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Literal
 
 from pydantic import BaseModel, Field
 
@@ -25,6 +25,20 @@ class RouteDetails(BaseModel):
     additional_time: float | None = Field(description="Additional time for POIs", default=None)
     additional_distance: float | None = Field(description="Additional distance for POIs", default=None)
     pois: List[POI] | None = Field(description="List of POIs", default=None)
+    strategy: Literal["greedy", "beam"] = Field(description="How POIs are chosen", default="greedy")
+    time_budget: float | None = Field(description="Seconds after which no more POIs are tried", default=None)
+    candidates: Literal["annulus", "isochrone"] = Field(
+        description="How POI candidates are found: by straight-line distance or by network reachability",
+        default="annulus",
+    )
+    tolerance: float | None = Field(
+        description="Meters the returned points may be off the path, simplified with Douglas-Peucker if set",
+        default=None,
+    )
+    zoom: float | None = Field(
+        description="Map zoom level the returned points are simplified for, if no tolerance is given",
+        default=None,
+    )
 
 
 class PathPoint(BaseModel):
@@ -45,8 +59,113 @@ class Path(BaseModel):
     path_distance: str = Field(description="Distance of the path")
     additional_distance: str = Field(description="Additional distance")
     additional_time: str = Field(description="Additional time")
+    searches_avoided: int = Field(description="Searches avoided by pruning POI candidates", default=0)
+
+class PathPOI(BaseModel):
+    """Point of interest on a compact path"""
+
+    index: int = Field(description="Index of the point in the decoded points")
+    poi_details: POI = Field(description="Details of the POI")
+    dist_from_start: str = Field(description="Distance from start")
+    time_from_start: str = Field(description="Time from start")
+
+class CompactPath(BaseModel):
+    """Response path with the points encoded as polylines"""
+
+    shortest_points: str = Field(description="Encoded polyline of the shortest path")
+    points: str = Field(description="Encoded polyline of the path")
+    pois: List[PathPOI] = Field(description="List of POIs on the path")
+    precision: int = Field(description="Number of decimal places kept by the polylines")
+    path_time: str = Field(description="Time of the path")
+    path_distance: str = Field(description="Distance of the path")
+    additional_distance: str = Field(description="Additional distance")
+    additional_time: str = Field(description="Additional time")
+    searches_avoided: int = Field(description="Searches avoided by pruning POI candidates", default=0)
+
+# "full" returns Path, "polyline" returns CompactPath
+ResponseFormat = Literal["full", "polyline"]
+
+class RouteChunk(BaseModel):
+    """Chunk of a streamed path"""
+
+    type: str = Field(description="Type of chunk: shortest, poi, end or error")
+    shortest_points: List[PathPoint] | str | None = Field(
+        description="Points of the shortest path", default=None
+    )
+    points: List[PathPoint] | str | None = Field(
+        description="Points of the path added by the chunk", default=None
+    )
+    pois: List[PathPOI] | None = Field(description="POIs on the points of a compact chunk", default=None)
+    precision: int | None = Field(description="Number of decimal places kept by the polylines", default=None)
+    path_time: str | None = Field(description="Time of the path", default=None)
+    path_distance: str | None = Field(description="Distance of the path", default=None)
+    additional_distance: str | None = Field(description="Additional distance", default=None)
+    additional_time: str | None = Field(description="Additional time", default=None)
+    searches_avoided: int | None = Field(description="Searches avoided by pruning candidates", default=None)
+    error: str | None = Field(description="Error raised while solving the route", default=None)
+
+class BatchRouteDetails(BaseModel):
+    """Routes to solve in one batch"""
+
+    routes: List[RouteDetails] = Field(description="List of routes")
+
+
+class BatchPathResult(BaseModel):
+    """Result of one route of a batch"""
+
+    path: Path | None = Field(description="Path found for the route", default=None)
+    error: str | None = Field(description="Error raised while solving the route", default=None)
+
+
+class BatchPaths(BaseModel):
+    """Response paths of a batch"""
+
+    results: List[BatchPathResult] = Field(description="Results in the order of the routes")
+    elapsed: float = Field(description="Time taken to solve the batch in seconds")
+    routes_per_second: float = Field(description="Throughput of the batch")
+
+class SessionPath(BaseModel):
+    """Response path of a routing session"""
+
+    route_id: str = Field(description="ID of the session, to re-route it with changed POIs or budgets")
+    reused_pois: int = Field(description="Number of POIs of the path kept from the previous route")
+    path: Path | CompactPath
+
+class IsochroneDetails(BaseModel):
+    """Isochrone details"""
+
+    point: MapPoint
+    time: float = Field(description="Time budget in minutes")
+    distance: float | None = Field(description="Distance budget in kilometers", default=None)
+
+
+class IsochronePoint(BaseModel):
+    """Road vertex reachable within the budget"""
+
+    map_point: MapPoint
+    dist_from_start: str = Field(description="Network distance from the point")
+    time_from_start: str = Field(description="Time from the point")
+
+
+class Isochrone(BaseModel):
+    """Response isochrone with the reachable road vertices"""
+
+    points: List[IsochronePoint] = Field(description="Reachable road vertices, nearest first")
+    max_distance: str = Field(description="Network distance budget of the isochrone")
 
 class AmenitiesList(BaseModel):
     """List of amenities"""
 
     amenities: List[str] = Field(description="List of possible amenities")
+
+class CacheStats(BaseModel):
+    """Statistics of a cache"""
+
+    entries: int = Field(description="Number of cached entries")
+    size: int = Field(description="Approximate size of the cached entries in bytes")
+    max_size: int = Field(description="Maximum size of the cached entries in bytes")
+    hits: int = Field(description="Number of lookups served from the cache")
+    misses: int = Field(description="Number of lookups not served from the cache")
+    hit_ratio: float = Field(description="Fraction of lookups served from the cache")
+    evictions: int = Field(description="Number of entries evicted to stay within the size limit")
+    invalidations: int = Field(description="Number of times the cache was invalidated")
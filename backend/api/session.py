@@ -0,0 +1,146 @@
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from backend.api.schemas import RouteDetails
+from backend.api.solver import path_finder, path_response
+from backend.cache import LRUCache
+from backend.constants import (
+    SESSION_MAX_CANDIDATE_SETS,
+    SESSION_MAX_COUNT,
+    SESSION_TTL,
+)
+from backend.db import DB, DBPoint, PointArray
+
+
+class RouteSession:
+    """
+    Represents what is kept of a solved route to re-route it when its POIs or budgets change.
+
+    Attributes:
+        details (RouteDetails): The route details of the last route.
+        scoring (str): How POI candidates were ranked.
+        prepared (tuple): The snapped start and end and the shortest path between them, see PathFinder.
+        history (List[dict]): Snapshots of the path with 0, 1, ... POIs, see PathFinder.
+        candidate_cache (Dict[tuple, tuple]): The ranked candidates of every step, see PathFinder.
+    """
+
+    __slots__ = ("details", "scoring", "prepared", "history", "candidate_cache")
+
+    def __init__(
+        self,
+        details: RouteDetails,
+        scoring: str,
+        prepared: Tuple[DBPoint, DBPoint, PointArray, float],
+        history: List[dict],
+        candidate_cache: Dict[tuple, tuple],
+    ) -> None:
+        self.details = details
+        self.scoring = scoring
+        self.prepared = prepared
+        self.history = history
+        self.candidate_cache = candidate_cache
+
+    def reusable_steps(self, details: RouteDetails, scoring: str) -> Optional[int]:
+        """
+        Finds how much of the session can be reused for new route details.
+
+        Args:
+            details (RouteDetails): The new route details.
+            scoring (str): How POI candidates are ranked.
+
+        Returns:
+            Optional[int]: The number of POIs of the last path that are kept, or None if nothing can be
+            reused, i.e. the start, end, strategy, candidates or scoring changed.
+        """
+        changed = lambda names: any(getattr(details, name) != getattr(self.details, name) for name in names)
+        if scoring != self.scoring or changed(("start", "end", "strategy", "candidates")):
+            return None
+        # the greedy path up to a POI only depends on the POIs before it and the budgets
+        if details.strategy != "greedy" or changed(("additional_time", "additional_distance")):
+            return 0
+        shared = 0
+        for old, new in zip(self.details.pois or [], details.pois or []):
+            if old != new:
+                break
+            shared += 1
+        return min(shared, len(self.history) - 1)
+
+
+class SessionStore:
+    """
+    Represents the routing sessions, bounded in number with LRU eviction and expiring SESSION_TTL seconds
+    after their last route.
+
+    Attributes:
+        sessions (LRUCache): The sessions by route ID.
+    """
+
+    def __init__(self, max_count: int = SESSION_MAX_COUNT, ttl: Optional[float] = SESSION_TTL) -> None:
+        self.sessions = LRUCache(max_size=max_count, ttl=ttl)
+
+    def solve(
+        self,
+        route_details: RouteDetails,
+        db: DB,
+        route_id: Optional[str] = None,
+        scoring: str = "bound",
+        response_format: str = "full",
+    ) -> Optional[dict]:
+        """
+        Finds the path for the route details, reusing what the session of the route ID kept.
+
+        The snapped start and end and the shortest path are reused if they did not change. With the greedy
+        strategy and the same budgets, the path is also kept up to the first POI that changed and only the
+        POIs after it are searched again. Candidates already ranked for the same POIs and budgets are not
+        searched again, and legs already solved are in the leg cache.
+
+        Args:
+            route_details (RouteDetails): The route details.
+            db (DB): The database to query.
+            route_id (Optional[str]): The ID of the session to re-route, a new session is started if None.
+            scoring (str): How POI candidates are ranked, see PathFinder.
+            response_format (str): "full" or "polyline", see solve_route.
+
+        Returns:
+            Optional[dict]: The dumped SessionPath response, or None if there is no session with the ID.
+        """
+        session = None
+        if route_id is not None:
+            session = self.sessions.get(route_id)
+            if session is None:
+                return None
+        else:
+            route_id = uuid.uuid4().hex
+        steps = session.reusable_steps(route_details, scoring) if session is not None else None
+        # the candidates ranked for another start, end or scoring are of no use
+        kwargs = {"candidate_cache": {}}
+        if steps is not None:
+            # bounded, the oldest candidates are mostly for POIs or budgets that were changed since
+            if len(session.candidate_cache) > SESSION_MAX_CANDIDATE_SETS:
+                session.candidate_cache.clear()
+            kwargs = {"prepared": session.prepared, "candidate_cache": session.candidate_cache}
+            if steps > 0:
+                kwargs["resume"] = session.history[: steps + 1]
+        finder = path_finder(route_details, db, scoring, **kwargs)
+        self.sessions.put(
+            route_id,
+            RouteSession(route_details, scoring, finder.prepared, finder.history, finder.candidate_cache),
+        )
+        print(f"Session | Route {route_id} reused {steps or 0} POIs")
+        return {
+            "route_id": route_id,
+            "reused_pois": steps or 0,
+            "path": path_response(finder, route_details, response_format),
+        }
+
+    def delete(self, route_id: str) -> bool:
+        """
+        Ends a session.
+
+        Args:
+            route_id (str): The ID of the session.
+
+        Returns:
+            bool: True if there was a session with the ID.
+        """
+        return self.sessions.pop(route_id)
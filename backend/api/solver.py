@@ -0,0 +1,287 @@
+from typing import Callable, Optional
+
+import numpy as np
+
+from backend.api.schemas import (
+    POI,
+    CompactPath,
+    Isochrone,
+    IsochroneDetails,
+    MapPoint,
+    Path,
+    RouteDetails,
+)
+from backend.constants import POLYLINE_PRECISION, VELOCITY
+from backend.db import DB, DBPoint, PointArray
+from backend.metrics import span
+from backend.path import encode_polyline, simplify, zoom_tolerance
+from backend.pathfinder import PathFinder
+
+
+def _path_point(x: float, y: float, poi: Optional[tuple] = None) -> dict:
+    """
+    Builds a PathPoint of the response.
+
+    Args:
+        x (float): The x-coordinate of the point.
+        y (float): The y-coordinate of the point.
+        poi (Optional[tuple]): The POI at the point, as stored in PathFinder.curr_pois.
+
+    Returns:
+        dict: The PathPoint fields.
+    """
+    is_poi = poi is not None
+    return {
+        "map_point": MapPoint(x=x, y=y),
+        "is_poi": is_poi,
+        "poi_details": POI(
+            type=poi[2] if is_poi else None,
+            visit_time=poi[1] if is_poi else None,
+        ).model_dump(),
+        "dist_from_start": f"{poi[3] / 1000:.1f}" if is_poi else None,
+        "time_from_start": f"{poi[4] / 60:.1f}" if is_poi else None,
+    }
+
+
+def _path_points(path: PointArray, pois: list) -> list:
+    """
+    Builds the PathPoints of a path, marking the given POIs on it in order.
+
+    Args:
+        path (PointArray): The points of the path.
+        pois (list): The POIs on the path, as stored in PathFinder.curr_pois.
+
+    Returns:
+        list: The PathPoints.
+    """
+    pois = list(pois)
+    pois_ids = set([poi[0].id for poi in pois])
+    points = []
+    for id, x, y in zip(path.ids.tolist(), path.x.tolist(), path.y.tolist()):
+        is_poi = id in pois_ids
+        points.append(_path_point(x, y, pois[0] if is_poi else None))
+        if is_poi:
+            pois.pop(0)
+    return points
+
+
+def _path_pois(path: PointArray, pois: list) -> list:
+    """
+    Builds the PathPOIs of a compact path, pointing at the given POIs on it in order.
+
+    Args:
+        path (PointArray): The points of the path.
+        pois (list): The POIs on the path, as stored in PathFinder.curr_pois.
+
+    Returns:
+        list: The PathPOIs.
+    """
+    path_pois = []
+    start = 0
+    for poi in pois:
+        matches = np.flatnonzero(path.ids[start:] == poi[0].id)
+        if not len(matches):
+            continue
+        index = start + int(matches[0])
+        start = index + 1
+        path_pois.append(
+            {
+                "index": index,
+                "poi_details": POI(type=poi[2], visit_time=poi[1]).model_dump(),
+                "dist_from_start": f"{poi[3] / 1000:.1f}",
+                "time_from_start": f"{poi[4] / 60:.1f}",
+            }
+        )
+    return path_pois
+
+
+def _tolerance(route_details: RouteDetails) -> Optional[float]:
+    # the tolerance in meters, or one pixel at the zoom level
+    if route_details.tolerance is not None or route_details.zoom is None:
+        return route_details.tolerance
+    return zoom_tolerance(route_details.zoom, (route_details.start.y + route_details.end.y) / 2)
+
+
+def _simplified(path: PointArray, pois: list, tolerance: Optional[float]) -> PointArray:
+    """
+    Simplifies the points of a path for the response, keeping its POIs and end points.
+
+    Args:
+        path (PointArray): The points of the path.
+        pois (list): The POIs on the path, as stored in PathFinder.curr_pois.
+        tolerance (Optional[float]): The tolerance in meters, the path is returned as is if None.
+
+    Returns:
+        PointArray: The simplified path.
+    """
+    if tolerance is None or len(path) < 3:
+        return path
+    keep = np.isin(path.ids, [poi[0].id for poi in pois])
+    return path[simplify(path.x, path.y, tolerance, keep)]
+
+
+def _totals(finder: PathFinder) -> dict:
+    return {
+        "path_time": f"{finder.curr_time / 60:.1f}",
+        "path_distance": f"{finder.curr_cost / 1000:.1f}",
+        "additional_distance": f"{finder.curr_additional_distance / 1000:.1f}",
+        "additional_time": f"{finder.curr_additional_time / 60:.1f}",
+        "searches_avoided": finder.searches_avoided,
+    }
+
+
+def path_finder(
+    route_details: RouteDetails, db: DB, scoring: str, listener: Optional[Callable] = None, **kwargs
+) -> PathFinder:
+    return PathFinder(
+        start=route_details.start,
+        end=route_details.end,
+        max_time=route_details.additional_time,
+        max_distance=route_details.additional_distance,
+        max_num_pois=len(route_details.pois),
+        pois_order=route_details.pois,
+        db=db,
+        scoring=scoring,
+        listener=listener,
+        strategy=route_details.strategy,
+        time_budget=route_details.time_budget,
+        candidates=route_details.candidates,
+        **kwargs,
+    )
+
+
+def solve_route(
+    route_details: RouteDetails, db: DB, scoring: str = "bound", response_format: str = "full"
+) -> dict:
+    """
+    Finds the path for the route details and builds the response.
+
+    With a tolerance or zoom in the route details, the points of the paths are simplified, keeping the POIs
+    and the end points.
+
+    Args:
+        route_details (RouteDetails): The route details.
+        db (DB): The database to query.
+        scoring (str): How POI candidates are ranked, see PathFinder.
+        response_format (str): "full" for a Path response, "polyline" for a CompactPath response.
+
+    Returns:
+        dict: The dumped Path or CompactPath response.
+    """
+    finder = path_finder(route_details, db, scoring)
+    return path_response(finder, route_details, response_format)
+
+
+def path_response(finder: PathFinder, route_details: RouteDetails, response_format: str = "full") -> dict:
+    """
+    Builds the response of the path found by a PathFinder.
+
+    Args:
+        finder (PathFinder): The PathFinder that found the path.
+        route_details (RouteDetails): The route details it was found for.
+        response_format (str): "full" or "polyline", see solve_route.
+
+    Returns:
+        dict: The dumped Path or CompactPath response.
+    """
+    with span("response_building"):
+        tolerance = _tolerance(route_details)
+        shortest_path = _simplified(finder.shortest_path, [], tolerance)
+        path = _simplified(finder.curr_path.points, finder.curr_pois, tolerance)
+        if response_format == "polyline":
+            return CompactPath(
+                shortest_points=encode_polyline(shortest_path.x, shortest_path.y),
+                points=encode_polyline(path.x, path.y),
+                pois=_path_pois(path, finder.curr_pois),
+                precision=POLYLINE_PRECISION,
+                **_totals(finder),
+            ).model_dump()
+        return Path(
+            shortest_points=_path_points(shortest_path, []),
+            points=_path_points(path, finder.curr_pois),
+            **_totals(finder),
+        ).model_dump()
+
+
+def stream_route(
+    route_details: RouteDetails,
+    db: DB,
+    send: Callable[[dict], None],
+    scoring: str = "bound",
+    response_format: str = "full",
+) -> None:
+    """
+    Finds the path for the route details and sends the response in chunks as the path is built.
+
+    The chunks are, in order: "shortest" with the shortest_points, one "poi" chunk with the points of the
+    leg ending at every accepted POI and "end" with the points of the last leg and the totals of the path.
+    The points of the "poi" and "end" chunks together are the points of the Path response. With the
+    "polyline" format the points of every chunk are an encoded polyline and POIs are listed in "pois".
+    With a tolerance or zoom every chunk is simplified on its own, keeping its end points.
+
+    Args:
+        route_details (RouteDetails): The route details.
+        db (DB): The database to query.
+        send (Callable[[dict], None]): Called with every chunk.
+        scoring (str): How POI candidates are ranked, see PathFinder.
+        response_format (str): "full" or "polyline", see solve_route.
+    """
+    last_leg = []
+    tolerance = _tolerance(route_details)
+
+    def points(leg: PointArray, pois: list) -> dict:
+        with span("response_building"):
+            leg = _simplified(leg, pois, tolerance)
+            if response_format == "polyline":
+                return {
+                    "points": encode_polyline(leg.x, leg.y),
+                    "pois": _path_pois(leg, pois),
+                    "precision": POLYLINE_PRECISION,
+                }
+            return {"points": _path_points(leg, pois)}
+
+    def listener(event: str, leg: PointArray, poi: Optional[tuple]) -> None:
+        if event == "shortest":
+            chunk = points(leg, [])
+            chunk.pop("pois", None)
+            send({"type": event, "shortest_points": chunk.pop("points"), **chunk})
+        elif event == "poi":
+            send({"type": event, **points(leg, [poi])})
+        else:
+            # sent below, once the totals are known
+            last_leg.append(leg)
+
+    finder = path_finder(route_details, db, scoring, listener)
+    send({"type": "end", **points(last_leg[0], []), **_totals(finder)})
+
+
+def solve_isochrone(details: IsochroneDetails, db: DB) -> dict:
+    """
+    Finds the road vertices reachable from a point within a time and distance budget.
+
+    Args:
+        details (IsochroneDetails): The point and the budgets.
+        db (DB): The database to query.
+
+    Returns:
+        dict: The dumped Isochrone response.
+    """
+    max_distance = VELOCITY * details.time * 60  # to meters
+    if details.distance is not None:
+        max_distance = min(max_distance, details.distance * 1000)
+    point = db.get_nearest_point(DBPoint(0, details.point.x, details.point.y))
+    vertices, costs = PointArray([], [], []), np.empty(0)
+    if point is not None:
+        vertices, costs = db.reachable_within(point, max_distance)
+    with span("response_building"):
+        return Isochrone(
+            points=[
+                {
+                    "map_point": MapPoint(x=x, y=y),
+                    "dist_from_start": f"{cost / 1000:.1f}",
+                    "time_from_start": f"{cost / VELOCITY / 60:.1f}",
+                }
+                for x, y, cost in zip(vertices.x.tolist(), vertices.y.tolist(), np.asarray(costs).tolist())
+            ],
+            max_distance=f"{max_distance / 1000:.1f}",
+        ).model_dump()
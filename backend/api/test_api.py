@@ -26,6 +26,14 @@ class TestApi(TestCase):
             self.assertIsInstance(amenity, str)
             self.assertIsNotNone(amenity)
 
+    def test_leg_cache(self):
+        response = client.delete("/cache/legs/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["entries"], 0)
+        response = client.get("/cache/legs/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("hits", response.json())
+
     def test_create_route(self):
         test_route_details = {
             "start": {"latitude": 0.0, "longitude": 0.0},
@@ -0,0 +1,137 @@
+import contextvars
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+import pytest
+
+from backend.api.batch import create_pool, solve_routes
+from backend.api.route_cache import RouteCache
+from backend.api.schemas import IsochroneDetails, RouteChunk, RouteDetails
+from backend.api.session import SessionStore
+from backend.api.solver import solve_isochrone, solve_route, stream_route
+from backend.db import leg_cache
+from backend.metrics import histograms, server_timing, start_request
+from backend.pathfinder import PathFinder
+from backend.storage import LocalDB
+
+ROUTE = {
+    "start": {"x": 21.005, "y": 52.205},
+    "end": {"x": 21.05, "y": 52.25},
+    "additional_time": 30,
+    "additional_distance": 8,
+    "pois": [{"type": "cafe", "visit_time": 1}, {"type": "bar", "visit_time": 1}],
+}
+
+
+@pytest.mark.health
+class TestSolver(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        leg_cache.invalidate()
+        cls.db = LocalDB.synthetic()
+
+    def test_strategies(self):
+        for strategy in ["greedy", "beam"]:
+            path = solve_route(RouteDetails(**ROUTE, strategy=strategy), self.db)
+            self.assertEqual(sum(point["is_poi"] for point in path["points"]), 2)
+            self.assertLessEqual(float(path["additional_distance"]), ROUTE["additional_distance"])
+
+    def test_stream_matches_path(self):
+        chunks = []
+        send = lambda chunk: chunks.append(RouteChunk(**chunk).model_dump())
+        stream_route(RouteDetails(**ROUTE), self.db, send)
+        path = solve_route(RouteDetails(**ROUTE), self.db)
+        self.assertEqual([chunk["type"] for chunk in chunks], ["shortest", "poi", "poi", "end"])
+        self.assertEqual(chunks[0]["shortest_points"], path["shortest_points"])
+        self.assertEqual([point for chunk in chunks[1:] for point in chunk["points"]], path["points"])
+        self.assertEqual(chunks[-1]["path_distance"], path["path_distance"])
+
+    def test_simplification(self):
+        path = solve_route(RouteDetails(**ROUTE), self.db)
+        simplified = solve_route(RouteDetails(**ROUTE, tolerance=50), self.db)
+        self.assertLess(len(simplified["points"]), len(path["points"]))
+        self.assertEqual(simplified["points"][0], path["points"][0])
+        self.assertEqual(simplified["points"][-1], path["points"][-1])
+        pois = lambda points: [point for point in points if point["is_poi"]]
+        self.assertEqual(pois(simplified["points"]), pois(path["points"]))
+        self.assertEqual(simplified["path_distance"], path["path_distance"])
+
+    def test_lower_bounds(self):
+        details = RouteDetails(**ROUTE)
+        finder = PathFinder(details.start, details.end, 30, 8, 1, details.pois[:1], db=self.db)
+        finder.restore(finder.history[0])
+        candidates = self.db.get_valid_points(finder.curr_path[-1], 1e6, 1e6, 0, "cafe")
+        for candidate, bound in zip(candidates, finder.lower_bounds(candidates)):
+            _, cost_prev = self.db.find_shortest_path_between(finder.curr_path[-1], candidate)
+            _, cost_next = self.db.find_shortest_path_between(candidate, finder.end)
+            self.assertLessEqual(
+                bound, finder.curr_cost + cost_prev + cost_next - finder.shortest_cost + 1e-6
+            )
+
+    def test_isochrone(self):
+        path = solve_route(RouteDetails(**ROUTE, candidates="isochrone"), self.db)
+        self.assertEqual(sum(point["is_poi"] for point in path["points"]), 2)
+        self.assertLessEqual(float(path["additional_distance"]), ROUTE["additional_distance"])
+        isochrone = solve_isochrone(IsochroneDetails(point=ROUTE["start"], time=5, distance=2), self.db)
+        distances = [float(point["dist_from_start"]) for point in isochrone["points"]]
+        self.assertGreater(len(distances), 1)
+        self.assertEqual(distances, sorted(distances))
+        self.assertLessEqual(distances[-1], 2)
+
+    def test_route_cache(self):
+        nearby = {**ROUTE, "start": {"x": 21.00501, "y": 52.20499}, "additional_time": 30.4}
+        with tempfile.TemporaryDirectory() as directory:
+            cache = RouteCache(max_bytes=1 << 20, path=os.path.join(directory, "routes.sqlite"))
+            etag, body = cache.solve(RouteDetails(**ROUTE), self.db)
+            self.assertEqual(cache.solve(RouteDetails(**nearby), self.db), (etag, body))
+            self.assertEqual((cache.memory.hits, cache.memory.misses), (1, 1))
+            respelled = {**ROUTE, "pois": [{"type": "Cafe", "visit_time": 1}, ROUTE["pois"][1]]}
+            _, respelled_body = cache.solve(RouteDetails(**respelled), self.db)
+            self.assertEqual((cache.memory.hits, cache.memory.misses), (2, 1))
+            types = [point["poi_details"]["type"] for point in json.loads(respelled_body)["points"]]
+            self.assertEqual([type for type in types if type is not None], ["Cafe", "bar"])
+            restarted = RouteCache(max_bytes=1 << 20, path=os.path.join(directory, "routes.sqlite"))
+            self.assertEqual(restarted.solve(RouteDetails(**ROUTE), self.db), (etag, body))
+            compact_etag, _ = restarted.solve(RouteDetails(**ROUTE), self.db, response_format="polyline")
+            self.assertNotEqual(compact_etag, etag)
+
+    def test_session(self):
+        sessions = SessionStore()
+        first = sessions.solve(RouteDetails(**ROUTE), self.db)
+        self.assertEqual(first["path"], solve_route(RouteDetails(**ROUTE), self.db))
+        changed = {**ROUTE, "pois": [ROUTE["pois"][0], {"type": "pharmacy", "visit_time": 1}]}
+        second = sessions.solve(RouteDetails(**changed), self.db, first["route_id"])
+        self.assertEqual(second["reused_pois"], 1)
+        self.assertEqual(second["path"], solve_route(RouteDetails(**changed), self.db))
+        longer = {**changed, "additional_distance": 9}
+        third = sessions.solve(RouteDetails(**longer), self.db, first["route_id"])
+        self.assertEqual(third["reused_pois"], 0)
+        self.assertEqual(third["path"], solve_route(RouteDetails(**longer), self.db))
+        self.assertTrue(sessions.delete(first["route_id"]))
+        self.assertIsNone(sessions.solve(RouteDetails(**ROUTE), self.db, first["route_id"]))
+
+    def test_batch(self):
+        pool = create_pool(self.db, workers=2)
+        try:
+            batch = solve_routes([RouteDetails(**ROUTE)] * 3, pool)
+        finally:
+            pool.shutdown()
+        path = solve_route(RouteDetails(**ROUTE), self.db)
+        self.assertEqual([result["path"] for result in batch["results"]], [path] * 3)
+
+    def test_timings(self):
+        def solve():
+            timings = start_request()
+            solve_route(RouteDetails(**ROUTE), self.db, response_format="polyline")
+            return timings
+
+        leg_cache.invalidate()
+        timings = contextvars.copy_context().run(solve)
+        for stage in ["snapping", "source_target_lookup", "dijkstra_expand", "valid_points_radius"]:
+            self.assertGreater(timings[stage][1], 0)
+        self.assertEqual(timings["response_building"][1], 1)
+        self.assertIn("candidate_scoring;dur=", server_timing(timings))
+        metrics = histograms.render()
+        self.assertIn('stage_duration_seconds_bucket{stage="snapping",le="+Inf"}', metrics)
@@ -0,0 +1,190 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Represents a thread-safe, size-bounded LRU cache with an optional time to live.
+
+    Attributes:
+        max_size (int): The maximum total size of the entries, as measured by `weigh`.
+        ttl (Optional[float]): Number of seconds after which an entry expires, or None if entries never expire.
+        hits (int): Number of lookups that found a live entry.
+        misses (int): Number of lookups that did not find a live entry.
+        evictions (int): Number of entries evicted to stay within `max_size`.
+        invalidations (int): Number of times the whole cache was invalidated.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: Optional[float] = None,
+        weigh: Callable[[Any], int] = lambda value: 1,
+    ) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._weigh = weigh
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Retrieves a live entry and marks it as the most recently used.
+
+        Args:
+            key (Hashable): The key of the entry.
+
+        Returns:
+            Optional[Any]: The cached value, or None if there is no live entry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Stores an entry, evicting the least recently used ones if the cache grows beyond `max_size`.
+
+        Args:
+            key (Hashable): The key of the entry.
+            value (Any): The value to cache.
+        """
+        size = self._weigh(value)
+        if size > self.max_size:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires_at)
+            self._size += size
+            while self._size > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> bool:
+        """
+        Drops an entry.
+
+        Args:
+            key (Hashable): The key of the entry.
+
+        Returns:
+            bool: True if there was an entry with the key.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def invalidate(self) -> None:
+        """
+        Drops all entries, e.g. after the OSM data was re-imported.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: The number of entries, their total size, and the hit, miss, eviction and invalidation
+            counters.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size": self._size,
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._size -= size
+
+
+class DiskCache:
+    """
+    Represents a thread-safe string cache in an SQLite file, which survives restarts. The oldest entries are
+    dropped once it holds more than `max_entries`.
+
+    Attributes:
+        path (str): The path of the SQLite file.
+        max_entries (int): The maximum number of entries.
+    """
+
+    def __init__(self, path: str, max_entries: int) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT)")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Retrieves an entry.
+
+        Args:
+            key (str): The key of the entry.
+
+        Returns:
+            Optional[str]: The cached value, or None if there is no entry.
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def put(self, key: str, value: str) -> None:
+        """
+        Stores an entry, dropping the oldest ones if the cache grows beyond `max_entries`.
+
+        Args:
+            key (str): The key of the entry.
+            value (str): The value to cache.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)", (key, value))
+            self._connection.execute(
+                "DELETE FROM cache WHERE rowid <= (SELECT MAX(rowid) FROM cache) - ?", (self.max_entries,)
+            )
+
+    def invalidate(self) -> None:
+        """
+        Drops all entries.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM cache")
@@ -0,0 +1,481 @@
+import argparse
+import heapq
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backend.graph import RoadGraph, connected_components
+
+CH_FORMAT_VERSION = 2
+WITNESS_SETTLE_LIMIT = 500
+
+
+class ContractionHierarchy:
+    """
+    Represents a contraction hierarchy built over the road graph.
+
+    Every vertex gets a rank, and the hierarchy keeps only the edges (original road segments and
+    shortcuts) leading from a vertex to a higher-ranked one. A shortest path query is then a bidirectional
+    Dijkstra that only goes upwards, which settles a tiny fraction of the graph. The hierarchy answers
+    queries with the same interface and results as RoadGraph.shortest_path.
+
+    Attributes:
+        vertex_ids (np.ndarray): Sorted pgRouting ids of the vertices.
+        x (np.ndarray): Longitudes (EPSG:4326) of the vertices.
+        y (np.ndarray): Latitudes (EPSG:4326) of the vertices.
+        rank (np.ndarray): Contraction order of the vertices.
+        indptr (np.ndarray): Offsets of every vertex's upward edges.
+        indices (np.ndarray): Dense indices of the higher-ranked endpoints of the upward edges.
+        weights (np.ndarray): Costs of the upward edges.
+        edge_ids (np.ndarray): osm_id of the road segment, or -1 for a shortcut.
+        middles (np.ndarray): Dense index of the vertex bypassed by a shortcut, or -1 for a road segment.
+        components (np.ndarray): Connected component label of every vertex. Every road segment is kept as
+            an upward edge or a shortcut between the same vertices, so the upward edges connect the same
+            components as the road graph.
+        method (str): Name of the routing method, always "ch".
+    """
+
+    method = "ch"
+
+    def __init__(
+        self,
+        vertex_ids: np.ndarray,
+        x: np.ndarray,
+        y: np.ndarray,
+        rank: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        weights: np.ndarray,
+        edge_ids: np.ndarray,
+        middles: np.ndarray,
+        components: Optional[np.ndarray] = None,
+    ) -> None:
+        self.vertex_ids = vertex_ids
+        self.x = x
+        self.y = y
+        self.rank = rank
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.edge_ids = edge_ids
+        self.middles = middles
+        self.components = components if components is not None else connected_components(indptr, indices)
+        self._overlay = None
+
+    @classmethod
+    def build(cls, graph: RoadGraph) -> "ContractionHierarchy":
+        """
+        Contracts the road graph vertex by vertex, ordered by the edge difference heuristic.
+
+        Args:
+            graph (RoadGraph): The road graph to preprocess.
+
+        Returns:
+            ContractionHierarchy: The built hierarchy.
+        """
+        n = len(graph)
+        # adjacency of the not yet contracted part of the graph: neighbour -> (cost, osm_id, middle)
+        adj: List[Dict[int, Tuple[float, int, int]]] = [{} for _ in range(n)]
+        for u in range(n):
+            lo, hi = int(graph.indptr[u]), int(graph.indptr[u + 1])
+            for v, w, edge in zip(
+                graph.indices[lo:hi].tolist(), graph.weights[lo:hi].tolist(), graph.edge_ids[lo:hi].tolist()
+            ):
+                if v != u and (v not in adj[u] or w < adj[u][v][0]):
+                    adj[u][v] = (w, edge, -1)
+
+        contracted_neighbours = [0] * n
+        heap = [(cls._priority(adj, v, contracted_neighbours), v) for v in range(n)]
+        heapq.heapify(heap)
+
+        rank = np.zeros(n, dtype=np.int32)
+        upward: List[List[Tuple[int, float, int, int]]] = [[] for _ in range(n)]
+        next_rank = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            priority = cls._priority(adj, v, contracted_neighbours)
+            if heap and priority > heap[0][0]:
+                heapq.heappush(heap, (priority, v))
+                continue
+
+            for u, x, cost in cls._shortcuts(adj, v):
+                if x not in adj[u] or cost < adj[u][x][0]:
+                    adj[u][x] = (cost, -1, v)
+                    adj[x][u] = (cost, -1, v)
+            for u, (w, edge, middle) in adj[v].items():
+                upward[v].append((u, w, edge, middle))
+                del adj[u][v]
+                contracted_neighbours[u] += 1
+            adj[v] = {}
+            rank[v] = next_rank
+            next_rank += 1
+            if next_rank % 10000 == 0:
+                print(f"CH | Contracted {next_rank}/{n} vertices")
+
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum([len(edges) for edges in upward], out=indptr[1:])
+        flat = [edge for edges in upward for edge in edges]
+        return cls(
+            graph.vertex_ids,
+            graph.x,
+            graph.y,
+            rank,
+            indptr,
+            np.array([edge[0] for edge in flat], dtype=np.int32),
+            np.array([edge[1] for edge in flat], dtype=np.float64),
+            np.array([edge[2] for edge in flat], dtype=np.int64),
+            np.array([edge[3] for edge in flat], dtype=np.int32),
+        )
+
+    @staticmethod
+    def _shortcuts(adj: List[dict], v: int) -> List[Tuple[int, int, float]]:
+        """
+        Finds the shortcuts needed to preserve shortest paths when `v` is contracted.
+
+        Args:
+            adj (List[dict]): Adjacency of the not yet contracted part of the graph.
+            v (int): The vertex to contract.
+
+        Returns:
+            List[Tuple[int, int, float]]: The (u, x, cost) shortcuts between neighbours of `v`.
+        """
+        neighbours = list(adj[v].items())
+        shortcuts = []
+        for i, (u, (w_u, _, _)) in enumerate(neighbours[:-1]):
+            others = neighbours[i + 1 :]
+            max_cost = w_u + max(w_x for _, (w_x, _, _) in others)
+            dist = ContractionHierarchy._witness_search(adj, u, v, max_cost, {x for x, _ in others})
+            for x, (w_x, _, _) in others:
+                if dist.get(x, float("inf")) > w_u + w_x:
+                    shortcuts.append((u, x, w_u + w_x))
+        return shortcuts
+
+    @staticmethod
+    def _witness_search(adj: List[dict], source: int, excluded: int, max_cost: float, targets: set) -> dict:
+        """
+        Runs a bounded Dijkstra from `source` that avoids `excluded`.
+
+        Args:
+            adj (List[dict]): Adjacency of the not yet contracted part of the graph.
+            source (int): The source vertex.
+            excluded (int): The vertex being contracted.
+            max_cost (float): The cost above which the search stops.
+            targets (set): The vertices whose distances are needed.
+
+        Returns:
+            dict: Distances of the reached vertices.
+        """
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        remaining = set(targets)
+        settled = 0
+        while heap and remaining and settled < WITNESS_SETTLE_LIMIT:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            if d > max_cost:
+                break
+            remaining.discard(u)
+            settled += 1
+            for x, (w, _, _) in adj[u].items():
+                nd = d + w
+                if x != excluded and nd < dist.get(x, float("inf")):
+                    dist[x] = nd
+                    heapq.heappush(heap, (nd, x))
+        return dist
+
+    @staticmethod
+    def _priority(adj: List[dict], v: int, contracted_neighbours: List[int]) -> int:
+        return len(ContractionHierarchy._shortcuts(adj, v)) - len(adj[v]) + contracted_neighbours[v]
+
+    def __len__(self) -> int:
+        return len(self.vertex_ids)
+
+    def index_of(self, vertex_id: int) -> Optional[int]:
+        """
+        Finds the dense index of a pgRouting vertex.
+
+        Args:
+            vertex_id (int): The pgRouting id of the vertex.
+
+        Returns:
+            Optional[int]: The dense index of the vertex, or None if the vertex is not in the hierarchy.
+        """
+        idx = int(np.searchsorted(self.vertex_ids, vertex_id))
+        if idx < len(self.vertex_ids) and self.vertex_ids[idx] == vertex_id:
+            return idx
+        return None
+
+    def shortest_path(self, source: int, target: int) -> Optional[Tuple[List[int], List[int], List[float]]]:
+        """
+        Finds the shortest path between two pgRouting vertices with a bidirectional upward search.
+
+        Args:
+            source (int): The pgRouting id of the source vertex.
+            target (int): The pgRouting id of the target vertex.
+
+        Returns:
+            Optional[Tuple[List[int], List[int], List[float]]]: Dense indices of the vertices, osm_id of
+            the edges and the aggregated costs, as in RoadGraph.shortest_path. Returns None if there is
+            no path.
+        """
+        s, t = self.index_of(source), self.index_of(target)
+        if s is None or t is None or s == t or self.components[s] != self.components[t]:
+            return None
+
+        dist = ({s: 0.0}, {t: 0.0})
+        prev = ({}, {})
+        heaps = ([(0.0, s)], [(0.0, t)])
+        best, meeting = float("inf"), None
+        while heaps[0] or heaps[1]:
+            tops = [heap[0][0] if heap else float("inf") for heap in heaps]
+            if min(tops) >= best:
+                break
+            side = 0 if tops[0] <= tops[1] else 1
+            d, u = heapq.heappop(heaps[side])
+            if d > dist[side][u]:
+                continue
+            if u in dist[1 - side] and d + dist[1 - side][u] < best:
+                best, meeting = d + dist[1 - side][u], u
+            lo, hi = int(self.indptr[u]), int(self.indptr[u + 1])
+            for position, v, w in zip(
+                range(lo, hi), self.indices[lo:hi].tolist(), self.weights[lo:hi].tolist()
+            ):
+                nd = d + w
+                if nd < dist[side].get(v, float("inf")):
+                    dist[side][v] = nd
+                    prev[side][v] = (u, position)
+                    heapq.heappush(heaps[side], (nd, v))
+        if meeting is None:
+            return None
+
+        # upward edges from s to the meeting vertex, then from the meeting vertex down to t
+        forward = []
+        node = meeting
+        while node != s:
+            parent, position = prev[0][node]
+            forward.append((parent, node, position))
+            node = parent
+        forward.reverse()
+        node = meeting
+        while node != t:
+            parent, position = prev[1][node]
+            forward.append((node, parent, position))
+            node = parent
+
+        nodes, edges, agg_costs = [], [], [0.0]
+        for a, b, position in forward:
+            for node, edge, weight in self._unpack(a, b, position):
+                nodes.append(node)
+                edges.append(edge)
+                agg_costs.append(agg_costs[-1] + weight)
+        nodes.append(t)
+        return nodes, edges, agg_costs
+
+    def costs_from(self, source: int, targets: List[int]) -> List[float]:
+        """
+        Finds the shortest path costs from one vertex to many.
+
+        The upward search space of the source is explored once and every target only needs its own
+        (small) upward search, as in the bucket-based one-to-many CH queries.
+
+        Args:
+            source (int): The pgRouting id of the source vertex.
+            targets (List[int]): The pgRouting ids of the target vertices.
+
+        Returns:
+            List[float]: The full path cost to every target, or infinity if the target is unreachable.
+        """
+        s = self.index_of(source)
+        if s is None:
+            return [float("inf")] * len(targets)
+        forward = self._upward_search(s)
+        costs = []
+        for target in targets:
+            t = self.index_of(target)
+            if t is None or self.components[t] != self.components[s]:
+                costs.append(float("inf"))
+                continue
+            backward = self._upward_search(t)
+            costs.append(
+                min((d + forward[u] for u, d in backward.items() if u in forward), default=float("inf"))
+            )
+        return costs
+
+    def reachable_within(self, source: int, max_cost: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the vertices reachable from a vertex within a cost, as RoadGraph.reachable_within does.
+
+        The search runs on the overlay of the road segments and shortcuts in both directions. Shortcuts
+        have the exact costs of the paths they bypass, so the costs are those of the road graph.
+
+        Args:
+            source (int): The pgRouting id of the source vertex.
+            max_cost (float): The maximum cost (length) of the paths.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The pgRouting ids of the reachable vertices, the source included,
+            and the costs of reaching them, sorted by cost.
+        """
+        return self._overlay_graph().reachable_within(source, max_cost)
+
+    def spans(self, vertex_ids: np.ndarray) -> np.ndarray:
+        """
+        Finds the distance from vertices to their farthest neighbour, as RoadGraph.spans does. The neighbours
+        of the shortcuts are farther than those of the road segments, so the distances are upper bounds.
+
+        Args:
+            vertex_ids (np.ndarray): pgRouting ids of the vertices.
+
+        Returns:
+            np.ndarray: The distances in EPSG:4326 degrees, infinity for the vertices not in the graph.
+        """
+        return self._overlay_graph().spans(vertex_ids)
+
+    def _overlay_graph(self) -> RoadGraph:
+        # the road segments and shortcuts in both directions, built on first use
+        if self._overlay is None:
+            heads = np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.indptr))
+            both_heads = np.concatenate([heads, self.indices])
+            order = np.argsort(both_heads, kind="stable")
+            indptr = np.zeros(len(self) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(both_heads, minlength=len(self)), out=indptr[1:])
+            self._overlay = RoadGraph(
+                self.vertex_ids,
+                self.x,
+                self.y,
+                indptr,
+                np.concatenate([self.indices, heads]).astype(np.int32)[order],
+                np.concatenate([self.weights, self.weights])[order],
+                np.concatenate([self.edge_ids, self.edge_ids])[order],
+                components=self.components,
+            )
+        return self._overlay
+
+    def _upward_search(self, s: int) -> dict:
+        """
+        Runs a Dijkstra from `s` that only follows upward edges.
+
+        Args:
+            s (int): Dense index of the source vertex.
+
+        Returns:
+            dict: Distances of all vertices of the upward search space.
+        """
+        dist = {s: 0.0}
+        heap = [(0.0, s)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            lo, hi = int(self.indptr[u]), int(self.indptr[u + 1])
+            for v, w in zip(self.indices[lo:hi].tolist(), self.weights[lo:hi].tolist()):
+                if d + w < dist.get(v, float("inf")):
+                    dist[v] = d + w
+                    heapq.heappush(heap, (d + w, v))
+        return dist
+
+    def _unpack(self, a: int, b: int, position: int) -> List[Tuple[int, int, float]]:
+        """
+        Expands an upward edge into the road segments it represents.
+
+        Args:
+            a (int): Dense index of the vertex the edge is traversed from.
+            b (int): Dense index of the vertex the edge is traversed to.
+            position (int): Position of the edge in the upward adjacency.
+
+        Returns:
+            List[Tuple[int, int, float]]: The (from vertex, osm_id, cost) road segments in order.
+        """
+        segments = []
+        stack = [(a, b, position)]
+        while stack:
+            a, b, position = stack.pop()
+            middle = int(self.middles[position])
+            if middle < 0:
+                segments.append((a, int(self.edge_ids[position]), float(self.weights[position])))
+            else:
+                stack.append((middle, b, self._upward_position(middle, b)))
+                stack.append((a, middle, self._upward_position(middle, a)))
+        return segments
+
+    def _upward_position(self, lower: int, upper: int) -> int:
+        lo, hi = int(self.indptr[lower]), int(self.indptr[lower + 1])
+        return lo + int(np.flatnonzero(self.indices[lo:hi] == upper)[0])
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Returns the arrays the hierarchy is built from, see from_arrays.
+
+        Returns:
+            Dict[str, np.ndarray]: The arrays by name.
+        """
+        return {
+            "vertex_ids": self.vertex_ids,
+            "x": self.x,
+            "y": self.y,
+            "rank": self.rank,
+            "indptr": self.indptr,
+            "indices": self.indices,
+            "weights": self.weights,
+            "edge_ids": self.edge_ids,
+            "middles": self.middles,
+            "components": self.components,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "ContractionHierarchy":
+        """
+        Builds the hierarchy from the arrays returned by to_arrays, without copying them.
+
+        Args:
+            arrays (Dict[str, np.ndarray]): The arrays, e.g. memory-mapped from an index directory.
+
+        Returns:
+            ContractionHierarchy: The hierarchy.
+        """
+        return cls(**arrays)
+
+    def save(self, path: str) -> None:
+        """
+        Writes the hierarchy to a versioned directory of .npy files, see backend.storage.save_arrays.
+
+        Args:
+            path (str): The path of the directory.
+        """
+        from backend.storage import save_arrays
+
+        save_arrays(path, self.to_arrays(), version=CH_FORMAT_VERSION)
+
+    @classmethod
+    def load(cls, path: str) -> "ContractionHierarchy":
+        """
+        Maps a hierarchy written by save read-only, so all processes loading it share one copy in the page
+        cache and nothing is rebuilt.
+
+        Args:
+            path (str): The path of the directory.
+
+        Returns:
+            ContractionHierarchy: The loaded hierarchy.
+        """
+        from backend.storage import load_arrays
+
+        return cls.from_arrays(load_arrays(path, version=CH_FORMAT_VERSION))
+
+
+def main():
+    from backend.db import DB
+
+    parser = argparse.ArgumentParser(description="Build a contraction hierarchy over the road graph")
+    parser.add_argument("--output", default="road_graph.ch", help="Path of the index directory")
+    args = parser.parse_args()
+
+    graph = DB().load_road_graph()
+    hierarchy = ContractionHierarchy.build(graph)
+    hierarchy.save(args.output)
+    print(f"CH | Saved {len(hierarchy.weights)} upward edges to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
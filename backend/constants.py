@@ -5,3 +5,22 @@ INIT_BUFFER_VALID_POINTS = 0.05
 MAX_BUFFER_RADIUS = 5
 ALPHA = 1
 BETA = 1
+LEG_CACHE_MAX_BYTES = 64 * 1024 * 1024
+LEG_POINT_BYTES = 24 # memory taken by one cached path point (id, x and y arrays)
+DB_POOL_SIZE = 10
+DB_MAX_OVERFLOW = 5
+POLYLINE_PRECISION = 5 # decimal places kept by encoded polylines, about 1 m
+BEAM_WIDTH = 3 # paths kept after every POI by the beam search strategy
+BEAM_BRANCHING = 5 # candidates tried for every kept path by the beam search strategy
+METERS_PER_DEGREE = 111320 # m, at least the great-circle length of a distance of one EPSG:4326 degree
+METRIC_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30] # s, histogram buckets
+MIN_EXPAND_DIJKSTRA = 2000 # m, the box around a leg is expanded by at least in its first pgr_dijkstra search
+EXPAND_DISTANCE_RATIO = 0.5 # expand of the first pgr_dijkstra search per meter of great-circle leg length
+MAX_EXPAND_DIJKSTRA = 3000000 # m, no pgr_dijkstra search is tried with a larger expand
+SNAP_CACHE_MAX_SIZE = 100000 # legs whose road vertices are remembered when snapped in SQL
+ROUTE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+ROUTE_CACHE_TIME_STEP = 1 # min, additional time budgets are rounded down to for the route cache
+ROUTE_CACHE_DISTANCE_STEP = 0.1 # km, additional distance budgets are rounded down to for the route cache
+SESSION_MAX_COUNT = 1000 # routing sessions kept, the least recently used are dropped
+SESSION_TTL = 1800 # s, routing sessions expire this long after their last route
+SESSION_MAX_CANDIDATE_SETS = 256 # ranked candidate lists kept per routing session
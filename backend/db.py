@@ -1,18 +1,39 @@
 import os
-from typing import List, Optional, Tuple
+import re
+import time
+from functools import lru_cache
+from math import cos, radians
+from typing import Dict, List, Optional, Tuple, Union
 
-import geopandas as gpd
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from pyproj import Transformer
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Connection, CursorResult, Engine
 
 from backend.constants import (
+    DB_MAX_OVERFLOW,
+    DB_POOL_SIZE,
+    EXPAND_DISTANCE_RATIO,
     INIT_BUFFER_DIJKSTRA,
     INIT_BUFFER_RADIUS,
     INIT_BUFFER_VALID_POINTS,
+    LEG_CACHE_MAX_BYTES,
+    LEG_POINT_BYTES,
     MAX_BUFFER_RADIUS,
-    VELOCITY
+    MAX_EXPAND_DIJKSTRA,
+    METERS_PER_DEGREE,
+    MIN_EXPAND_DIJKSTRA,
+    SNAP_CACHE_MAX_SIZE,
+    VELOCITY,
 )
+from backend.cache import LRUCache
+from backend.ch import ContractionHierarchy
+from backend.graph import RoadGraph, haversine
+from backend.metrics import observe, span, timed
+from backend.path import DBPoint, PointArray
+from backend.spatial import AmenityIndex, PoiSnapTable, SnapIndex, doubled_radius, last_radius
 
 load_dotenv()
 
@@ -29,37 +50,517 @@ ROAD_TYPES = [
     "tertiary_link",
 ]
 
+Router = Union[RoadGraph, ContractionHierarchy]
 
-class DBPoint:
+# Process-wide cache of shortest path legs keyed by (source vertex, target vertex), shared by all DB objects.
+# Invalidate it (leg_cache.invalidate()) after the OSM data is re-imported.
+leg_cache = LRUCache(
+    max_size=int(os.getenv("LEG_CACHE_MAX_BYTES", LEG_CACHE_MAX_BYTES)),
+    ttl=float(os.getenv("LEG_CACHE_TTL")) if os.getenv("LEG_CACHE_TTL") else None,
+    weigh=lambda leg: LEG_POINT_BYTES * (len(leg[0]) + 1),
+)
+
+# Process-wide cache of the (source vertex, target vertex) of the legs snapped in SQL, keyed by the IDs of
+# their (start, end) points, so that a leg cached in leg_cache needs no query.
+snap_cache = LRUCache(max_size=SNAP_CACHE_MAX_SIZE)
+
+ROAD_TYPES_SQL = str(tuple([str(r) for r in ROAD_TYPES]))
+
+# Edges of pgr_dijkstra and pgr_dijkstraCost, in the box around the source and the targets expanded by a
+# number of meters, as a format() string taking the expand, the source and the comma separated targets
+DIJKSTRA_EDGES_SQL = """'SELECT osm_id as id, source, target, ST_Length(way) as cost
+    FROM planet_osm_line as rr,
+        (SELECT ST_Expand(ST_Extent(l1.way), %s) as box FROM planet_osm_line as l1
+        WHERE l1.source = %s OR l1.target IN (%s)) as box
+    WHERE rr.way && box.box AND rr.highway IS NOT NULL'"""
+
+
+# The first radius r* = INIT * 2^ceil(log2(d / INIT)) of a doubling radius loop containing the distance d
+# to the nearest road start, see _nearest_start_sql
+DOUBLED_RADIUS_SQL = (
+    f"{INIT_BUFFER_RADIUS} * power(2, ceil(log(2, "
+    f"(greatest(nearest.distance, {INIT_BUFFER_RADIUS}) / {INIT_BUFFER_RADIUS})::numeric)))"
+)
+
+
+def _nearest_start_sql(point: str) -> str:
+    # Lateral join of the distance from `point`.geom to the nearest road start, NULL if none is within reach
+    return f"""
+    CROSS JOIN LATERAL (
+        SELECT min(ST_Distance(r.start_4326, {point}.geom)) AS distance
+        FROM planet_osm_line AS r
+        WHERE r.highway IN {ROAD_TYPES_SQL}
+        AND ST_DWithin(r.start_4326, {point}.geom, {last_radius(INIT_BUFFER_RADIUS, MAX_BUFFER_RADIUS)})
+    ) AS nearest"""
+
+
+def _source_search_sql(point: str, end: str) -> str:
+    # Road start within the doubled radius of `point`.geom whose end is closest to `end`.geom, see
+    # _nearest_source_sql
+    return f"""
+        SELECT r.source
+        FROM planet_osm_line AS r
+        WHERE r.highway IN {ROAD_TYPES_SQL}
+        AND ST_DWithin(
+            r.start_4326,
+            {point}.geom,
+            {DOUBLED_RADIUS_SQL}
+        )
+        ORDER BY ST_Distance(r.end_4326, {end}.geom)
+        LIMIT 1"""
+
+
+def _target_search_sql(point: str) -> str:
+    # Target of the road ending closest to `point`.geom, see _nearest_target_sql
+    return f"""
+        SELECT r.target, ST_Distance(r.end_4326, {point}.geom) AS distance
+        FROM planet_osm_line AS r
+        WHERE r.highway IN {ROAD_TYPES_SQL}
+        AND ST_DWithin(r.end_4326, {point}.geom, {last_radius(INIT_BUFFER_DIJKSTRA, MAX_BUFFER_RADIUS)})
+        ORDER BY ST_Distance(r.end_4326, {point}.geom) ASC
+        LIMIT 1"""
+
+
+def _nearest_source_sql(point: str, end: str, poi: Optional[str] = None) -> str:
+    # Lateral joins snapping `point`.geom like a doubling radius loop: among the road starts within the first
+    # radius that contains any of them, the one whose end is closest to `end`.geom. With the `poi` column of
+    # the osm_id, an amenity point takes its candidate sources from poi_road_sources instead, and only the
+    # other points are searched: the second branch of the UNION ALL is not run once the first returned a row.
+    if poi is None:
+        return f"""{_nearest_start_sql(point)}
+    CROSS JOIN LATERAL ({_source_search_sql(point, end)}
+    ) AS s"""
+    return f"""
+    CROSS JOIN LATERAL (
+        (
+            SELECT ps.source
+            FROM poi_road_sources AS ps
+            WHERE ps.osm_id = {poi}
+            ORDER BY ST_Distance(ST_SetSRID(ST_MakePoint(ps.end_x, ps.end_y), 4326), {end}.geom)
+            LIMIT 1
+        )
+        UNION ALL
+        (
+            SELECT s.source
+            FROM (SELECT 1) AS one
+            {_nearest_start_sql(point)}
+            CROSS JOIN LATERAL ({_source_search_sql(point, end)}
+            ) AS s
+        )
+        LIMIT 1
+    ) AS s"""
+
+
+def _nearest_target_sql(point: str, poi: Optional[str] = None) -> str:
+    # Lateral join snapping `point`.geom to the target of the road ending closest to it. With the `poi` column
+    # of the osm_id, an amenity point takes its target from poi_road_targets instead, see _nearest_source_sql.
+    if poi is None:
+        return f"""
+    CROSS JOIN LATERAL ({_target_search_sql(point)}
+    ) AS t"""
+    return f"""
+    CROSS JOIN LATERAL (
+        (SELECT pt.target, pt.distance FROM poi_road_targets AS pt WHERE pt.osm_id = {poi} LIMIT 1)
+        UNION ALL
+        ({_target_search_sql(point)}
+        )
+        LIMIT 1
+    ) AS t"""
+
+
+def _target_span_sql(target: str) -> str:
+    # Lateral join of the span of the `target` vertex, the distance to its farthest neighbouring vertex
+    return f"""
+    CROSS JOIN LATERAL (
+        SELECT max(ST_Distance(l.start_4326, l.end_4326)) AS span
+        FROM planet_osm_line AS l
+        WHERE l.highway IS NOT NULL AND (l.source = {target} OR l.target = {target})
+    ) AS span"""
+
+
+_LEG_VERTICES_SQL = f"""
+    WITH start_point AS (
+        SELECT osm_id, geom_4326 AS geom FROM planet_osm_point WHERE osm_id = :start_id LIMIT 1
+    ),
+    end_point AS (
+        SELECT osm_id, geom_4326 AS geom FROM planet_osm_point WHERE osm_id = :end_id LIMIT 1
+    ),
+    vertices AS (
+        SELECT s.source, t.target, coalesce(sv.component = tv.component, true) AS connected
+        FROM start_point AS p
+        CROSS JOIN end_point AS e
+        {_nearest_source_sql("p", "e", "p.osm_id")}
+        {_nearest_target_sql("e", "e.osm_id")}
+        LEFT JOIN planet_osm_line_vertices_pgr AS sv ON sv.id = s.source
+        LEFT JOIN planet_osm_line_vertices_pgr AS tv ON tv.id = t.target
+    )"""
+
+# Road vertices reachable from the source snapped for the point :id within :distance, with
+# pgr_drivingDistance on the edges within :expand of the source
+_REACHED_SQL = f"""
+    WITH start_point AS (
+        SELECT geom_4326 AS geom FROM planet_osm_point WHERE osm_id = :id LIMIT 1
+    ),
+    origin AS (
+        SELECT s.source
+        FROM start_point AS p
+        {_nearest_source_sql("p", "p")}
+    ),
+    reached AS (
+        SELECT d.node, d.agg_cost
+        FROM origin AS o
+        CROSS JOIN LATERAL pgr_drivingDistance(
+            format({DIJKSTRA_EDGES_SQL}, :expand, o.source, o.source), o.source, :distance, false
+        ) AS d
+    )"""
+
+# The queries of DB: name -> (SQL with named parameters, types of the parameters in order). They are prepared
+# on every new connection of the engine, so PostgreSQL parses and plans them once per connection.
+STATEMENTS = {
+    "point_by_id": (
+        """
+        SELECT osm_id, ST_X(geom_4326), ST_Y(geom_4326)
+        FROM planet_osm_point
+        WHERE osm_id = :id;
+        """,
+        {"id": "bigint"},
+    ),
+    "nearest_point": (
+        """
+        SELECT osm_id, ST_X(geom_4326), ST_Y(geom_4326)
+        FROM planet_osm_point
+        WHERE ST_DWithin(geom_4326, ST_SetSRID(ST_MakePoint(:x, :y), 4326), :radius)
+        ORDER BY geom_4326 <-> ST_SetSRID(ST_MakePoint(:x, :y), 4326)
+        LIMIT 1;
+        """,
+        {"x": "float8", "y": "float8", "radius": "float8"},
+    ),
+    "nearest_sources": (
+        f"""
+        WITH points AS (
+            SELECT osm_id, geom_4326 AS geom FROM planet_osm_point WHERE osm_id = ANY(:ids)
+        ),
+        end_point AS (
+            SELECT geom_4326 AS geom FROM planet_osm_point WHERE osm_id = :end_id LIMIT 1
+        )
+        SELECT p.osm_id, s.source
+        FROM points AS p
+        CROSS JOIN end_point AS e
+        {_nearest_source_sql("p", "e", "p.osm_id")};
+        """,
+        {"ids": "bigint[]", "end_id": "bigint"},
+    ),
+    "nearest_targets": (
+        f"""
+        WITH points AS (
+            SELECT osm_id, geom_4326 AS geom FROM planet_osm_point WHERE osm_id = ANY(:ids)
+        )
+        SELECT p.osm_id, t.target
+        FROM points AS p
+        {_nearest_target_sql("p", "p.osm_id")};
+        """,
+        {"ids": "bigint[]"},
+    ),
+    # How far from every point its source and the start of the last edge to its target can be, in degrees
+    "snap_reaches": (
+        f"""
+        WITH points AS (
+            SELECT osm_id, geom_4326 AS geom FROM planet_osm_point WHERE osm_id = ANY(:ids)
+        )
+        SELECT p.osm_id, {DOUBLED_RADIUS_SQL}, t.distance + span.span
+        FROM points AS p
+        {_nearest_start_sql("p")}
+        {_nearest_target_sql("p")}
+        {_target_span_sql("t.target")};
+        """,
+        {"ids": "bigint[]"},
+    ),
+    "leg_vertices": (
+        f"""
+        {_LEG_VERTICES_SQL}
+        SELECT source, target FROM vertices;
+        """,
+        {"start_id": "bigint", "end_id": "bigint"},
+    ),
+    # Snapping of both ends and the first pgr_dijkstra search of a leg in one round trip. Every row holds the
+    # vertices and whether they are connected, the last one (edge = -1) and the only one of a search that
+    # found no path have no point. Vertices in different components are not searched at all.
+    "leg": (
+        f"""
+        {_LEG_VERTICES_SQL}
+        SELECT v.source, v.target, v.connected,
+            g.osm_id, ST_X(pnt.the_geom), ST_Y(pnt.the_geom), ST_SRID(pnt.the_geom), r.agg_cost
+        FROM vertices AS v
+        LEFT JOIN LATERAL (
+            SELECT *
+            FROM pgr_dijkstra(
+                format({DIJKSTRA_EDGES_SQL}, :expand, v.source, v.target), v.source, v.target, false
+            )
+            WHERE v.connected
+        ) AS r ON true
+        LEFT JOIN planet_osm_line AS g ON r.edge = g.osm_id
+        LEFT JOIN planet_osm_line_vertices_pgr AS pnt ON r.node = pnt.id
+        ORDER BY r.seq;
+        """,
+        {"start_id": "bigint", "end_id": "bigint", "expand": "float8"},
+    ),
+    "isochrone": (
+        f"""
+        {_REACHED_SQL}
+        SELECT r.node, ST_X(v.the_geom), ST_Y(v.the_geom), ST_SRID(v.the_geom), r.agg_cost
+        FROM reached AS r
+        JOIN planet_osm_line_vertices_pgr AS v ON v.id = r.node
+        ORDER BY r.agg_cost;
+        """,
+        {"id": "bigint", "expand": "float8", "distance": "float8"},
+    ),
+    # Points of an amenity whose target vertex is reachable, between :min_distance and :distance away
+    "reachable_points": (
+        f"""
+        {_REACHED_SQL},
+        pois AS (
+            SELECT p.osm_id, p.geom_4326 AS geom
+            FROM planet_osm_point AS p, start_point AS sp
+            WHERE p.amenity = :amenity AND p.osm_id <> :id AND ST_DWithin(p.geom_4326, sp.geom, :radius)
+        )
+        SELECT p.osm_id, ST_X(p.geom), ST_Y(p.geom), 4326, r.agg_cost
+        FROM pois AS p
+        {_nearest_target_sql("p")}
+        JOIN reached AS r ON r.node = t.target
+        WHERE r.agg_cost >= :min_distance
+        ORDER BY r.agg_cost;
+        """,
+        {
+            "id": "bigint",
+            "expand": "float8",
+            "distance": "float8",
+            "amenity": "text",
+            "radius": "float8",
+            "min_distance": "float8",
+        },
+    ),
+    # A pgr_dijkstra search between two vertices, not run if they are in different components. Every row holds
+    # whether they are connected, the last one (edge = -1) and the only one of a search that found no path
+    # have no point.
+    "dijkstra": (
+        f"""
+        WITH vertices AS (
+            SELECT coalesce(sv.component = tv.component, true) AS connected
+            FROM (SELECT :source AS source, :target AS target) AS v
+            LEFT JOIN planet_osm_line_vertices_pgr AS sv ON sv.id = v.source
+            LEFT JOIN planet_osm_line_vertices_pgr AS tv ON tv.id = v.target
+        )
+        SELECT v.connected,
+            g.osm_id, ST_X(pnt.the_geom), ST_Y(pnt.the_geom), ST_SRID(pnt.the_geom), r.agg_cost
+        FROM vertices AS v
+        LEFT JOIN LATERAL (
+            SELECT *
+            FROM pgr_dijkstra(
+                format({DIJKSTRA_EDGES_SQL}, :expand, :source, :target), :source, :target, false
+            )
+            WHERE v.connected
+        ) AS r ON true
+        LEFT JOIN planet_osm_line AS g ON r.edge = g.osm_id
+        LEFT JOIN planet_osm_line_vertices_pgr AS pnt ON r.node = pnt.id
+        ORDER BY r.seq;
+        """,
+        {"source": "bigint", "target": "bigint", "expand": "float8"},
+    ),
+    # pgr_dijkstraCost from a vertex to the targets in its component. The targets in another component are
+    # given an infinite cost instead of being searched for up to the largest expand.
+    "dijkstra_cost": (
+        f"""
+        WITH targets AS (
+            SELECT t.id, coalesce(tv.component = sv.component, true) AS connected
+            FROM unnest(CAST(:targets AS bigint[])) AS t(id)
+            LEFT JOIN planet_osm_line_vertices_pgr AS sv ON sv.id = :source
+            LEFT JOIN planet_osm_line_vertices_pgr AS tv ON tv.id = t.id
+        ),
+        connected AS (
+            SELECT array_agg(id) AS ids FROM targets WHERE connected
+        )
+        SELECT r.end_vid, r.agg_cost
+        FROM connected AS c
+        CROSS JOIN LATERAL (
+            SELECT *
+            FROM pgr_dijkstraCost(
+                format({DIJKSTRA_EDGES_SQL}, :expand, :source, array_to_string(c.ids, ',')),
+                :source,
+                c.ids,
+                false
+            )
+            WHERE c.ids IS NOT NULL
+        ) AS r
+        UNION ALL
+        SELECT id, 'Infinity'::float8 FROM targets WHERE NOT connected;
+        """,
+        {"source": "bigint", "targets": "bigint[]", "expand": "float8"},
+    ),
+    "valid_points": (
+        """
+        WITH point_geom AS (
+        SELECT ST_SetSRID(ST_MakePoint(:x, :y), 4326) AS geom
+        ),
+        buffered_points AS (
+            SELECT p.*, ST_Distance(p.geom_4326, (SELECT geom FROM point_geom)) * 111320 AS dist
+            FROM planet_osm_point AS p
+            WHERE ST_DWithin(p.geom_4326, (SELECT geom FROM point_geom), :radius)
+            AND p.amenity = :amenity
+        )
+
+        SELECT osm_id, ST_X(geom_4326), ST_Y(geom_4326), 4326
+        FROM buffered_points
+        WHERE dist BETWEEN :min_distance AND :max_distance
+        ORDER BY dist ASC;
+        """,
+        {
+            "x": "float8",
+            "y": "float8",
+            "radius": "float8",
+            "amenity": "text",
+            "min_distance": "float8",
+            "max_distance": "float8",
+        },
+    ),
+}
+
+
+def _initial_expand(origin: DBPoint, points: List[DBPoint]) -> float:
     """
-    Represents a point in the database.
+    Finds the expand of the first pgr_dijkstra search from a point to others, so that the box around the
+    road vertices leaves room for detours in proportion to the distance covered.
 
-    Attributes:
-        id (int): The ID of the point.
-        x (float): The x-coordinate of the point.
-        y (float): The y-coordinate of the point.
+    Args:
+        origin (DBPoint): The starting point.
+        points (List[DBPoint]): The points to reach.
+
+    Returns:
+        float: The expand in EPSG:3857 meters, which are stretched by 1 / cos(latitude).
+    """
+    distance = max([haversine(origin.x, origin.y, point.x, point.y) for point in points], default=0.0)
+    return max(MIN_EXPAND_DIJKSTRA, EXPAND_DISTANCE_RATIO * distance / cos(radians(origin.y)))
+
+
+def _positional(query: str, params: Dict[str, str]) -> str:
+    """Replaces the named parameters of a query with the positional ones of PREPARE, in `params` order."""
+    names = list(params)
+    return re.sub(
+        r"(?<![:\w]):(\w+)",
+        lambda match: f"${names.index(match.group(1)) + 1}" if match.group(1) in params else match.group(0),
+        query,
+    )
+
+
+def _prepare_statements(dbapi_connection, connection_record) -> None:
+    """Prepares STATEMENTS on a new connection of the engine, see create_db_engine."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, (query, params) in STATEMENTS.items():
+            cursor.execute(f"PREPARE {name} ({', '.join(params.values())}) AS {_positional(query, params)}")
+        dbapi_connection.commit()
+        connection_record.info["prepared"] = True
+    except Exception as e:
+        # e.g. before `python -m backend.schema` added the columns, the queries are then sent as they are
+        dbapi_connection.rollback()
+        print(f"DB | Statements not prepared: {e}")
+    finally:
+        cursor.close()
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany) -> None:
+    # a single start time, overwritten by the next statement if this one raises before the after hook
+    connection.info["query_start"] = time.perf_counter()
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany) -> None:
+    # every statement is one round trip to the database, counted by the db_round_trip stage of the metrics
+    observe("db_round_trip", time.perf_counter() - connection.info.pop("query_start"))
+
+
+def _execute(connection: Connection, name: str, **params) -> CursorResult:
     """
+    Executes one of STATEMENTS with bound parameters, as a prepared statement if the connection has it.
+
+    Args:
+        connection (Connection): The connection to execute on.
+        name (str): The name of the statement.
+        **params: The values of its parameters.
 
-    def __init__(self, id, x, y):
-        self.id = id
-        self.x = x
-        self.y = y
+    Returns:
+        CursorResult: The result.
+    """
+    query, types = STATEMENTS[name]
+    if connection.info.get("prepared"):
+        query = f"EXECUTE {name}({', '.join(':' + param for param in types)})"
+    return connection.execute(text(query), params)
 
-    def __eq__(self, other):
-        if isinstance(other, DBPoint):
-            return self.id == other.id
-        return False
 
-    def __repr__(self):
-        return f"DBPoint(id={self.id}, x={self.x}, y={self.y})"
+def create_db_engine(
+    pool_size: int = int(os.getenv("DB_POOL_SIZE", DB_POOL_SIZE)),
+    max_overflow: int = int(os.getenv("DB_MAX_OVERFLOW", DB_MAX_OVERFLOW)),
+) -> Engine:
+    """
+    Creates a pooled database engine from the DB_* environment variables.
+
+    Args:
+        pool_size (int): Number of connections kept open in the pool.
+        max_overflow (int): Number of connections that can be opened above `pool_size` under load.
+
+    Returns:
+        Engine: The database engine.
+    """
+    db_host = os.getenv("DB_HOST")
+    db_port = os.getenv("DB_PORT")
+    db_name = os.getenv("DB_NAME")
+    db_user = os.getenv("DB_USER")
+    db_password = os.getenv("DB_PASSWORD")
+    url = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+    engine = create_engine(url, pool_size=pool_size, max_overflow=max_overflow, pool_pre_ping=True)
+    event.listen(engine, "connect", _prepare_statements)
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    return engine
+
+
+@lru_cache(maxsize=None)
+def _transformer_to_4326(srid: int) -> Transformer:
+    return Transformer.from_crs(srid, 4326, always_xy=True)
+
+
+def points_from_rows(rows: List[tuple]) -> PointArray:
+    """
+    Builds a PointArray from (id, x, y, srid) result rows, converting all coordinates to EPSG:4326 at once.
+
+    Args:
+        rows (List[tuple]): The result rows.
+
+    Returns:
+        PointArray: The points in EPSG:4326.
+    """
+    if not rows:
+        return PointArray([], [], [])
+    ids, x, y, srids = (np.asarray(column) for column in zip(*rows))
+    x, y = x.astype(np.float64), y.astype(np.float64)
+    srid = int(srids[0])
+    if srid != 4326:
+        x, y = _transformer_to_4326(srid).transform(x, y)
+    return PointArray(ids, x, y)
 
 
 class DB:
     """
     Represents a database connection and provides methods for querying and manipulating data.
 
+    The queries use the indexed geometry columns added by `python -m backend.schema`.
+
     Attributes:
         _engine (sqlalchemy.engine.Engine): The database engine used for the connection.
+        _router (Optional[Router]): In-process routing engine used instead of pgr_dijkstra, if given.
+        _snap_index (Optional[SnapIndex]): In-memory index used instead of the snapping queries, if given.
+        _amenity_index (Optional[AmenityIndex]): In-memory index used instead of the valid points queries, if
+            given.
+        _poi_snap (Optional[PoiSnapTable]): Road vertices pre-snapped for the amenity points, used instead of
+            snapping them, if given.
 
     Methods:
         get_point_by_id(id: int) -> DBPoint:
@@ -68,41 +569,76 @@ class DB:
         get_nearest_point(point: DBPoint) -> Optional[DBPoint]:
             Retrieves the nearest point to the given point from the database.
 
-        find_shortest_path_between(A: DBPoint, B: DBPoint) -> Optional[Tuple[List[DBPoint], float]]:
+        find_shortest_path_between(A: DBPoint, B: DBPoint) -> Optional[Tuple[PointArray, float]]:
             Finds the shortest path between two points using the Dijkstra algorithm.
 
-        _find_nearest_source(start: DBPoint, end: DBPoint) -> int:
+        get_costs_from(origin: DBPoint, points: List[DBPoint], end: DBPoint) -> List[float]:
+            Finds the network costs from one point to many with a single search.
+
+        get_costs_to(points: List[DBPoint], end: DBPoint) -> List[float]:
+            Finds the network costs from many points to the end point with a single search.
+
+        snap_reaches(points: PointArray) -> Tuple[np.ndarray, np.ndarray]:
+            Bounds how far from points the legs from and to them end.
+
+        load_road_graph(method: str) -> RoadGraph:
+            Loads the routable road network into an in-process routing engine.
+
+        load_snap_index() -> SnapIndex:
+            Loads the points and road segment end points into in-memory snapping indexes.
+
+        load_poi_snap_table() -> PoiSnapTable:
+            Loads the road vertices pre-snapped for the amenity points by `python -m backend.schema`.
+
+        _find_leg(A: DBPoint, B: DBPoint) -> Tuple[Optional[Tuple[int, int]], Optional[Tuple[PointArray, float]]]:
+            Finds the road vertices of a leg and its first pgr_dijkstra search in a single query.
+
+        _find_nearest_source(start: DBPoint, end: DBPoint) -> Optional[int]:
             Finds the nearest source of the road to the given start and end points.
 
-        _find_nearest_target(end: DBPoint) -> int:
+        _find_nearest_target(end: DBPoint) -> Optional[int]:
             Finds the nearest target of the road to the given end point.
 
-        get_valid_points(point: DBPoint, max_distance: float, max_time: float, min_time: float, amenity: str) -> List[DBPoint]:
-            Retrieves a list of valid points based on the given criteria.
+        _find_nearest_sources(points: List[DBPoint], end: DBPoint) -> Dict[int, int]:
+            Finds the nearest sources of the road for many points in a single query.
+
+        _find_nearest_targets(points: List[DBPoint]) -> Dict[int, int]:
+            Finds the nearest targets of the road for many points in a single query.
+
+        get_valid_points(point: DBPoint, max_distance: float, max_time: float, min_time: float, amenity: str) -> PointArray:
+            Retrieves the valid points based on the given criteria.
+
+        reachable_within(point: DBPoint, max_distance: float) -> Tuple[PointArray, np.ndarray]:
+            Finds the road vertices reachable from a point within a network distance.
+
+        get_reachable_points(point: DBPoint, max_distance: float, max_time: float, min_time: float, amenity: str) -> PointArray:
+            Retrieves the points of an amenity reachable from a point over the road network.
+
+        load_amenity_index(amenities: List[str]) -> AmenityIndex:
+            Loads the points of the given amenity types into an in-memory columnar index.
     """
 
-    def __init__(self) -> None:
-        db_host = os.getenv("DB_HOST")
-        db_port = os.getenv("DB_PORT")
-        db_name = os.getenv("DB_NAME")
-        db_user = os.getenv("DB_USER")
-        db_password = os.getenv("DB_PASSWORD")
-        url = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-        self._engine = create_engine(url)
+    def __init__(
+        self,
+        engine: Optional[Engine] = None,
+        router: Optional[Router] = None,
+        snap_index: Optional[SnapIndex] = None,
+        amenity_index: Optional[AmenityIndex] = None,
+        poi_snap: Optional[PoiSnapTable] = None,
+    ) -> None:
+        # Share one engine (and its connection pool) between DB objects whenever possible
+        self._engine = engine if engine is not None else create_db_engine()
+        self._router = router
+        self._snap_index = snap_index
+        self._amenity_index = amenity_index
+        self._poi_snap = poi_snap
 
     def get_point_by_id(self, id: int) -> DBPoint:
-        query = f"""
-        SELECT *
-        FROM planet_osm_point
-        WHERE osm_id = {id};
-        """
-        gdf = gpd.GeoDataFrame.from_postgis(
-            query,
-            self._engine,
-            geom_col="way",
-        ).to_crs("EPSG:4326")
-        return DBPoint(gdf.index[0], gdf.iloc[0].way.x, gdf.iloc[0].way.y)
+        with self._engine.connect() as connection:
+            row = _execute(connection, "point_by_id", id=id).fetchone()
+        return DBPoint(*row)
 
+    @timed("snapping")
     def get_nearest_point(self, point: DBPoint) -> Optional[DBPoint]:
         """
         Retrieves the nearest point to the given point from the database.
@@ -113,91 +649,393 @@ class DB:
         Returns:
             Optional[DBPoint]: The nearest point as a DBPoint object, or None if no point is found.
         """
-        curr_radius = INIT_BUFFER_RADIUS
-        gdf = None
-        while (curr_radius < MAX_BUFFER_RADIUS) and (gdf is None or gdf.shape[0] == 0):
-            query = f"""
-            WITH nearest_point AS (
-                SELECT *, ST_Distance(ST_Transform(way, 4326), ST_SetSRID(ST_MakePoint({point.x}, {point.y}), 4326)) AS distance
-                FROM planet_osm_point
-                WHERE ST_DWithin(ST_Transform(way, 4326), ST_SetSRID(ST_MakePoint({point.x}, {point.y}), 4326), {curr_radius})
-                ORDER BY distance ASC
-                LIMIT 1
-            )
-            SELECT * FROM nearest_point;
-            """
-            gdf = gpd.GeoDataFrame.from_postgis(
-                query,
-                self._engine,
-                geom_col="way",
-                index_col="osm_id",
-            )
-            curr_radius *= 2
-        if not len(gdf):
+        radius = last_radius(INIT_BUFFER_RADIUS, MAX_BUFFER_RADIUS)
+        if self._snap_index is not None:
+            nearest = self._snap_index.nearest_point(point.x, point.y, radius)
+            return DBPoint(*nearest) if nearest is not None else None
+
+        # the nearest point within the last radius of a doubling radius loop is the one the loop would find
+        with self._engine.connect() as connection:
+            row = _execute(connection, "nearest_point", x=point.x, y=point.y, radius=radius).fetchone()
+        if row is None:
             return None
-        gdf = gdf.to_crs("EPSG:4326")
-        return DBPoint(gdf.index[0], gdf.iloc[0].way.x, gdf.iloc[0].way.y)
+        return DBPoint(*row)
 
-    def find_shortest_path_between(self, A: DBPoint, B: DBPoint) -> Optional[Tuple[List[DBPoint], float]]:
+    def find_shortest_path_between(self, A: DBPoint, B: DBPoint) -> Optional[Tuple[PointArray, float]]:
         """
         Finds the shortest path between two DBPoints using Dijsktra algorithm.
 
+        The road vertices of pre-snapped points are looked up in the POI snap table. Otherwise, without a
+        snapping index, they are found in SQL, together with the first pgr_dijkstra search when there is no
+        in-process routing engine, so a leg takes a single round trip.
+
         Args:
             A (DBPoint): The starting point.
             B (DBPoint): The ending point.
 
         Returns:
-            Optional[Tuple[List[DBPoint], float]]: A tuple containing a list of DBPoints representing the shortest path and the total cost of the path. Returns None if no path is found.
+            Optional[Tuple[PointArray, float]]: A tuple containing the points of the shortest path and the total cost of the path. Returns None if no path is found.
+        """
+        result = None
+        expand = _initial_expand(A, [B])
+        leg = self._poi_snap.leg(A.id, B.id, B.x, B.y) if self._poi_snap is not None else None
+        if leg is not None:
+            vertices = leg[:2]
+            if leg[2] is False:
+                print("Dijkstra | Source and target are not connected")
+                return PointArray([], [], []), 0
+        elif self._snap_index is not None:
+            print("Dijkstra | Finding source and target...")
+            vertices = (self._find_nearest_source(A, B), self._find_nearest_target(B))
+            print("Dijkstra | Source and target found")
+        else:
+            vertices = snap_cache.get((A.id, B.id))
+        cached = None
+        if vertices is not None:
+            cached = result = leg_cache.get(vertices)
+            if result is not None:
+                print("Dijkstra | Shortest path found in cache")
+        snapped = leg is not None or self._snap_index is not None
+        if result is None and not snapped and (vertices is None or self._router is None):
+            vertices, result = self._find_leg(A, B, expand)
+            expand *= 4
+        if vertices is None or None in vertices:
+            print("Dijkstra | Source or target not found")
+            return PointArray([], [], []), 0
+
+        if result is None:
+            if self._router is not None:
+                result = self._find_shortest_path_in_process(*vertices)
+            else:
+                result = self._find_shortest_path_pgrouting(*vertices, expand)
+        path, cost = result
+        if path is None:
+            return None, None
+        # a hit is not put again, so that its TTL still runs from when it was found
+        if cached is None:
+            leg_cache.put(vertices, result)
+        return path, cost
+
+    def _find_leg(
+        self, A: DBPoint, B: DBPoint, expand: float
+    ) -> Tuple[Optional[Tuple[int, int]], Optional[Tuple[PointArray, float]]]:
+        """
+        Finds the source and target vertices of a leg in SQL and, without an in-process routing engine, its
+        shortest path within the first expand of _find_shortest_path_pgrouting, in a single round trip.
+
+        Args:
+            A (DBPoint): The starting point.
+            B (DBPoint): The ending point.
+            expand (float): The expand of the search in meters.
+
+        Returns:
+            Tuple[Optional[Tuple[int, int]], Optional[Tuple[PointArray, float]]]: The (source, target)
+            vertices, or None if a point cannot be snapped, and the shortest path and its cost, or None if
+            the path still has to be searched for. Vertices in different components have an empty path.
         """
         print("Dijkstra | Finding source and target...")
-        source = self._find_nearest_source(A, B)
-        print("Dijkstra | Source found")
-        target = self._find_nearest_target(B)
-        print("Dijkstra | Target found")
-
-        path = []
-        expand = 10000
-        while len(path) == 0 and expand < 3000000:
-            query = f"""
-            SELECT *
-            FROM pgr_dijkstra(
-                'SELECT osm_id as id, source, target, ST_Length(way) as cost
-                FROM planet_osm_line as rr,
-                    (SELECT ST_Expand(ST_Extent(l1.way),{expand}) as box  FROM planet_osm_line as l1 WHERE l1.source = {source} OR l1.target = {target}) as box
-                WHERE rr.way && box.box AND rr.highway IS NOT NULL',
-                {source}, {target}, false
-            ) as r
-            INNER JOIN planet_osm_line as g ON r.edge = g.osm_id
-            LEFT JOIN planet_osm_line_vertices_pgr as pnt on r.node = pnt.id;
-            """
-
-            print(f"Dijkstra | Finding shortest path for expand={expand}m...")
+        with self._engine.connect() as connection:
+            if self._router is not None:
+                with span("source_target_lookup"):
+                    rows = _execute(connection, "leg_vertices", start_id=A.id, end_id=B.id).fetchall()
+            else:
+                print(f"Dijkstra | Finding shortest path for expand={expand:.0f}m...")
+                with span("dijkstra_expand"):
+                    rows = _execute(connection, "leg", start_id=A.id, end_id=B.id, expand=expand).fetchall()
+        if not rows:
+            return None, None
+        vertices = (rows[0][0], rows[0][1])
+        snap_cache.put((A.id, B.id), vertices)
+        print("Dijkstra | Source and target found")
+        if self._router is not None:
+            return vertices, None
+        if not rows[0][2]:
+            print("Dijkstra | Source and target are not connected")
+            return vertices, (PointArray([], [], []), 0)
+        # the last row of a path (edge = -1) and the only row of a search that found none have no point
+        points = [row[3:] for row in rows if row[3] is not None]
+        if not points:
+            return vertices, None
+        print("Dijkstra | Shortest path found")
+        return vertices, (points_from_rows([point[:4] for point in points]), points[-1][4])
+
+    def _find_shortest_path_pgrouting(
+        self, source: int, target: int, expand: float = MIN_EXPAND_DIJKSTRA
+    ) -> Tuple[PointArray, float]:
+        """
+        Finds the shortest path between two road vertices with pgr_dijkstra, expanding the searched area
+        until a path is found. Vertices in different components are not searched for.
+
+        Args:
+            source (int): The ID of the source vertex.
+            target (int): The ID of the target vertex.
+            expand (float): The expand of the first search in meters.
+
+        Returns:
+            Tuple[PointArray, float]: The points of the shortest path and its cost.
+        """
+        while expand < MAX_EXPAND_DIJKSTRA:
+            print(f"Dijkstra | Finding shortest path for expand={expand:.0f}m...")
             try:
-                gdf = gpd.GeoDataFrame.from_postgis(
-                    query,
-                    self._engine,
-                    geom_col="the_geom",
-                    index_col="osm_id",
-                )
-                gdf = gdf.reset_index()
-                if len(gdf) == 0:
+                with span("dijkstra_expand"), self._engine.connect() as connection:
+                    result = _execute(connection, "dijkstra", source=source, target=target, expand=expand)
+                    rows = result.fetchall()
+                if rows and not rows[0][0]:
+                    print("Dijkstra | Source and target are not connected")
+                    return PointArray([], [], []), 0
+                # the last row of a path (edge = -1) and the only row of a search that found none have no point
+                points = [row[1:] for row in rows if row[1] is not None]
+                if not points:
                     expand *= 4
                     continue
                 print("Dijkstra | Shortest path found")
-                return (
-                    [
-                        DBPoint(row.osm_id, row.the_geom.x, row.the_geom.y)
-                        for idx, row in gdf.to_crs("EPSG:4326").iterrows()
-                    ],
-                    gdf.iloc[-1].agg_cost,
-                )
+                return points_from_rows([point[:4] for point in points]), points[-1][4]
             except ValueError as e:
                 print("Dijkstra | Shortest path not found: " + str(e))
                 return None, None
         print("Dijkstra | Shortest path not found")
-        return ([], 0)
+        return PointArray([], [], []), 0
+
+    def _find_shortest_path_in_process(self, source: int, target: int) -> Tuple[PointArray, float]:
+        """
+        Finds the shortest path between two road vertices with the in-process routing engine.
+
+        The result mirrors the pgr_dijkstra query: the last row (edge = -1) is dropped by the join with
+        planet_osm_line, so the target vertex is not part of the path and the cost is the aggregated cost
+        of reaching the start of the last edge.
+
+        Args:
+            source (int): The ID of the source vertex.
+            target (int): The ID of the target vertex.
+
+        Returns:
+            Tuple[PointArray, float]: The points of the shortest path and its cost.
+        """
+        print(f"Dijkstra | Finding shortest path in process ({self._router.method})...")
+        with span("dijkstra_expand"):
+            result = self._router.shortest_path(source, target)
+        if result is None:
+            print("Dijkstra | Shortest path not found")
+            return PointArray([], [], []), 0
+        nodes, edges, agg_costs = result
+        print("Dijkstra | Shortest path found")
+        nodes = nodes[:-1]
+        return PointArray(edges, self._router.x[nodes], self._router.y[nodes]), agg_costs[-2]
+
+    def get_costs_from(self, origin: DBPoint, points: List[DBPoint], end: DBPoint) -> List[float]:
+        """
+        Finds the network costs from one point to many points with a single search.
 
-    def _find_nearest_source(self, start: DBPoint, end: DBPoint) -> int:
+        The origin is snapped once, using the end point of the route for the tie-break of
+        _find_nearest_source, and all points are snapped to their targets in a single query.
+
+        Args:
+            origin (DBPoint): The starting point.
+            points (List[DBPoint]): The points to reach.
+            end (DBPoint): The end point of the route.
+
+        Returns:
+            List[float]: The full network cost to every point, or infinity if the point is unreachable.
+        """
+        if not points:
+            return []
+        source = self._find_nearest_source(origin, end)
+        targets = self._find_nearest_targets(points)
+        expand = _initial_expand(origin, points)
+        return self._one_to_many_costs(source, [targets.get(point.id) for point in points], expand)
+
+    def get_costs_to(self, points: List[DBPoint], end: DBPoint) -> List[float]:
+        """
+        Finds the network costs from many points to the end point with a single search.
+
+        The road graph is undirected, so the costs are found by one search from the end point's target.
+
+        Args:
+            points (List[DBPoint]): The starting points.
+            end (DBPoint): The end point.
+
+        Returns:
+            List[float]: The full network cost from every point, or infinity if the end is unreachable.
+        """
+        if not points:
+            return []
+        target = self._find_nearest_target(end)
+        sources = self._find_nearest_sources(points, end)
+        expand = _initial_expand(end, points)
+        return self._one_to_many_costs(target, [sources.get(point.id) for point in points], expand)
+
+    def snap_reaches(self, points: PointArray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Bounds how far from points the legs from and to them end: a leg from a point starts at its source
+        vertex, and the cost of a leg to a point stops at the start of the last edge to its target vertex.
+
+        The bounds are looked up in the POI snap table, else found with the snapping index and the spans of
+        the in-process routing engine, else in SQL with a single query.
+
+        Args:
+            points (PointArray): The points.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The bound of the legs from and of the legs to every point in
+            meters, infinity if the point cannot be snapped or the bound is unknown.
+        """
+        ids = np.asarray(points.ids, dtype=np.int64)
+        reach_from, reach_to = np.full(len(ids), np.inf), np.full(len(ids), np.inf)
+        missing = np.ones(len(ids), dtype=bool)
+        if self._poi_snap is not None:
+            positions = self._poi_snap.positions(ids)
+            missing = positions < 0
+            reach_from[~missing], reach_to[~missing] = self._poi_snap.reaches(positions[~missing])
+        missing = np.flatnonzero(missing).tolist()
+        if missing and self._snap_index is not None and self._router is not None:
+            for i in missing:
+                reach_from[i], target, distance = self._snap_index.reach(
+                    points.x[i], points.y[i], INIT_BUFFER_RADIUS, INIT_BUFFER_DIJKSTRA, MAX_BUFFER_RADIUS
+                )
+                if target is not None:
+                    reach_to[i] = distance + self._router.spans([target])[0]
+        elif missing and self._engine is not None:
+            with span("source_target_lookup"), self._engine.connect() as connection:
+                rows = _execute(connection, "snap_reaches", ids=ids[missing].tolist()).fetchall()
+            found = {row[0]: row[1:] for row in rows}
+            for i in missing:
+                source_reach, target_reach = found.get(int(ids[i]), (None, None))
+                reach_from[i] = source_reach if source_reach is not None else np.inf
+                reach_to[i] = target_reach if target_reach is not None else np.inf
+        return reach_from * METERS_PER_DEGREE, reach_to * METERS_PER_DEGREE
+
+    def _one_to_many_costs(
+        self, source: int, targets: List[Optional[int]], expand: float = MIN_EXPAND_DIJKSTRA
+    ) -> List[float]:
+        """
+        Finds the shortest path costs from one road vertex to many.
+
+        Args:
+            source (int): The ID of the source vertex.
+            targets (List[Optional[int]]): The IDs of the target vertices, None for points that could not
+                be snapped.
+            expand (float): The expand of the first pgr_dijkstraCost search in meters.
+
+        Returns:
+            List[float]: The cost to every target, or infinity if the target is unreachable.
+        """
+        known = [target for target in targets if target is not None]
+        if self._router is not None:
+            with span("dijkstra_expand"):
+                costs = dict(zip(known, self._router.costs_from(source, known)))
+        else:
+            costs = {source: 0.0} if source in known else {}
+            while any(target not in costs for target in known) and expand < MAX_EXPAND_DIJKSTRA:
+                print(f"Dijkstra | Finding one-to-many costs for expand={expand:.0f}m...")
+                with span("dijkstra_expand"), self._engine.connect() as connection:
+                    result = _execute(
+                        connection, "dijkstra_cost", source=source, targets=known, expand=expand
+                    )
+                    costs.update({row[0]: row[1] for row in result})
+                expand *= 4
+        return [
+            costs.get(target, float("inf")) if target is not None else float("inf") for target in targets
+        ]
+
+    def load_road_graph(self, method: str = "dijkstra") -> RoadGraph:
+        """
+        Loads the routable (highway) edges of planet_osm_line into an in-process routing engine.
+
+        Args:
+            method (str): The search algorithm of the engine, either "dijkstra" or "astar".
+
+        Returns:
+            RoadGraph: The loaded road graph.
+        """
+        edges_query = """
+        SELECT osm_id, source, target, ST_Length(way) AS cost
+        FROM planet_osm_line
+        WHERE highway IS NOT NULL AND source IS NOT NULL AND target IS NOT NULL;
+        """
+        vertices_query = """
+        SELECT id, ST_X(ST_Transform(the_geom, 4326)) AS x, ST_Y(ST_Transform(the_geom, 4326)) AS y
+        FROM planet_osm_line_vertices_pgr;
+        """
+        with self._engine.connect() as connection:
+            edges = pd.read_sql(text(edges_query), connection)
+            vertices = pd.read_sql(text(vertices_query), connection)
+        print(f"Road graph | Loaded {len(edges)} edges and {len(vertices)} vertices")
+        return RoadGraph.from_edges(
+            edges["source"].to_numpy(),
+            edges["target"].to_numpy(),
+            edges["cost"].to_numpy(),
+            edges["osm_id"].to_numpy(),
+            vertices["id"].to_numpy(),
+            vertices["x"].to_numpy(),
+            vertices["y"].to_numpy(),
+            method=method,
+        )
+
+    def load_poi_snap_table(self) -> PoiSnapTable:
+        """
+        Loads the road vertices pre-snapped for the amenity points by `python -m backend.schema`.
+
+        Returns:
+            PoiSnapTable: The loaded table.
+        """
+        targets_query = "SELECT osm_id, target, distance, component, span FROM poi_road_targets;"
+        sources_query = "SELECT osm_id, source, distance, component, end_x, end_y FROM poi_road_sources;"
+        with self._engine.connect() as connection:
+            targets = pd.read_sql(text(targets_query), connection)
+            sources = pd.read_sql(text(sources_query), connection)
+        print(f"POI snap table | Loaded {len(targets)} points and {len(sources)} candidate sources")
+        return PoiSnapTable(
+            targets["osm_id"].to_numpy(),
+            targets["target"].to_numpy(),
+            targets["distance"].to_numpy(),
+            targets["component"].fillna(-1).to_numpy(),
+            targets["span"].fillna(np.inf).to_numpy(),
+            sources["osm_id"].to_numpy(),
+            sources["source"].to_numpy(),
+            sources["distance"].to_numpy(),
+            sources["component"].fillna(-1).to_numpy(),
+            sources["end_x"].to_numpy(),
+            sources["end_y"].to_numpy(),
+        )
+
+    def load_snap_index(self) -> SnapIndex:
+        """
+        Loads the points of planet_osm_point and the end points of the roads into in-memory snapping indexes.
+
+        Returns:
+            SnapIndex: The loaded snapping indexes.
+        """
+        points_query = """
+        SELECT osm_id, ST_X(geom_4326) AS x, ST_Y(geom_4326) AS y
+        FROM planet_osm_point;
+        """
+        roads_query = f"""
+        SELECT source, target,
+            ST_X(start_4326) AS start_x,
+            ST_Y(start_4326) AS start_y,
+            ST_X(end_4326) AS end_x,
+            ST_Y(end_4326) AS end_y
+        FROM planet_osm_line
+        WHERE highway IN {ROAD_TYPES_SQL};
+        """
+        with self._engine.connect() as connection:
+            points = pd.read_sql(text(points_query), connection)
+            roads = pd.read_sql(text(roads_query), connection)
+        print(f"Snap index | Loaded {len(points)} points and {len(roads)} roads")
+        return SnapIndex(
+            points["osm_id"].to_numpy(),
+            points["x"].to_numpy(),
+            points["y"].to_numpy(),
+            roads["source"].to_numpy(),
+            roads["target"].to_numpy(),
+            roads["start_x"].to_numpy(),
+            roads["start_y"].to_numpy(),
+            roads["end_x"].to_numpy(),
+            roads["end_y"].to_numpy(),
+        )
+
+    @timed("source_target_lookup")
+    def _find_nearest_source(self, start: DBPoint, end: DBPoint) -> Optional[int]:
         """
         Finds the nearest source of the road to the given start and end points.
 
@@ -206,46 +1044,19 @@ class DB:
             end (DBPoint): The ending point.
 
         Returns:
-            int: The ID of the nearest source point.
+            Optional[int]: The ID of the nearest source point, or None if there is no road nearby.
         """
-        curr_radius = INIT_BUFFER_RADIUS
-        result = None
-        with self._engine.connect() as connection:
-            while curr_radius < MAX_BUFFER_RADIUS and (result is None or len(result) == 0):
-                query = f"""
-                WITH start_point AS (
-                    SELECT ST_Transform(way, 4326) AS geom
-                    FROM planet_osm_point
-                    WHERE osm_id = {start.id}
-                    LIMIT 1
-                ),
-                end_point AS (
-                    SELECT ST_Transform(way, 4326) AS geom
-                    FROM planet_osm_point
-                    WHERE osm_id = {end.id}
-                    LIMIT 1
-                ),
-                distances1 AS (
-                    SELECT r.osm_id, ST_Distance(ST_Transform(ST_StartPoint(r.way), 4326), sp.geom) AS distance
-                    FROM planet_osm_line AS r, start_point AS sp
-                    WHERE r.highway IN {tuple([str(r) for r in ROAD_TYPES])}
-                    AND ST_DWithin(ST_Transform(ST_StartPoint(r.way), 4326), sp.geom, {curr_radius})
-                    ORDER BY distance ASC
-                )
-                SELECT source FROM (
-                    SELECT r.*, d.distance
-                    FROM planet_osm_line AS r
-                    JOIN distances1 d ON r.osm_id = d.osm_id
-                    WHERE r.highway IN {tuple([str(r) for r in ROAD_TYPES])}
-                ) AS closest_starts
-                ORDER BY ST_Distance(ST_Transform(ST_EndPoint(closest_starts.way), 4326), (SELECT geom FROM end_point))
-                LIMIT 1;
-                """
-                result = connection.execute(text(query)).fetchone()
-                curr_radius *= 2
-            return result[0]
+        source = self._poi_snap.source(start.id, end.x, end.y) if self._poi_snap is not None else None
+        if source is not None:
+            return source
+        if self._snap_index is not None:
+            return self._snap_index.nearest_source(
+                start.x, start.y, end.x, end.y, INIT_BUFFER_RADIUS, MAX_BUFFER_RADIUS
+            )
+        return self._find_nearest_sources([start], end).get(start.id)
 
-    def _find_nearest_target(self, end: DBPoint) -> int:
+    @timed("source_target_lookup")
+    def _find_nearest_target(self, end: DBPoint) -> Optional[int]:
         """
         Finds the nearest target of the road based on the given end point.
 
@@ -253,40 +1064,76 @@ class DB:
             end (DBPoint): The end point to find the nearest target for.
 
         Returns:
-            int: The ID of the nearest target.
+            Optional[int]: The ID of the nearest target, or None if there is no road nearby.
         """
-        curr_radius = INIT_BUFFER_DIJKSTRA
-        result = None
+        target = int(self._poi_snap.targets_of([end.id])[0]) if self._poi_snap is not None else -1
+        if target >= 0:
+            return target
+        if self._snap_index is not None:
+            return self._snap_index.nearest_target(end.x, end.y, INIT_BUFFER_DIJKSTRA, MAX_BUFFER_RADIUS)
+        return self._find_nearest_targets([end]).get(end.id)
+
+    @timed("source_target_lookup")
+    def _find_nearest_sources(self, points: List[DBPoint], end: DBPoint) -> Dict[int, int]:
+        """
+        Finds the nearest sources of the road for many points in a single query.
+
+        For every point it picks the source of a doubling radius loop: among the road starts within the
+        smallest doubled radius that contains any of them, the one whose end is closest to `end`.
+
+        Args:
+            points (List[DBPoint]): The starting points.
+            end (DBPoint): The end point used for the tie-break.
+
+        Returns:
+            Dict[int, int]: Mapping from the ID of a point to the ID of its source.
+        """
+        if self._snap_index is not None:
+            sources = {point.id: self._find_nearest_source(point, end) for point in points}
+            return {id: source for id, source in sources.items() if source is not None}
+
+        sources = {}
+        if self._poi_snap is not None:
+            sources = {point.id: self._poi_snap.source(point.id, end.x, end.y) for point in points}
+            sources = {id: source for id, source in sources.items() if source is not None}
+            points = [point for point in points if point.id not in sources]
+            if not points:
+                return sources
         with self._engine.connect() as connection:
-            while curr_radius < MAX_BUFFER_RADIUS and (result is None or len(result) == 0):
-                query = f"""
-                WITH end_point AS (
-                SELECT ST_Transform(way, 4326) as geom
-                FROM planet_osm_point
-                WHERE osm_id = {end.id}
-                LIMIT 1
-                ),
-                nearby_lines AS (
-                    SELECT r.osm_id, r.way
-                    FROM planet_osm_line AS r
-                    CROSS JOIN end_point
-                    WHERE r.highway IN {tuple([str(r) for r in ROAD_TYPES])}
-                    AND ST_DWithin(ST_Transform(ST_EndPoint(r.way), 4326), end_point.geom, {curr_radius})
-                )
-                SELECT r.target
-                FROM planet_osm_line AS r
-                JOIN nearby_lines AS d ON r.osm_id = d.osm_id
-                WHERE r.highway IN {tuple([str(r) for r in ROAD_TYPES])}
-                ORDER BY ST_Distance(ST_Transform(ST_EndPoint(d.way), 4326), (SELECT geom FROM end_point)) ASC
-                LIMIT 1;
-                """
-                result = connection.execute(text(query)).fetchone()
-                curr_radius *= 2
-            return result[0]
+            ids = [point.id for point in points]
+            result = _execute(connection, "nearest_sources", ids=ids, end_id=end.id)
+            return {**sources, **{row[0]: row[1] for row in result}}
+
+    @timed("source_target_lookup")
+    def _find_nearest_targets(self, points: List[DBPoint]) -> Dict[int, int]:
+        """
+        Finds the nearest targets of the road for many points in a single query.
+
+        Args:
+            points (List[DBPoint]): The end points.
+
+        Returns:
+            Dict[int, int]: Mapping from the ID of a point to the ID of its target.
+        """
+        if self._snap_index is not None:
+            targets = {point.id: self._find_nearest_target(point) for point in points}
+            return {id: target for id, target in targets.items() if target is not None}
+
+        targets = {}
+        if self._poi_snap is not None:
+            ids = [point.id for point in points]
+            targets = dict(zip(ids, self._poi_snap.targets_of(ids).tolist()))
+            targets = {id: target for id, target in targets.items() if target >= 0}
+            points = [point for point in points if point.id not in targets]
+            if not points:
+                return targets
+        with self._engine.connect() as connection:
+            result = _execute(connection, "nearest_targets", ids=[point.id for point in points])
+            return {**targets, **{row[0]: row[1] for row in result}}
 
     def get_valid_points(
         self, point: DBPoint, max_distance: float, max_time: float, min_time: float, amenity: str
-    ) -> List[DBPoint]:
+    ) -> PointArray:
         """
         Retrieves a list of valid points within a specified distance and time range from a given point.
 
@@ -298,44 +1145,188 @@ class DB:
             amenity (str): The type of amenity to filter the points.
 
         Returns:
-            List[DBPoint]: A list of valid points within the specified distance and time range.
+            PointArray: The valid points within the specified distance and time range.
         """
         # v = s/t -> s = v*t
         max_distance = min(max_distance, VELOCITY * max_time)
         min_distance = VELOCITY * min_time
+        if self._amenity_index is not None:
+            return self._get_valid_points_in_memory(point, max_distance, min_distance, amenity)
+
         curr_radius = INIT_BUFFER_VALID_POINTS
-        gdf = None
-        while (
-            (curr_radius < MAX_BUFFER_RADIUS)
-            and (111320 * curr_radius < max_distance * 5)
-            and (gdf is None or gdf.shape[0] == 0)
-        ):
-            query = f"""
-            WITH point_geom AS (
-            SELECT ST_SetSRID(ST_MakePoint({point.x}, {point.y}), 4326) AS geom
-            ),
-            buffered_points AS (
-                SELECT p.*, ST_Distance(ST_Transform(p.way, 4326), (SELECT geom FROM point_geom)) * 111320 AS dist
-                FROM planet_osm_point AS p
-                WHERE ST_DWithin(ST_Transform(p.way, 4326), (SELECT geom FROM point_geom), {curr_radius})
-                AND p.amenity = '{amenity}'
+        rows = []
+        with self._engine.connect() as connection:
+            while (
+                (curr_radius < MAX_BUFFER_RADIUS)
+                and (111320 * curr_radius < max_distance * 5)
+                and len(rows) == 0
+            ):
+                with span("valid_points_radius"):
+                    result = _execute(
+                        connection,
+                        "valid_points",
+                        x=point.x,
+                        y=point.y,
+                        radius=curr_radius,
+                        amenity=amenity,
+                        min_distance=min_distance,
+                        max_distance=max_distance,
+                    )
+                    rows = result.fetchall()[1:]  # first row is the point itself
+                curr_radius *= 2
+                print(f"Valid points | Found {len(rows)} points within radius = {curr_radius}")
+        return points_from_rows(rows)
+
+    def _get_valid_points_in_memory(
+        self, point: DBPoint, max_distance: float, min_distance: float, amenity: str
+    ) -> PointArray:
+        """
+        Retrieves the valid points with a single annulus query over the in-memory amenity index.
+
+        The result is the one of the doubling radius loop of get_valid_points: the points within the first
+        radius that contains any point of the annulus, the reference point itself left out.
+
+        Args:
+            point (DBPoint): The reference point.
+            max_distance (float): The maximum distance from the reference point in meters.
+            min_distance (float): The minimum distance from the reference point in meters.
+            amenity (str): The type of amenity to filter the points.
+
+        Returns:
+            PointArray: The valid points sorted by distance.
+        """
+        radius = INIT_BUFFER_VALID_POINTS
+        if not (radius < MAX_BUFFER_RADIUS and 111320 * radius < max_distance * 5):
+            return PointArray([], [], [])
+        while radius * 2 < MAX_BUFFER_RADIUS and 111320 * radius * 2 < max_distance * 5:
+            radius *= 2
+        with span("valid_points_radius"):
+            ids, xs, ys, distances = self._amenity_index.annulus(
+                amenity, point.x, point.y, min_distance, max_distance, radius, exclude_id=point.id
             )
+        if not len(ids):
+            print("Valid points | Found 0 points")
+            return PointArray([], [], [])
+        mask = distances / 111320 <= doubled_radius(distances[0] / 111320, INIT_BUFFER_VALID_POINTS)
+        print(f"Valid points | Found {int(mask.sum())} points")
+        return PointArray(ids[mask], xs[mask], ys[mask])
 
-            SELECT *
-            FROM buffered_points
-            WHERE dist BETWEEN {min_distance} AND {max_distance}
-            ORDER BY dist ASC;
-            """
-            gdf = gpd.GeoDataFrame.from_postgis(
-                query,
-                self._engine,
-                geom_col="way",
+    @timed("isochrone")
+    def reachable_within(self, point: DBPoint, max_distance: float) -> Tuple[PointArray, np.ndarray]:
+        """
+        Finds the road vertices reachable from a point within a network distance, with a single bounded
+        search from its source vertex (pgr_drivingDistance without an in-process routing engine).
+
+        Args:
+            point (DBPoint): The starting point.
+            max_distance (float): The maximum network distance in meters.
+
+        Returns:
+            Tuple[PointArray, np.ndarray]: The reachable vertices (with their pgRouting ids) and the network
+            distances to them, sorted by distance.
+        """
+        if self._router is None:
+            # the box of pgr_drivingDistance only has to contain the paths up to max_distance long
+            with self._engine.connect() as connection:
+                rows = _execute(
+                    connection, "isochrone", id=point.id, expand=max_distance, distance=max_distance
+                ).fetchall()
+            print(f"Isochrone | Found {len(rows)} vertices within {max_distance:.0f}m")
+            costs = np.array([row[4] for row in rows], dtype=np.float64)
+            return points_from_rows([row[:4] for row in rows]), costs
+
+        source = self._find_nearest_source(point, point)
+        if source is None:
+            return PointArray([], [], []), np.empty(0)
+        vertex_ids, costs = self._router.reachable_within(source, max_distance)
+        positions = np.searchsorted(self._router.vertex_ids, vertex_ids)
+        print(f"Isochrone | Found {len(vertex_ids)} vertices within {max_distance:.0f}m")
+        return PointArray(vertex_ids, self._router.x[positions], self._router.y[positions]), costs
+
+    def get_reachable_points(
+        self, point: DBPoint, max_distance: float, max_time: float, min_time: float, amenity: str
+    ) -> PointArray:
+        """
+        Retrieves the points of an amenity reachable from a point within a network distance and time.
+
+        It takes the same arguments as get_valid_points, but the distances are those of the road network
+        from the source vertex of the point to the target vertex of every candidate, found with a single
+        bounded search, so candidates that cannot be reached in time are never returned.
+
+        Args:
+            point (DBPoint): The reference point.
+            max_distance (float): The maximum network distance from the reference point.
+            max_time (float): The maximum time it takes to reach the points from the reference point.
+            min_time (float): The minimum time it takes to reach the points from the reference point.
+            amenity (str): The type of amenity to filter the points.
+
+        Returns:
+            PointArray: The reachable points sorted by network distance.
+        """
+        max_distance = min(max_distance, VELOCITY * max_time)
+        min_distance = VELOCITY * min_time
+        # a candidate is at most max_distance from its target vertex in EPSG:3857, i.e. in longitude degrees
+        # times 111320, and its target vertex within the snapping radius of it
+        radius = max_distance / 111320 + INIT_BUFFER_DIJKSTRA
+        if self._router is None or self._snap_index is None or self._amenity_index is None:
+            with span("valid_points_radius"), self._engine.connect() as connection:
+                rows = _execute(
+                    connection,
+                    "reachable_points",
+                    id=point.id,
+                    expand=max_distance,
+                    distance=max_distance,
+                    amenity=amenity,
+                    radius=radius,
+                    min_distance=min_distance,
+                ).fetchall()
+            print(f"Valid points | Found {len(rows)} reachable points")
+            return points_from_rows([row[:4] for row in rows])
+
+        vertices, costs = self.reachable_within(point, max_distance)
+        with span("valid_points_radius"):
+            ids, xs, ys, _ = self._amenity_index.annulus(
+                amenity, point.x, point.y, 0, radius * 111320, radius, exclude_id=point.id
             )
-            gdf = gdf.reset_index()[1:]  # first row is the point itself
-            curr_radius *= 2
-            print(f"Valid points | Found {len(gdf)} points within radius = {curr_radius}")
-        return (
-            [DBPoint(row.osm_id, row.way.x, row.way.y) for idx, row in gdf.to_crs("EPSG:4326").iterrows()]
-            if gdf is not None and len(gdf) > 0
-            else []
+            if not len(vertices) or not len(ids):
+                print("Valid points | Found 0 reachable points")
+                return PointArray([], [], [])
+            # pre-snapped targets if there are, the rest snapped one by one
+            targets = self._poi_snap.targets_of(ids) if self._poi_snap is not None else np.full(len(ids), -1)
+            for i in np.flatnonzero(targets < 0).tolist():
+                target = self._snap_index.nearest_target(
+                    xs[i], ys[i], INIT_BUFFER_DIJKSTRA, MAX_BUFFER_RADIUS
+                )
+                targets[i] = -1 if target is None else target
+            order = np.argsort(vertices.ids)
+            positions = order[np.searchsorted(vertices.ids, targets, sorter=order).clip(max=len(order) - 1)]
+            distances = np.where(vertices.ids[positions] == targets, costs[positions], np.inf)
+            mask = (distances >= min_distance) & np.isfinite(distances)
+            order = np.argsort(distances[mask], kind="stable")
+        print(f"Valid points | Found {len(order)} reachable points")
+        return PointArray(ids[mask][order], xs[mask][order], ys[mask][order])
+
+    def load_amenity_index(self, amenities: List[str]) -> AmenityIndex:
+        """
+        Loads the points of the given amenity types into an in-memory columnar index.
+
+        Args:
+            amenities (List[str]): The amenity types to load.
+
+        Returns:
+            AmenityIndex: The loaded index.
+        """
+        query = """
+        SELECT osm_id, amenity, ST_X(geom_4326) AS x, ST_Y(geom_4326) AS y
+        FROM planet_osm_point
+        WHERE amenity = ANY(:amenities);
+        """
+        with self._engine.connect() as connection:
+            points = pd.read_sql(text(query), connection, params={"amenities": list(amenities)})
+        print(f"Amenity index | Loaded {len(points)} points")
+        return AmenityIndex(
+            points["osm_id"].to_numpy(),
+            points["amenity"].to_numpy(),
+            points["x"].to_numpy(),
+            points["y"].to_numpy(),
         )
@@ -0,0 +1,391 @@
+import heapq
+from math import asin, cos, radians, sin, sqrt
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+EARTH_RADIUS = 6371008.8  # m
+
+ROUTING_METHODS = ["dijkstra", "astar"]
+
+
+def haversine(x1: float, y1: float, x2: float, y2: float) -> float:
+    """
+    Calculates the great-circle distance between two EPSG:4326 coordinates.
+
+    Args:
+        x1 (float): Longitude of the first point.
+        y1 (float): Latitude of the first point.
+        x2 (float): Longitude of the second point.
+        y2 (float): Latitude of the second point.
+
+    Returns:
+        float: The distance in meters.
+    """
+    lat1, lat2 = radians(y1), radians(y2)
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin(radians(x2 - x1) / 2) ** 2
+    return 2 * EARTH_RADIUS * asin(min(1.0, sqrt(a)))
+
+
+def haversine_array(x1, y1, x2, y2) -> np.ndarray:
+    """
+    Calculates the great-circle distances between EPSG:4326 coordinates, vectorized over arrays.
+
+    Args:
+        x1 (np.ndarray): Longitudes of the first points.
+        y1 (np.ndarray): Latitudes of the first points.
+        x2 (np.ndarray): Longitudes of the second points.
+        y2 (np.ndarray): Latitudes of the second points.
+
+    Returns:
+        np.ndarray: The distances in meters.
+    """
+    lat1, lat2 = np.radians(y1), np.radians(y2)
+    dlon = np.radians(np.subtract(x2, x1))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def connected_components(indptr: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """
+    Labels the connected components of a CSR graph, with vectorized hooking and pointer jumping.
+
+    Every round hooks the root of one end of every edge spanning two trees onto the smaller root of the
+    other, then flattens the trees, so only about log(n) rounds are needed.
+
+    Args:
+        indptr (np.ndarray): Offsets of every vertex's adjacency in `indices`.
+        indices (np.ndarray): Dense indices of the neighbouring vertices. The edges are taken as undirected.
+
+    Returns:
+        np.ndarray: The label of every vertex, the same for two vertices if and only if they are connected.
+    """
+    n = len(indptr) - 1
+    labels = np.arange(n, dtype=np.int64)
+    heads = np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr))
+    tails = np.asarray(indices, dtype=np.int64)
+    while True:
+        a, b = labels[heads], labels[tails]
+        spanning = a != b
+        if not spanning.any():
+            return labels
+        np.minimum.at(labels, np.maximum(a, b)[spanning], np.minimum(a, b)[spanning])
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+
+
+class RoadGraph:
+    """
+    Represents the routable road network as an in-memory, array-backed (CSR) adjacency structure.
+
+    The graph is undirected, the same way pgr_dijkstra is called in DB.find_shortest_path_between, so
+    every road segment is stored in both directions. Vertices are addressed by dense indices, the
+    original pgRouting vertex ids are kept in the sorted `vertex_ids` array.
+
+    Attributes:
+        vertex_ids (np.ndarray): Sorted pgRouting ids of the vertices.
+        x (np.ndarray): Longitudes (EPSG:4326) of the vertices.
+        y (np.ndarray): Latitudes (EPSG:4326) of the vertices.
+        indptr (np.ndarray): Offsets of every vertex's adjacency in `indices`, `weights` and `edge_ids`.
+        indices (np.ndarray): Dense indices of the neighbouring vertices.
+        weights (np.ndarray): Lengths of the road segments.
+        edge_ids (np.ndarray): osm_id of the road segments.
+        components (np.ndarray): Connected component label of every vertex, so that a search between two
+            components is rejected without exploring either.
+        method (str): The search algorithm used by shortest_path, either "dijkstra" or "astar".
+    """
+
+    def __init__(
+        self,
+        vertex_ids: np.ndarray,
+        x: np.ndarray,
+        y: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        weights: np.ndarray,
+        edge_ids: np.ndarray,
+        components: Optional[np.ndarray] = None,
+        method: str = "dijkstra",
+    ) -> None:
+        if method not in ROUTING_METHODS:
+            raise ValueError(f"Unknown routing method: {method}")
+        self.vertex_ids = vertex_ids
+        self.x = x
+        self.y = y
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.edge_ids = edge_ids
+        self.components = components if components is not None else connected_components(indptr, indices)
+        self.method = method
+        self._spans = None
+
+    @classmethod
+    def from_edges(
+        cls,
+        source: np.ndarray,
+        target: np.ndarray,
+        cost: np.ndarray,
+        edge_ids: np.ndarray,
+        vertex_ids: np.ndarray,
+        x: np.ndarray,
+        y: np.ndarray,
+        method: str = "dijkstra",
+    ) -> "RoadGraph":
+        """
+        Builds the graph from an edge list.
+
+        Args:
+            source (np.ndarray): pgRouting ids of the source vertices of the edges.
+            target (np.ndarray): pgRouting ids of the target vertices of the edges.
+            cost (np.ndarray): Costs (lengths) of the edges.
+            edge_ids (np.ndarray): osm_id of the edges.
+            vertex_ids (np.ndarray): pgRouting ids of the vertices.
+            x (np.ndarray): Longitudes of the vertices.
+            y (np.ndarray): Latitudes of the vertices.
+            method (str): The search algorithm used by shortest_path.
+
+        Returns:
+            RoadGraph: The built graph.
+        """
+        order = np.argsort(vertex_ids)
+        vertex_ids = np.asarray(vertex_ids, dtype=np.int64)[order]
+        x = np.asarray(x, dtype=np.float64)[order]
+        y = np.asarray(y, dtype=np.float64)[order]
+
+        source_idx = np.searchsorted(vertex_ids, source)
+        target_idx = np.searchsorted(vertex_ids, target)
+        heads = np.concatenate([source_idx, target_idx])
+        tails = np.concatenate([target_idx, source_idx])
+        both_costs = np.concatenate([cost, cost]).astype(np.float64)
+        both_ids = np.concatenate([edge_ids, edge_ids]).astype(np.int64)
+
+        order = np.argsort(heads, kind="stable")
+        indptr = np.zeros(len(vertex_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(heads, minlength=len(vertex_ids)), out=indptr[1:])
+        return cls(
+            vertex_ids,
+            x,
+            y,
+            indptr,
+            tails[order].astype(np.int32),
+            both_costs[order],
+            both_ids[order],
+            method=method,
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], method: str = "dijkstra") -> "RoadGraph":
+        """
+        Builds the graph from the arrays returned by to_arrays, without copying them.
+
+        Args:
+            arrays (Dict[str, np.ndarray]): The arrays, e.g. memory-mapped from a map file.
+            method (str): The search algorithm used by shortest_path.
+
+        Returns:
+            RoadGraph: The graph.
+        """
+        return cls(**arrays, method=method)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Returns the arrays the graph is built from, see from_arrays.
+
+        Returns:
+            Dict[str, np.ndarray]: The arrays by name.
+        """
+        return {
+            "vertex_ids": self.vertex_ids,
+            "x": self.x,
+            "y": self.y,
+            "indptr": self.indptr,
+            "indices": self.indices,
+            "weights": self.weights,
+            "edge_ids": self.edge_ids,
+            "components": self.components,
+        }
+
+    def __len__(self) -> int:
+        return len(self.vertex_ids)
+
+    def index_of(self, vertex_id: int) -> Optional[int]:
+        """
+        Finds the dense index of a pgRouting vertex.
+
+        Args:
+            vertex_id (int): The pgRouting id of the vertex.
+
+        Returns:
+            Optional[int]: The dense index of the vertex, or None if the vertex is not in the graph.
+        """
+        idx = int(np.searchsorted(self.vertex_ids, vertex_id))
+        if idx < len(self.vertex_ids) and self.vertex_ids[idx] == vertex_id:
+            return idx
+        return None
+
+    def spans(self, vertex_ids: np.ndarray) -> np.ndarray:
+        """
+        Finds the distance from vertices to their farthest neighbour, which bounds how far from a vertex the
+        last edge of a path to it starts.
+
+        Args:
+            vertex_ids (np.ndarray): pgRouting ids of the vertices.
+
+        Returns:
+            np.ndarray: The distances in EPSG:4326 degrees, infinity for the vertices not in the graph.
+        """
+        if self._spans is None:
+            heads = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+            lengths = np.hypot(self.x[self.indices] - self.x[heads], self.y[self.indices] - self.y[heads])
+            self._spans = np.zeros(len(self))
+            np.maximum.at(self._spans, heads, lengths)
+        vertex_ids = np.asarray(vertex_ids, dtype=np.int64)
+        if not len(self):
+            return np.full(len(vertex_ids), np.inf)
+        positions = np.searchsorted(self.vertex_ids, vertex_ids).clip(max=len(self) - 1)
+        return np.where(self.vertex_ids[positions] == vertex_ids, self._spans[positions], np.inf)
+
+    def shortest_path(self, source: int, target: int) -> Optional[Tuple[List[int], List[int], List[float]]]:
+        """
+        Finds the shortest path between two pgRouting vertices.
+
+        The result follows the rows returned by pgr_dijkstra: the i-th vertex is left through the i-th
+        edge, and the i-th aggregated cost is the cost of reaching the i-th vertex. The last vertex is
+        the target, so there is one edge less than there are vertices.
+
+        Args:
+            source (int): The pgRouting id of the source vertex.
+            target (int): The pgRouting id of the target vertex.
+
+        Returns:
+            Optional[Tuple[List[int], List[int], List[float]]]: Dense indices of the vertices, osm_id of
+            the edges and the aggregated costs. Returns None if there is no path.
+        """
+        s, t = self.index_of(source), self.index_of(target)
+        if s is None or t is None or s == t or self.components[s] != self.components[t]:
+            return None
+        _, prev = self._search(s, {t}, astar=self.method == "astar")
+        if t not in prev:
+            return None
+
+        nodes, positions = [t], []
+        while nodes[-1] != s:
+            node, position = prev[nodes[-1]]
+            nodes.append(node)
+            positions.append(position)
+        nodes.reverse()
+        positions.reverse()
+
+        agg_costs = [0.0]
+        for position in positions:
+            agg_costs.append(agg_costs[-1] + float(self.weights[position]))
+        return nodes, self.edge_ids[positions].tolist(), agg_costs
+
+    def costs_from(self, source: int, targets: List[int]) -> List[float]:
+        """
+        Finds the shortest path costs from one vertex to many with a single Dijkstra search.
+
+        The graph is undirected, so the same search answers many-to-one queries as well.
+
+        Args:
+            source (int): The pgRouting id of the source vertex.
+            targets (List[int]): The pgRouting ids of the target vertices.
+
+        Returns:
+            List[float]: The full path cost to every target, or infinity if the target is unreachable.
+        """
+        s = self.index_of(source)
+        if s is None:
+            return [float("inf")] * len(targets)
+        # targets in other components are unreachable, the search would settle its whole component for them
+        indices = [self.index_of(target) for target in targets]
+        component = self.components[s]
+        indices = [t if t is not None and self.components[t] == component else None for t in indices]
+        dist, _ = self._search(s, {t for t in indices if t is not None})
+        return [dist.get(t, float("inf")) if t is not None else float("inf") for t in indices]
+
+    def reachable_within(self, source: int, max_cost: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the vertices reachable from a vertex within a cost, with a Dijkstra search bounded by it.
+
+        Args:
+            source (int): The pgRouting id of the source vertex.
+            max_cost (float): The maximum cost (length) of the paths.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The pgRouting ids of the reachable vertices, the source included,
+            and the costs of reaching them, sorted by cost.
+        """
+        s = self.index_of(source)
+        if s is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        dist = {s: 0.0}
+        settled = {}
+        heap = [(0.0, s)]
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        while heap:
+            d, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled[u] = d
+            lo, hi = int(indptr[u]), int(indptr[u + 1])
+            for v, w in zip(indices[lo:hi].tolist(), weights[lo:hi].tolist()):
+                nd = d + w
+                if nd <= max_cost and nd < dist.get(v, float("inf")):
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        nodes = np.fromiter(settled.keys(), dtype=np.int64, count=len(settled))
+        costs = np.fromiter(settled.values(), dtype=np.float64, count=len(settled))
+        return self.vertex_ids[nodes], costs
+
+    def _search(self, s: int, targets: set, astar: bool = False) -> Tuple[dict, dict]:
+        """
+        Runs Dijkstra (or A* with a great-circle heuristic) from `s` until all `targets` are settled.
+
+        Segment lengths are measured in EPSG:3857, which never underestimates the distance on the
+        sphere, so the great-circle distance is an admissible and consistent heuristic. A* is only used
+        for a single target.
+
+        Args:
+            s (int): Dense index of the source vertex.
+            targets (set): Dense indices of the target vertices.
+            astar (bool): Whether to use the A* heuristic.
+
+        Returns:
+            Tuple[dict, dict]: Distances of the reached vertices and the mapping from a reached vertex to its
+            (predecessor, edge position) pair.
+        """
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        astar = astar and len(targets) == 1
+        if astar:
+            t = next(iter(targets))
+            tx, ty = float(self.x[t]), float(self.y[t])
+
+        def heuristic(v: int) -> float:
+            return haversine(float(self.x[v]), float(self.y[v]), tx, ty) if astar else 0.0
+
+        dist = {s: 0.0}
+        prev = {}
+        settled = set()
+        remaining = set(targets)
+        heap = [(heuristic(s), 0.0, s)]
+        while heap and remaining:
+            _, d, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled.add(u)
+            remaining.discard(u)
+            if not remaining:
+                break
+            lo, hi = int(indptr[u]), int(indptr[u + 1])
+            for position, v, w in zip(range(lo, hi), indices[lo:hi].tolist(), weights[lo:hi].tolist()):
+                nd = d + w
+                if nd < dist.get(v, float("inf")):
+                    dist[v] = nd
+                    prev[v] = (u, position)
+                    heapq.heappush(heap, (nd + heuristic(v), nd, v))
+        return dist, prev
@@ -0,0 +1,158 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from threading import Lock
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from backend.constants import METRIC_BUCKETS
+
+STAGE_METRIC = "poi_path_finder_stage_duration_seconds"
+
+
+class Histograms:
+    """
+    Represents thread-safe histograms of stage durations, rendered in the Prometheus text format.
+
+    Attributes:
+        buckets (List[float]): Upper bounds of the buckets in seconds, +Inf is implied.
+    """
+
+    def __init__(self, buckets: List[float] = METRIC_BUCKETS) -> None:
+        self.buckets = sorted(buckets)
+        self._lock = Lock()
+        self._counts: Dict[str, List[int]] = {}
+        self._sums: Dict[str, float] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """
+        Records a duration.
+
+        Args:
+            stage (str): The stage the duration belongs to.
+            seconds (float): The duration.
+        """
+        bucket = bisect_left(self.buckets, seconds)
+        with self._lock:
+            if stage not in self._counts:
+                self._counts[stage] = [0] * (len(self.buckets) + 1)
+                self._sums[stage] = 0.0
+            self._counts[stage][bucket] += 1
+            self._sums[stage] += seconds
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts.clear()
+            self._sums.clear()
+
+    def render(self) -> str:
+        """
+        Renders the histograms in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+        """
+        lines = [
+            f"# HELP {STAGE_METRIC} Time spent in every stage of solving routes.",
+            f"# TYPE {STAGE_METRIC} histogram",
+        ]
+        with self._lock:
+            stages = sorted(self._counts.items())
+            sums = dict(self._sums)
+        for stage, counts in stages:
+            cumulative = 0
+            for bound, count in zip([*map(str, self.buckets), "+Inf"], counts):
+                cumulative += count
+                lines.append(f'{STAGE_METRIC}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{STAGE_METRIC}_sum{{stage="{stage}"}} {sums[stage]}')
+            lines.append(f'{STAGE_METRIC}_count{{stage="{stage}"}} {cumulative}')
+        return "\n".join(lines) + "\n"
+
+
+histograms = Histograms()
+
+# Total duration and number of spans of every stage of the current request, set by start_request. The dict
+# is shared by the contexts copied from the request's, e.g. into the solver threads.
+_request_timings: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Times the enclosed block, recording it in the histograms and in the timings of the current request.
+
+    Args:
+        stage (str): The name of the stage.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def observe(stage: str, seconds: float) -> None:
+    """
+    Records a span measured elsewhere, in the histograms and in the timings of the current request.
+
+    Args:
+        stage (str): The name of the stage.
+        seconds (float): The duration of the span.
+    """
+    histograms.observe(stage, seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        total = timings.setdefault(stage, [0.0, 0])
+        total[0] += seconds
+        total[1] += 1
+
+
+def timed(stage: str) -> Callable:
+    """
+    Decorates a function so that every call of it is a span of the given stage.
+
+    Args:
+        stage (str): The name of the stage.
+
+    Returns:
+        Callable: The decorator.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def start_request() -> Dict[str, List[float]]:
+    """
+    Starts collecting the timings of a request in the current context.
+
+    Returns:
+        Dict[str, List[float]]: The timings, filled in as the spans of the request finish.
+    """
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing(timings: Dict[str, List[float]]) -> str:
+    """
+    Formats request timings as a Server-Timing header value.
+
+    Args:
+        timings (Dict[str, List[float]]): The timings returned by start_request.
+
+    Returns:
+        str: The header value, with the total duration in milliseconds and the number of spans per stage.
+    """
+    items: List[Tuple[str, List[float]]] = sorted(timings.items())
+    return ", ".join(
+        f'{stage};dur={seconds * 1000:.1f};desc="{count}x"' for stage, (seconds, count) in items
+    )
@@ -0,0 +1,319 @@
+from typing import Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+from backend.constants import POLYLINE_PRECISION
+
+
+def encode_polyline(x: np.ndarray, y: np.ndarray, precision: int = POLYLINE_PRECISION) -> str:
+    """
+    Encodes coordinates with the Encoded Polyline Algorithm Format (latitude first), vectorized over all
+    coordinates.
+
+    Args:
+        x (np.ndarray): The x-coordinates (longitudes) of the points.
+        y (np.ndarray): The y-coordinates (latitudes) of the points.
+        precision (int): The number of decimal places kept.
+
+    Returns:
+        str: The encoded polyline.
+    """
+    coords = np.round(np.column_stack([y, x]) * 10**precision).astype(np.int64)
+    deltas = np.diff(coords, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    values = (deltas << 1) ^ (deltas >> 63)  # zigzag, so small negative deltas stay small
+    # every value is written as 5-bit chunks, least significant first, all but the last one flagged 0x20
+    chunks = values[:, None] >> np.arange(0, 40, 5)
+    needed = chunks > 0
+    needed[:, 0] = True
+    more = np.zeros_like(needed)
+    more[:, :-1] = needed[:, 1:]
+    chars = (chunks & 0x1F) + more * 0x20 + 63
+    return chars[needed].astype(np.uint8).tobytes().decode("ascii")
+
+
+def simplify(
+    x: np.ndarray, y: np.ndarray, tolerance: float, keep: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Simplifies a line with the Douglas-Peucker algorithm, the distances of every split vectorized over the
+    points of the split part.
+
+    Args:
+        x (np.ndarray): The x-coordinates (longitudes) of the points.
+        y (np.ndarray): The y-coordinates (latitudes) of the points.
+        tolerance (float): The largest distance in meters of a dropped point from the simplified line.
+        keep (Optional[np.ndarray]): Boolean mask of the points that are always kept, e.g. POIs. The first
+            and the last point are always kept.
+
+    Returns:
+        np.ndarray: Boolean mask of the points of the simplified line.
+    """
+    n = len(x)
+    mask = np.zeros(n, dtype=bool) if keep is None else np.array(keep, dtype=bool)
+    if n < 3:
+        return np.ones(n, dtype=bool)
+    mask[[0, -1]] = True
+    # equirectangular projection to meters around the middle of the line
+    scale = 111320 * np.cos(np.radians((np.min(y) + np.max(y)) / 2))
+    px, py = np.asarray(x, dtype=np.float64) * scale, np.asarray(y, dtype=np.float64) * 111320
+    kept = np.flatnonzero(mask).tolist()
+    stack = [(lo, hi) for lo, hi in zip(kept[:-1], kept[1:]) if hi - lo > 1]
+    while stack:
+        lo, hi = stack.pop()
+        dx, dy = px[hi] - px[lo], py[hi] - py[lo]
+        rx, ry = px[lo + 1 : hi] - px[lo], py[lo + 1 : hi] - py[lo]
+        # distance to the segment, not the line through it, so parts ending where they start are split too
+        length = dx * dx + dy * dy
+        t = np.clip((rx * dx + ry * dy) / length, 0, 1) if length > 0 else np.zeros(len(rx))
+        distances = np.hypot(rx - t * dx, ry - t * dy)
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = lo + 1 + farthest
+            mask[split] = True
+            stack.extend(part for part in ((lo, split), (split, hi)) if part[1] - part[0] > 1)
+    return mask
+
+
+def zoom_tolerance(zoom: float, latitude: float) -> float:
+    """
+    Finds the simplification tolerance matching a web map zoom level, the size of one pixel of a 256 pixel
+    tile at the latitude.
+
+    Args:
+        zoom (float): The zoom level.
+        latitude (float): The latitude of the map.
+
+    Returns:
+        float: The tolerance in meters.
+    """
+    return 2 * np.pi * 6378137 * np.cos(np.radians(latitude)) / (256 * 2**zoom)
+
+
+class DBPoint:
+    """
+    Represents a point in the database.
+
+    Attributes:
+        id (int): The ID of the point.
+        x (float): The x-coordinate of the point.
+        y (float): The y-coordinate of the point.
+    """
+
+    __slots__ = ("id", "x", "y")
+
+    def __init__(self, id, x, y):
+        self.id = id
+        self.x = x
+        self.y = y
+
+    def __eq__(self, other):
+        if isinstance(other, DBPoint):
+            return self.id == other.id
+        return False
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"DBPoint(id={self.id}, x={self.x}, y={self.y})"
+
+
+class PointArray:
+    """
+    Represents an immutable sequence of points backed by id and coordinate arrays.
+
+    Indexing with an integer (and iterating) yields DBPoint objects, slicing, boolean masks and concatenation
+    return new PointArrays, so it can be used wherever a list of DBPoints was used before.
+
+    Attributes:
+        ids (np.ndarray): The IDs of the points.
+        x (np.ndarray): The x-coordinates (EPSG:4326) of the points.
+        y (np.ndarray): The y-coordinates (EPSG:4326) of the points.
+    """
+
+    __slots__ = ("ids", "x", "y")
+
+    def __init__(self, ids: Sequence[int], x: Sequence[float], y: Sequence[float]) -> None:
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+
+    @classmethod
+    def from_points(cls, points: Iterable[DBPoint]) -> "PointArray":
+        """
+        Builds a PointArray from DBPoint objects.
+
+        Args:
+            points (Iterable[DBPoint]): The points.
+
+        Returns:
+            PointArray: The built array.
+        """
+        if isinstance(points, PointArray):
+            return points
+        points = list(points)
+        return cls([p.id for p in points], [p.x for p in points], [p.y for p in points])
+
+    @classmethod
+    def concat(cls, parts: List[Union["PointArray", List[DBPoint]]]) -> "PointArray":
+        """
+        Concatenates PointArrays (or lists of DBPoints) with one copy of every array.
+
+        Args:
+            parts (List[Union[PointArray, List[DBPoint]]]): The parts to concatenate.
+
+        Returns:
+            PointArray: The concatenated array.
+        """
+        parts = [cls.from_points(part) for part in parts]
+        if not parts:
+            return cls([], [], [])
+        return cls(
+            np.concatenate([part.ids for part in parts]),
+            np.concatenate([part.x for part in parts]),
+            np.concatenate([part.y for part in parts]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, key: Union[int, slice, np.ndarray]) -> Union[DBPoint, "PointArray"]:
+        if isinstance(key, (slice, np.ndarray)):
+            return PointArray(self.ids[key], self.x[key], self.y[key])
+        return DBPoint(int(self.ids[key]), float(self.x[key]), float(self.y[key]))
+
+    def __iter__(self) -> Iterator[DBPoint]:
+        for id, x, y in zip(self.ids.tolist(), self.x.tolist(), self.y.tolist()):
+            yield DBPoint(id, x, y)
+
+    def __add__(self, other: Union["PointArray", List[DBPoint]]) -> "PointArray":
+        return PointArray.concat([self, other])
+
+    def __contains__(self, point: DBPoint) -> bool:
+        return isinstance(point, DBPoint) and bool(np.any(self.ids == point.id))
+
+    def __repr__(self) -> str:
+        return f"PointArray(n={len(self)})"
+
+
+class Route:
+    """
+    Represents a path built leg by leg, e.g. the current path of a PathFinder.
+
+    Appending a leg returns a new Route that shares the legs before it instead of copying them, so it takes
+    time in the length of the leg only and earlier Routes (e.g. snapshots of a search) stay valid. The IDs
+    of every leg are kept in a set, built once and shared by the Routes extending it, so checking if points
+    are on the route does not scan it. The points are concatenated into a PointArray once, when they are
+    first needed.
+
+    Attributes:
+        leg (PointArray): The last leg of the route.
+        parent (Optional[Route]): The route before the last leg, or None for the first one.
+    """
+
+    __slots__ = ("leg", "parent", "_ids", "_length", "_points")
+
+    def __init__(self, leg: Union[PointArray, List[DBPoint]], parent: Optional["Route"] = None) -> None:
+        self.leg = PointArray.from_points(leg)
+        self.parent = parent
+        self._ids = None  # set of the IDs of the leg, built when first needed
+        self._length = len(self.leg) + (len(parent) if parent is not None else 0)
+        self._points = None
+
+    def append(self, leg: Union[PointArray, List[DBPoint]]) -> "Route":
+        """
+        Extends the route with a leg.
+
+        Args:
+            leg (Union[PointArray, List[DBPoint]]): The points to append.
+
+        Returns:
+            Route: The extended route, this one is left unchanged.
+        """
+        return Route(leg, self)
+
+    def legs(self) -> List[PointArray]:
+        """
+        Returns the legs of the route, first to last.
+
+        Returns:
+            List[PointArray]: The legs.
+        """
+        legs, route = [], self
+        while route is not None:
+            legs.append(route.leg)
+            route = route.parent
+        return legs[::-1]
+
+    def since(self, start: int) -> PointArray:
+        """
+        Returns the points from an index to the end, copying only the legs they are in.
+
+        Args:
+            start (int): The index of the first point.
+
+        Returns:
+            PointArray: The points.
+        """
+        legs, route = [], self
+        while route is not None and len(route) > start:
+            legs.append(route.leg)
+            route = route.parent
+        skip = start - (len(route) if route is not None else 0)
+        return PointArray.concat(legs[::-1])[skip:]
+
+    def visited(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Checks which points are on the route.
+
+        Args:
+            ids (np.ndarray): The IDs of the points.
+
+        Returns:
+            np.ndarray: Boolean mask of the points on the route.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        candidates, found, route = set(ids.tolist()), set(), self
+        while route is not None:
+            if route._ids is None:
+                route._ids = set(route.leg.ids.tolist())
+            found |= candidates & route._ids
+            route = route.parent
+        # usually only a few points are on the route, e.g. the POIs already visited
+        return np.isin(ids, list(found)) if found else np.zeros(len(ids), dtype=bool)
+
+    @property
+    def points(self) -> PointArray:
+        """The points of the route, concatenated on first use."""
+        if self._points is None:
+            self._points = PointArray.concat(self.legs()) if self.parent is not None else self.leg
+        return self._points
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self.points.ids
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.points.x
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.points.y
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, key: Union[int, slice, np.ndarray]) -> Union[DBPoint, PointArray]:
+        if isinstance(key, int) and key == -1 and len(self.leg):
+            return self.leg[-1]
+        return self.points[key]
+
+    def __iter__(self) -> Iterator[DBPoint]:
+        return iter(self.points)
+
+    def __contains__(self, point: DBPoint) -> bool:
+        return isinstance(point, DBPoint) and bool(self.visited(np.array([point.id]))[0])
+
+    def __repr__(self) -> str:
+        return f"Route(n={len(self)}, legs={len(self.legs())})"
@@ -1,10 +1,33 @@
-from backend.db import DB, DBPoint
+import time
+
+import numpy as np
+
+from backend.db import DB, DBPoint, PointArray
+from backend.path import Route
 from backend.api.schemas import POI, MapPoint
 from backend.constants import VELOCITY, ALPHA, BETA
-from typing import List
+from backend.graph import haversine_array
+from backend.metrics import span
+from backend.storage import Storage
+from backend.strategies import STRATEGIES
+from typing import Callable, Dict, List, Optional, Tuple
 
 
 class PathFinder:
+    # attributes describing the current path, see snapshot
+    STATE = (
+        "curr_path",
+        "curr_cost",
+        "curr_time",
+        "curr_pois",
+        "curr_additional_distance",
+        "curr_additional_time",
+        "last_valid_path_between_next",
+        "last_valid_cost_between_next",
+        "max_distance",
+        "max_time",
+    )
+
     def __init__(
         self,
         start: MapPoint,
@@ -13,6 +36,15 @@ class PathFinder:
         max_distance: float,
         max_num_pois: int,
         pois_order: List[POI],
+        db: Optional[Storage] = None,
+        scoring: str = "bound",
+        listener: Optional[Callable[[str, PointArray, Optional[tuple]], None]] = None,
+        strategy: str = "greedy",
+        time_budget: Optional[float] = None,
+        candidates: str = "annulus",
+        prepared: Optional[Tuple[DBPoint, DBPoint, PointArray, float]] = None,
+        resume: Optional[List[dict]] = None,
+        candidate_cache: Optional[Dict[tuple, tuple]] = None,
     ):
         """
         Initializes a PathFinder object.
@@ -23,14 +55,47 @@ class PathFinder:
             max_time (float): The maximum time allowed to add to  the path in minutes.
             max_distance (float): The maximum distance allowed to add to the path in kilometers.
             max_num_pois (int): The maximum number of Points of Interest (POIs) to visit.
+            db (Storage, optional): The map storage to query, a DB or a LocalDB, shared between PathFinders.
+                A new DB is created if not given.
+            scoring (str, optional): How POI candidates are ranked, "bound" (default) uses the lower bound
+                of the additional distance (see lower_bounds), "heuristic" uses calculate_heuristic, "detour"
+                uses the network detour of every candidate, found with two batched searches.
+            listener (Callable, optional): Called with an event name, a part of the path and the accepted POI
+                (or None) as the path is built: "shortest" with the shortest path once it is found, "poi"
+                with the leg ending at every accepted POI and "end" with the last leg. The "poi" and "end"
+                legs together make up the final path.
+            strategy (str, optional): How POIs are chosen, one of STRATEGIES: "greedy" adds the best scored
+                candidate until one does not fit, "beam" searches several paths at once.
+            time_budget (float, optional): Time in seconds after which no more POIs are tried and the best
+                path found so far is returned. Searches already started are finished.
+            candidates (str, optional): How POI candidates are found, "annulus" by their straight-line
+                distance (get_valid_points), "isochrone" by their network distance found with one bounded
+                search (get_reachable_points).
+            prepared (tuple, optional): The snapped start and end and the shortest path between them with its
+                cost, as in the `prepared` attribute of an earlier PathFinder with the same start and end, so
+                they are not searched again.
+            resume (List[dict], optional): The `history` of an earlier greedy PathFinder with the same
+                budgets, cut after the POIs it shares with this one. The path is built on from the last
+                snapshot instead of from the start.
+            candidate_cache (Dict[tuple, tuple], optional): Ranked candidates of rank_candidates by the POIs
+                on the path, the next POI and the remaining budgets, shared between PathFinders of the same
+                route, so the same candidates are not searched and scored again.
         """
-        self.db = DB()
+        self.deadline = time.monotonic() + time_budget if time_budget is not None else None
+        self.db = db if db is not None else DB()
 
-        # At first find the start and end point in the database
-        self.start = self.db.get_nearest_point(start)  # DBPoint
-        self.end = self.db.get_nearest_point(end)  # DBPoint
-        # Then find the shortest path between them
-        self.shortest_path, self.shortest_cost = self.db.find_shortest_path_between(self.start, self.end)
+        if prepared is not None:
+            self.start, self.end, self.shortest_path, self.shortest_cost = prepared
+        else:
+            # At first find the start and end point in the database
+            self.start = self.db.get_nearest_point(start)  # DBPoint
+            self.end = self.db.get_nearest_point(end)  # DBPoint
+            # Then find the shortest path between them
+            self.shortest_path, self.shortest_cost = self.db.find_shortest_path_between(self.start, self.end)
+        self.prepared = (self.start, self.end, self.shortest_path, self.shortest_cost)
+        self.listener = listener
+        if self.listener is not None:
+            self.listener("shortest", self.shortest_path, None)
 
         self.max_time = max_time * 60  # to seconds
         self.max_distance = max_distance * 1000  # to meters
@@ -39,7 +104,8 @@ class PathFinder:
         self.shortest_line_a = (self.start.y - self.end.y) / (self.start.x - self.end.x)
         self.shortest_line_b = self.start.y - self.shortest_line_a * self.start.x
 
-        self.curr_path = [self.start]
+        self.curr_path = Route([self.start])
+        self.emitted = 0  # number of points of the current path passed to the listener
         self.curr_cost = 0
         self.curr_additional_distance = 0
         self.curr_additional_time = 0
@@ -47,62 +113,209 @@ class PathFinder:
         self.curr_pois = []
 
         self.last_valid_path_between_next = []
+        self.last_valid_cost_between_next = 0
 
         self.pois_order = pois_order
+        self.scoring = scoring
+        self.strategy = strategy
+        self.candidates = candidates
+        self.candidate_cache = candidate_cache
+        self.pruned_candidates = 0  # candidates that cannot fit, discarded without searching their legs
+        self.searches_avoided = 0  # searches the pruned candidates would have taken, see count_avoided
+        # positions of the candidates of the last rank_candidates in the ranking of all of them, pruned ones
+        # included, and the number of all of them
+        self.candidate_ranks = np.empty(0, dtype=np.int64)
+        self.candidate_total = 0
+        # snapshots of the path with 0, 1, ... POIs, taken by the greedy strategy, see resume
+        self.history = list(resume) if resume else [self.snapshot()]
+        self.restore(self.history[-1])
 
         self.find_path()
 
     def find_path(self):
         """
-        Finds the optimal path by selecting the next POI to visit until the maximum number of POIs is reached.
+        Finds the optimal path by selecting the POIs to visit with the strategy, until the maximum number of
+        POIs is reached or the time budget runs out.
         """
-        while len(self.curr_pois) < self.max_pois:
-            next_poi = self.select_next_poi()
-            if next_poi is None:
-                break
+        STRATEGIES[self.strategy]().solve(self)
+        print(f"Candidates | Discarded {self.pruned_candidates}, {self.searches_avoided} searches avoided")
 
         if len(self.last_valid_path_between_next):
-            self.curr_path.extend(self.last_valid_path_between_next[:-1])
+            self.curr_path = self.curr_path.append(
+                PointArray.concat([self.last_valid_path_between_next[:-1], [self.end]])
+            )
             self.curr_cost += self.last_valid_cost_between_next
             self.curr_time += self.last_valid_cost_between_next / VELOCITY
         else:
-            self.curr_path = self.shortest_path[:-1]
+            self.curr_path = Route(PointArray.concat([self.shortest_path[:-1], [self.end]]))
             self.curr_cost = self.shortest_cost
             self.curr_time = self.shortest_cost / VELOCITY
+            self.emitted = 0  # no POI was accepted, the path starts over
+        self.emit("end")
 
-        self.curr_path.append(self.end)
+    def emit(self, event: str, poi: Optional[tuple] = None, end: Optional[int] = None):
+        """
+        Passes the part of the current path added since the last event to the listener.
 
-    def select_next_poi(self):
+        Args:
+            event (str): The name of the event.
+            poi (tuple, optional): The accepted POI, as stored in curr_pois.
+            end (int, optional): Index in the current path at which the part ends, the end of the path if not
+                given.
         """
-        Selects the next Point of Interest (POI) to visit.
+        if self.listener is None:
+            return
+        end = len(self.curr_path) if end is None else end
+        if end == len(self.curr_path):
+            leg = self.curr_path.since(self.emitted)
+        else:
+            leg = self.curr_path[self.emitted : end]
+        self.emitted = end
+        self.listener(event, leg, poi)
+
+    def emit_pois(self):
+        """
+        Passes the legs ending at every POI of the current path to the listener, for strategies that only
+        know the path once they are done.
+        """
+        for poi in self.curr_pois:
+            index = self.emitted + int(np.flatnonzero(self.curr_path.ids[self.emitted :] == poi[0].id)[0])
+            self.emit("poi", poi, index + 1)
+
+    def out_of_time(self) -> bool:
+        """
+        Checks if the time budget has run out.
 
         Returns:
-            next_poi (POI): The next POI to visit.
+            bool: True if no more POIs should be tried.
+        """
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def snapshot(self) -> dict:
+        """
+        Takes a snapshot of the state of the current path, for strategies that try several paths.
+
+        Returns:
+            dict: The snapshot.
+        """
+        state = {attribute: getattr(self, attribute) for attribute in self.STATE}
+        state["curr_pois"] = list(self.curr_pois)
+        return state
+
+    def restore(self, state: dict):
+        """
+        Restores the state of the current path taken by snapshot.
+
+        Args:
+            state (dict): The snapshot.
+        """
+        for attribute, value in state.items():
+            setattr(self, attribute, value)
+        self.curr_pois = list(self.curr_pois)
+
+    def rank_candidates(self) -> PointArray:
+        """
+        Finds the POI candidates for the next POI, best scored first, memoized in the candidate cache if
+        there is one. Their positions among all the ranked candidates are kept for count_avoided.
+
+        Returns:
+            PointArray: The candidates, without the ones already on the path, that cannot fit or that cannot
+            be reached.
+        """
+        poi = self.pois_order[len(self.curr_pois)]
+        visited = tuple(visited_poi[0].id for visited_poi in self.curr_pois)
+        key = (visited, poi.type, poi.visit_time, self.max_distance, self.max_time)
+        if self.candidate_cache is not None and key in self.candidate_cache:
+            ranking = self.candidate_cache[key]
+        else:
+            ranking = self._rank_candidates()
+            if self.candidate_cache is not None:
+                self.candidate_cache[key] = ranking
+        ranked, self.candidate_ranks, self.candidate_total = ranking
+        return ranked
+
+    def count_avoided(self, tried: int):
         """
+        Counts the searches avoided by pruning, two for every pruned candidate among the first `tried` of all
+        the candidates of the last rank_candidates, i.e. the ones that would have been tried without pruning.
+
+        Args:
+            tried (int): Number of candidates that would have been tried.
+        """
+        tried = min(tried, self.candidate_total)
+        self.searches_avoided += 2 * (tried - int(np.count_nonzero(self.candidate_ranks < tried)))
+
+    def _rank_candidates(self) -> Tuple[PointArray, np.ndarray, int]:
         # List of POI candidates
-        pois = self.db.get_valid_points(
+        find = self.db.get_reachable_points if self.candidates == "isochrone" else self.db.get_valid_points
+        pois = find(
             self.curr_path[-1],
             self.max_distance,
             self.max_time,
             self.pois_order[len(self.curr_pois)].visit_time * 60,
             self.pois_order[len(self.curr_pois)].type.lower().replace(" ", "_"),
         )
+        if not pois:
+            return pois, np.empty(0, dtype=np.int64), 0
+        with span("candidate_scoring"):
+            candidates = pois[~self.curr_path.visited(pois.ids)]
+            bounds = self.lower_bounds(candidates)
+            fits = (bounds <= self.max_distance) & (bounds / VELOCITY <= self.max_time)
+            self.pruned_candidates += int(np.count_nonzero(~fits))
+            if self.scoring == "detour":
+                # the detours of the pruned candidates would take searches, so they are left out of the
+                # ranking and their searches are not counted as avoided
+                candidates, bounds, fits = candidates[fits], bounds[fits], fits[fits]
+            if self.scoring == "bound":
+                scores = bounds
+            else:
+                scores = np.asarray(self.score_candidates(candidates), dtype=np.float64)
+            order = np.argsort(scores, kind="stable")
+            order = order[np.isfinite(scores[order])]
+            kept = fits[order]
+        return candidates[order[kept]], np.flatnonzero(kept), len(order)
+
+    def select_next_poi(self):
+        """
+        Selects the next Point of Interest (POI) to visit.
+
+        Returns:
+            next_poi (POI): The next POI to visit.
+        """
+        # Try the candidates that may fit, best scored first, until one does
+        for i, next_poi in enumerate(self.rank_candidates()):
+            accepted = self.update_path(next_poi)
+            if accepted or self.out_of_time():
+                self.count_avoided(int(self.candidate_ranks[i]) + 1)
+                return next_poi if accepted else None
+        self.count_avoided(self.candidate_total)
+        return None
+
+    def lower_bounds(self, candidates: PointArray) -> np.ndarray:
+        """
+        Calculates a lower bound of the additional distance of the path through every candidate, so
+        candidates that cannot fit are discarded before searching.
 
-        # Find the POI with the lowest heuristic
-        lowest_heuristic = float("inf")
-        next_poi = None
+        The cost of a leg runs from the source vertex of its start to the start of the last edge to the
+        target vertex of its end, along roads no shorter than the great-circle distances. So a leg costs at
+        least the great-circle distance between its points less how far from them these vertices can be,
+        see Storage.snap_reaches.
 
-        if pois:
-            for poi in pois:
-                if poi not in self.curr_path:
-                    heuristic = self.calculate_heuristic(poi)
-                    if heuristic < lowest_heuristic:
-                        lowest_heuristic = heuristic
-                        next_poi = poi
-        if not next_poi or not self.update_path(next_poi):
-            return None
+        Args:
+            candidates (PointArray): The POI candidates.
 
-        return next_poi
+        Returns:
+            np.ndarray: The lower bound of every candidate in meters.
+        """
+        last = self.curr_path[-1]
+        reach_from, reach_to = self.db.snap_reaches(PointArray.concat([[last, self.end], candidates]))
+        cost_prev = haversine_array(last.x, last.y, candidates.x, candidates.y) - (
+            reach_from[0] + reach_to[2:]
+        )
+        cost_next = haversine_array(candidates.x, candidates.y, self.end.x, self.end.y) - (
+            reach_from[2:] + reach_to[1]
+        )
+        return self.curr_cost + np.maximum(cost_prev, 0) + np.maximum(cost_next, 0) - self.shortest_cost
 
     def update_path(self, new_point: DBPoint):
         """
@@ -138,7 +351,7 @@ class PathFinder:
             return False
         else:
             # Add POI to the current path and update the current cost and time
-            self.curr_path.extend(path_between_prev[:-1] + [new_point])
+            self.curr_path = self.curr_path.append(PointArray.concat([path_between_prev[:-1], [new_point]]))
             self.curr_cost += cost_between_prev
             self.curr_time += cost_between_prev / VELOCITY
             self.last_valid_path_between_next = path_between_next
@@ -156,8 +369,31 @@ class PathFinder:
                     self.curr_time,
                 )
             )
+            self.emit("poi", self.curr_pois[-1])
             return True
 
+    def score_candidates(self, candidates: PointArray) -> List[float]:
+        """
+        Scores POI candidates, the lower the score the better the candidate.
+
+        Args:
+            candidates (PointArray): The POI candidates.
+
+        Returns:
+            List[float]: The score of every candidate.
+        """
+        if self.scoring == "detour":
+            # network cost of going through the candidate, the cost of the direct way is the same for all
+            costs_prev = self.db.get_costs_from(self.curr_path[-1], candidates, self.end)
+            costs_next = self.db.get_costs_to(candidates, self.end)
+            return [cost_prev + cost_next for cost_prev, cost_next in zip(costs_prev, costs_next)]
+        # calculate_heuristic for all candidates at once
+        a = np.abs(self.shortest_line_a * candidates.x - candidates.y + self.shortest_line_b) / (
+            (self.shortest_line_a**2 + 1) ** 0.5
+        )
+        b = np.hypot(self.end.x - candidates.x, self.end.y - candidates.y)
+        return (ALPHA * a + BETA * b).tolist()
+
     def calculate_heuristic(self, new_point: DBPoint):
         """
         Calculates the heuristic value for a given POI.
@@ -0,0 +1,204 @@
+import argparse
+
+from sqlalchemy import text
+
+from backend.constants import (
+    INIT_BUFFER_DIJKSTRA,
+    INIT_BUFFER_RADIUS,
+    MAX_BUFFER_RADIUS,
+)
+from backend.db import DB, ROAD_TYPES_SQL
+from backend.spatial import last_radius
+
+# Precomputed EPSG:4326 geometries, so the spatial predicates in DB compare an indexed column instead of
+# transforming every row. The columns are generated, so they stay in sync with osm2pgsql --append updates.
+MIGRATIONS = [
+    """
+    ALTER TABLE planet_osm_point
+    ADD COLUMN IF NOT EXISTS geom_4326 geometry(Point, 4326)
+    GENERATED ALWAYS AS (ST_Transform(way, 4326)) STORED;
+    """,
+    """
+    ALTER TABLE planet_osm_line
+    ADD COLUMN IF NOT EXISTS start_4326 geometry(Point, 4326)
+    GENERATED ALWAYS AS (ST_Transform(ST_StartPoint(way), 4326)) STORED;
+    """,
+    """
+    ALTER TABLE planet_osm_line
+    ADD COLUMN IF NOT EXISTS end_4326 geometry(Point, 4326)
+    GENERATED ALWAYS AS (ST_Transform(ST_EndPoint(way), 4326)) STORED;
+    """,
+    "CREATE INDEX IF NOT EXISTS planet_osm_point_geom_4326_idx ON planet_osm_point USING GIST (geom_4326);",
+    """
+    CREATE INDEX IF NOT EXISTS planet_osm_point_amenity_geom_4326_idx
+    ON planet_osm_point USING GIST (geom_4326) WHERE amenity IS NOT NULL;
+    """,
+    "CREATE INDEX IF NOT EXISTS planet_osm_point_amenity_idx ON planet_osm_point (amenity) WHERE amenity IS NOT NULL;",
+    "CREATE INDEX IF NOT EXISTS planet_osm_point_osm_id_idx ON planet_osm_point (osm_id);",
+    f"""
+    CREATE INDEX IF NOT EXISTS planet_osm_line_start_4326_idx
+    ON planet_osm_line USING GIST (start_4326) WHERE highway IN {ROAD_TYPES_SQL};
+    """,
+    f"""
+    CREATE INDEX IF NOT EXISTS planet_osm_line_end_4326_idx
+    ON planet_osm_line USING GIST (end_4326) WHERE highway IN {ROAD_TYPES_SQL};
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS planet_osm_line_highway_way_idx
+    ON planet_osm_line USING GIST (way) WHERE highway IS NOT NULL;
+    """,
+    "CREATE INDEX IF NOT EXISTS planet_osm_line_source_idx ON planet_osm_line (source);",
+    "CREATE INDEX IF NOT EXISTS planet_osm_line_target_idx ON planet_osm_line (target);",
+    # Connected component of every road vertex, so that DB rejects a leg between two components without
+    # searching. Unlike the generated columns, the labels are only refreshed by running the migration again.
+    "ALTER TABLE planet_osm_line_vertices_pgr ADD COLUMN IF NOT EXISTS component bigint;",
+    """
+    UPDATE planet_osm_line_vertices_pgr AS v
+    SET component = c.component
+    FROM pgr_connectedComponents(
+        'SELECT osm_id AS id, source, target, ST_Length(way) AS cost
+        FROM planet_osm_line
+        WHERE highway IS NOT NULL AND source IS NOT NULL AND target IS NOT NULL'
+    ) AS c
+    WHERE v.id = c.node AND v.component IS DISTINCT FROM c.component;
+    """,
+    # Road vertices pre-snapped for every amenity point, as DB snaps them. The snapping statements of DB look
+    # them up by osm_id, and POI_SNAP_ENGINE=memory loads them at startup. The source depends on the
+    # destination of a leg, so all candidate sources are kept with the end points of their roads for the
+    # tie-break. The span of a target is the distance to its farthest neighbouring vertex. Rebuilt from
+    # scratch on every run, i.e. after every import.
+    """
+    CREATE TABLE IF NOT EXISTS poi_road_targets (
+        osm_id bigint, target bigint, distance double precision, component bigint
+    );
+    """,
+    "ALTER TABLE poi_road_targets ADD COLUMN IF NOT EXISTS span double precision;",
+    """
+    CREATE TABLE IF NOT EXISTS poi_road_sources (
+        osm_id bigint, source bigint, distance double precision, component bigint,
+        end_x double precision, end_y double precision
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS poi_road_targets_osm_id_idx ON poi_road_targets (osm_id);",
+    "CREATE INDEX IF NOT EXISTS poi_road_sources_osm_id_idx ON poi_road_sources (osm_id);",
+    "TRUNCATE poi_road_targets, poi_road_sources;",
+    f"""
+    INSERT INTO poi_road_targets (osm_id, target, distance, component, span)
+    SELECT DISTINCT ON (p.osm_id) p.osm_id, t.target, t.distance, v.component, span.span
+    FROM planet_osm_point AS p
+    CROSS JOIN LATERAL (
+        SELECT r.target, ST_Distance(r.end_4326, p.geom_4326) AS distance
+        FROM planet_osm_line AS r
+        WHERE r.highway IN {ROAD_TYPES_SQL}
+        AND ST_DWithin(r.end_4326, p.geom_4326, {last_radius(INIT_BUFFER_DIJKSTRA, MAX_BUFFER_RADIUS)})
+        ORDER BY distance
+        LIMIT 1
+    ) AS t
+    CROSS JOIN LATERAL (
+        SELECT max(ST_Distance(l.start_4326, l.end_4326)) AS span
+        FROM planet_osm_line AS l
+        WHERE l.highway IS NOT NULL AND (l.source = t.target OR l.target = t.target)
+    ) AS span
+    LEFT JOIN planet_osm_line_vertices_pgr AS v ON v.id = t.target
+    WHERE p.amenity IS NOT NULL
+    ORDER BY p.osm_id;
+    """,
+    f"""
+    INSERT INTO poi_road_sources (osm_id, source, distance, component, end_x, end_y)
+    SELECT p.osm_id, r.source, ST_Distance(r.start_4326, p.geom_4326), v.component,
+        ST_X(r.end_4326), ST_Y(r.end_4326)
+    FROM (
+        SELECT DISTINCT ON (osm_id) osm_id, geom_4326
+        FROM planet_osm_point
+        WHERE amenity IS NOT NULL
+        ORDER BY osm_id
+    ) AS p
+    CROSS JOIN LATERAL (
+        SELECT min(ST_Distance(r.start_4326, p.geom_4326)) AS distance
+        FROM planet_osm_line AS r
+        WHERE r.highway IN {ROAD_TYPES_SQL}
+        AND ST_DWithin(r.start_4326, p.geom_4326, {last_radius(INIT_BUFFER_RADIUS, MAX_BUFFER_RADIUS)})
+    ) AS nearest
+    JOIN planet_osm_line AS r
+    ON r.highway IN {ROAD_TYPES_SQL}
+    AND ST_DWithin(
+        r.start_4326,
+        p.geom_4326,
+        {INIT_BUFFER_RADIUS} * power(2, ceil(log(2, (greatest(nearest.distance, {INIT_BUFFER_RADIUS}) / {INIT_BUFFER_RADIUS})::numeric)))
+    )
+    LEFT JOIN planet_osm_line_vertices_pgr AS v ON v.id = r.source;
+    """,
+    "ANALYZE planet_osm_point;",
+    "ANALYZE planet_osm_line;",
+    "ANALYZE planet_osm_line_vertices_pgr;",
+    "ANALYZE poi_road_targets;",
+    "ANALYZE poi_road_sources;",
+]
+
+# Representative spatial predicates of DB, used to check that the planner picks the indexes
+EXPLAIN_QUERIES = {
+    "nearest point": """
+    SELECT osm_id FROM planet_osm_point
+    WHERE ST_DWithin(geom_4326, ST_SetSRID(ST_MakePoint(21.0, 52.2), 4326), 0.001)
+    ORDER BY ST_Distance(geom_4326, ST_SetSRID(ST_MakePoint(21.0, 52.2), 4326)) LIMIT 1;
+    """,
+    "nearest source": f"""
+    SELECT source FROM planet_osm_line
+    WHERE highway IN {ROAD_TYPES_SQL}
+    AND ST_DWithin(start_4326, ST_SetSRID(ST_MakePoint(21.0, 52.2), 4326), 0.001);
+    """,
+    "nearest target": f"""
+    SELECT target FROM planet_osm_line
+    WHERE highway IN {ROAD_TYPES_SQL}
+    AND ST_DWithin(end_4326, ST_SetSRID(ST_MakePoint(21.0, 52.2), 4326), 0.01);
+    """,
+    "valid points": """
+    SELECT osm_id FROM planet_osm_point
+    WHERE ST_DWithin(geom_4326, ST_SetSRID(ST_MakePoint(21.0, 52.2), 4326), 0.05)
+    AND amenity = 'cafe';
+    """,
+}
+
+
+def migrate(db: DB) -> None:
+    """
+    Adds the precomputed geometry columns and the indexes used by DB queries.
+
+    Args:
+        db (DB): The database to migrate.
+    """
+    with db._engine.begin() as connection:
+        for statement in MIGRATIONS:
+            print(f"Schema | {' '.join(statement.split())[:100]}")
+            connection.execute(text(statement))
+
+
+def explain(db: DB) -> None:
+    """
+    Prints the query plans of the representative DB queries.
+
+    Args:
+        db (DB): The database to inspect.
+    """
+    with db._engine.connect() as connection:
+        for name, query in EXPLAIN_QUERIES.items():
+            print(f"Schema | EXPLAIN {name}")
+            for row in connection.execute(text(f"EXPLAIN {query}")):
+                print(f"    {row[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add indexed geometry columns used by the backend queries")
+    parser.add_argument(
+        "--explain", action="store_true", help="Print the plans of the main queries afterwards"
+    )
+    args = parser.parse_args()
+
+    db = DB()
+    migrate(db)
+    if args.explain:
+        explain(db)
+
+
+if __name__ == "__main__":
+    main()
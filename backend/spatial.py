@@ -0,0 +1,695 @@
+import heapq
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+LEAF_SIZE = 32
+
+
+def last_radius(init_radius: float, max_radius: float) -> float:
+    """
+    Finds the largest radius tried by the doubling radius loops in DB.
+
+    Args:
+        init_radius (float): The initial radius of the loop.
+        max_radius (float): The radius at which the loop stops.
+
+    Returns:
+        float: The last radius tried.
+    """
+    radius = init_radius
+    while radius * 2 < max_radius:
+        radius *= 2
+    return radius
+
+
+def doubled_radius(distance: float, init_radius: float) -> float:
+    """
+    Finds the first radius of the doubling radius loops in DB that contains the given distance.
+
+    Args:
+        distance (float): The distance to contain.
+        init_radius (float): The initial radius of the loop.
+
+    Returns:
+        float: The radius.
+    """
+    radius = init_radius
+    while radius < distance:
+        radius *= 2
+    return radius
+
+
+class KDTree:
+    """
+    Represents a static 2D KD-tree with bucketed leaves, stored in flat NumPy arrays.
+
+    Attributes:
+        x (np.ndarray): The x-coordinates of the points, reordered so every node covers a contiguous range.
+        y (np.ndarray): The y-coordinates of the points, in the same order as `x`.
+        order (np.ndarray): Original position of every reordered point.
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, leaf_size: int = LEAF_SIZE) -> None:
+        order = np.arange(len(x))
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        nodes = []  # [start, end, left, right, min_x, min_y, max_x, max_y]
+        stack = [(0, len(x), -1, 0)]
+        while stack:
+            start, end, parent, side = stack.pop()
+            node = len(nodes)
+            if parent >= 0:
+                nodes[parent][2 + side] = node
+            xs, ys = x[order[start:end]], y[order[start:end]]
+            if end > start:
+                nodes.append([start, end, -1, -1, xs.min(), ys.min(), xs.max(), ys.max()])
+            else:
+                nodes.append([start, end, -1, -1, np.inf, np.inf, -np.inf, -np.inf])
+            if end - start <= leaf_size:
+                continue
+            values = xs if xs.max() - xs.min() >= ys.max() - ys.min() else ys
+            mid = (end - start) // 2
+            order[start:end] = order[start:end][np.argpartition(values, mid)]
+            stack.append((start + mid, end, node, 1))
+            stack.append((start, start + mid, node, 0))
+
+        self.order = order
+        self.x = x[order]
+        self.y = y[order]
+        self._nodes = np.array(nodes, dtype=np.float64).reshape(-1, 8)
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "KDTree":
+        """
+        Restores a tree from the arrays returned by to_arrays, without rebuilding it or copying the points.
+
+        Args:
+            arrays (Dict[str, np.ndarray]): The arrays, e.g. memory-mapped from a map file.
+
+        Returns:
+            KDTree: The tree.
+        """
+        tree = cls.__new__(cls)
+        tree.order, tree.x, tree.y, tree._nodes = arrays["order"], arrays["x"], arrays["y"], arrays["nodes"]
+        return tree
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Returns the arrays of the tree, see from_arrays.
+
+        Returns:
+            Dict[str, np.ndarray]: The arrays by name.
+        """
+        return {"order": self.order, "x": self.x, "y": self.y, "nodes": self._nodes}
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def _node(self, node: int) -> Tuple[int, int, int, int]:
+        # a row is read only when a query visits it, so that a memory-mapped tree is not paged in up front
+        start, end, left, right = self._nodes[node, :4].tolist()
+        return int(start), int(end), int(left), int(right)
+
+    def _box_distance(self, node: int, x: float, y: float) -> float:
+        min_x, min_y, max_x, max_y = self._nodes[node, 4:].tolist()
+        dx = max(min_x - x, 0.0, x - max_x)
+        dy = max(min_y - y, 0.0, y - max_y)
+        return (dx * dx + dy * dy) ** 0.5
+
+    def nearest(self, x: float, y: float) -> Optional[Tuple[int, float]]:
+        """
+        Finds the nearest point.
+
+        Args:
+            x (float): The x-coordinate of the query.
+            y (float): The y-coordinate of the query.
+
+        Returns:
+            Optional[Tuple[int, float]]: Original position of the nearest point and its distance, or None if
+            the tree is empty.
+        """
+        if not len(self):
+            return None
+        best, best_distance = -1, np.inf
+        heap = [(0.0, 0)]
+        while heap:
+            box_distance, node = heapq.heappop(heap)
+            if box_distance >= best_distance:
+                break
+            start, end, left, right = self._node(node)
+            if left < 0:
+                distances = np.hypot(self.x[start:end] - x, self.y[start:end] - y)
+                i = int(np.argmin(distances))
+                if distances[i] < best_distance:
+                    best, best_distance = start + i, float(distances[i])
+                continue
+            for child in (left, right):
+                heapq.heappush(heap, (self._box_distance(child, x, y), child))
+        return int(self.order[best]), best_distance
+
+    def within(self, x: float, y: float, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds all points within the given radius.
+
+        Args:
+            x (float): The x-coordinate of the query.
+            y (float): The y-coordinate of the query.
+            radius (float): The radius of the query.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Original positions of the points and their distances.
+        """
+        positions, distances = [], []
+        stack = [0] if len(self) else []
+        while stack:
+            node = stack.pop()
+            if self._box_distance(node, x, y) > radius:
+                continue
+            start, end, left, right = self._node(node)
+            if left < 0:
+                leaf_distances = np.hypot(self.x[start:end] - x, self.y[start:end] - y)
+                mask = leaf_distances <= radius
+                positions.append(self.order[start:end][mask])
+                distances.append(leaf_distances[mask])
+                continue
+            stack.extend((left, right))
+        if not positions:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        return np.concatenate(positions), np.concatenate(distances)
+
+
+class SnapIndex:
+    """
+    Represents the in-memory indexes used to snap points to POIs and road vertices.
+
+    Distances are measured in EPSG:4326 degrees, the same way as the ST_Distance/ST_DWithin snapping
+    queries in DB, so the snapped points are the same.
+
+    Attributes:
+        point_ids (np.ndarray): osm_id of the points of planet_osm_point.
+        point_x (np.ndarray): x-coordinates of the points of planet_osm_point.
+        point_y (np.ndarray): y-coordinates of the points of planet_osm_point.
+        points (KDTree): Index of the points of planet_osm_point.
+        sources (np.ndarray): Source vertices of the road segments.
+        targets (np.ndarray): Target vertices of the road segments.
+        end_x (np.ndarray): x-coordinates of the road segments' end points.
+        end_y (np.ndarray): y-coordinates of the road segments' end points.
+        starts (KDTree): Index of the road segments' start points.
+        ends (KDTree): Index of the road segments' end points.
+    """
+
+    def __init__(
+        self,
+        point_ids: np.ndarray,
+        point_x: np.ndarray,
+        point_y: np.ndarray,
+        sources: np.ndarray,
+        targets: np.ndarray,
+        start_x: np.ndarray,
+        start_y: np.ndarray,
+        end_x: np.ndarray,
+        end_y: np.ndarray,
+    ) -> None:
+        self.point_ids = np.asarray(point_ids)
+        self.point_x = np.asarray(point_x, dtype=np.float64)
+        self.point_y = np.asarray(point_y, dtype=np.float64)
+        self.points = KDTree(point_x, point_y)
+        self.sources = np.asarray(sources)
+        self.targets = np.asarray(targets)
+        self.end_x = np.asarray(end_x, dtype=np.float64)
+        self.end_y = np.asarray(end_y, dtype=np.float64)
+        self.starts = KDTree(start_x, start_y)
+        self.ends = KDTree(end_x, end_y)
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "SnapIndex":
+        """
+        Restores the indexes from the arrays returned by to_arrays, without rebuilding the trees.
+
+        Args:
+            arrays (Dict[str, np.ndarray]): The arrays, e.g. memory-mapped from a map file.
+
+        Returns:
+            SnapIndex: The indexes.
+        """
+        index = cls.__new__(cls)
+        for name in ("point_ids", "point_x", "point_y", "sources", "targets", "end_x", "end_y"):
+            setattr(index, name, arrays[name])
+        for tree in ("points", "starts", "ends"):
+            prefix = f"{tree}."
+            tree_arrays = {name[len(prefix) :]: a for name, a in arrays.items() if name.startswith(prefix)}
+            setattr(index, tree, KDTree.from_arrays(tree_arrays))
+        return index
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Returns the arrays of the indexes, see from_arrays.
+
+        Returns:
+            Dict[str, np.ndarray]: The arrays by name.
+        """
+        arrays = {
+            name: getattr(self, name)
+            for name in ("point_ids", "point_x", "point_y", "sources", "targets", "end_x", "end_y")
+        }
+        for tree in ("points", "starts", "ends"):
+            arrays.update({f"{tree}.{name}": a for name, a in getattr(self, tree).to_arrays().items()})
+        return arrays
+
+    def nearest_point(self, x: float, y: float, max_radius: float) -> Optional[Tuple[int, float, float]]:
+        """
+        Finds the nearest point of planet_osm_point.
+
+        Args:
+            x (float): The x-coordinate of the query.
+            y (float): The y-coordinate of the query.
+            max_radius (float): The maximum distance of the point.
+
+        Returns:
+            Optional[Tuple[int, float, float]]: osm_id and coordinates of the point, or None if no point is
+            found.
+        """
+        nearest = self.points.nearest(x, y)
+        if nearest is None or nearest[1] > max_radius:
+            return None
+        position = nearest[0]
+        return int(self.point_ids[position]), float(self.point_x[position]), float(self.point_y[position])
+
+    def nearest_source(
+        self, x: float, y: float, end_x: float, end_y: float, init_radius: float, max_radius: float
+    ) -> Optional[int]:
+        """
+        Finds the source vertex of the road to start from, as DB._find_nearest_source does.
+
+        Among the road segments starting within the smallest doubled radius that contains any start
+        point, the one whose end point is closest to the destination is chosen.
+
+        Args:
+            x (float): The x-coordinate of the starting point.
+            y (float): The y-coordinate of the starting point.
+            end_x (float): The x-coordinate of the destination.
+            end_y (float): The y-coordinate of the destination.
+            init_radius (float): The initial radius of the doubling radius loop.
+            max_radius (float): The radius at which the doubling radius loop stops.
+
+        Returns:
+            Optional[int]: The source vertex, or None if no road is found.
+        """
+        nearest = self.starts.nearest(x, y)
+        if nearest is None or nearest[1] > last_radius(init_radius, max_radius):
+            return None
+        positions, _ = self.starts.within(x, y, doubled_radius(nearest[1], init_radius))
+        end_distances = np.hypot(self.end_x[positions] - end_x, self.end_y[positions] - end_y)
+        return int(self.sources[positions[np.argmin(end_distances)]])
+
+    def nearest_target(self, x: float, y: float, init_radius: float, max_radius: float) -> Optional[int]:
+        """
+        Finds the target vertex of the road to end at, as DB._find_nearest_target does.
+
+        Args:
+            x (float): The x-coordinate of the end point.
+            y (float): The y-coordinate of the end point.
+            init_radius (float): The initial radius of the doubling radius loop.
+            max_radius (float): The radius at which the doubling radius loop stops.
+
+        Returns:
+            Optional[int]: The target vertex, or None if no road is found.
+        """
+        nearest = self.ends.nearest(x, y)
+        if nearest is None or nearest[1] > last_radius(init_radius, max_radius):
+            return None
+        return int(self.targets[nearest[0]])
+
+    def reach(
+        self, x: float, y: float, source_radius: float, target_radius: float, max_radius: float
+    ) -> Tuple[float, Optional[int], float]:
+        """
+        Bounds how far from a point nearest_source and nearest_target snap it.
+
+        Args:
+            x (float): The x-coordinate of the point.
+            y (float): The y-coordinate of the point.
+            source_radius (float): The initial radius of the doubling radius loop of the sources.
+            target_radius (float): The initial radius of the doubling radius loop of the targets.
+            max_radius (float): The radius at which the doubling radius loops stop.
+
+        Returns:
+            Tuple[float, Optional[int], float]: The largest distance to any of the candidate sources, the
+            target vertex and the distance to it, infinity (and None) if the point is not snapped.
+        """
+        start, end = self.starts.nearest(x, y), self.ends.nearest(x, y)
+        source_reach = np.inf
+        if start is not None and start[1] <= last_radius(source_radius, max_radius):
+            source_reach = doubled_radius(start[1], source_radius)
+        if end is None or end[1] > last_radius(target_radius, max_radius):
+            return source_reach, None, np.inf
+        return source_reach, int(self.targets[end[0]]), end[1]
+
+
+class AmenityIndex:
+    """
+    Represents a columnar in-memory index of the amenity points of planet_osm_point.
+
+    Every amenity type keeps its own coordinate arrays sorted by longitude, so an annulus query only
+    computes distances for the points within the longitude window of the outer radius.
+
+    Attributes:
+        amenities (Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]): Mapping from an amenity type to
+            the osm_id, x and y arrays of its points.
+    """
+
+    def __init__(self, ids: np.ndarray, amenities: np.ndarray, x: np.ndarray, y: np.ndarray) -> None:
+        ids, amenities = np.asarray(ids), np.asarray(amenities)
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        self.amenities = {}
+        for amenity in np.unique(amenities):
+            mask = amenities == amenity
+            order = np.argsort(x[mask], kind="stable")
+            self.amenities[str(amenity)] = (ids[mask][order], x[mask][order], y[mask][order])
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "AmenityIndex":
+        """
+        Restores the index from the arrays returned by to_arrays, the per-amenity arrays are views of them.
+
+        Args:
+            arrays (Dict[str, np.ndarray]): The arrays, e.g. memory-mapped from a map file.
+
+        Returns:
+            AmenityIndex: The index.
+        """
+        index = cls.__new__(cls)
+        offsets = arrays["offsets"].tolist()
+        index.amenities = {
+            str(amenity): tuple(arrays[name][lo:hi] for name in ("ids", "x", "y"))
+            for amenity, lo, hi in zip(arrays["names"].tolist(), offsets[:-1], offsets[1:])
+        }
+        return index
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Returns the arrays of the index, the points of all amenity types concatenated, see from_arrays.
+
+        Returns:
+            Dict[str, np.ndarray]: The arrays by name.
+        """
+        names = list(self.amenities)
+        columns = [self.amenities[name] for name in names]
+        offsets = np.cumsum([0] + [len(ids) for ids, _, _ in columns])
+        return {
+            "names": np.array(names, dtype=str),
+            "offsets": offsets.astype(np.int64),
+            "ids": np.concatenate([np.empty(0, dtype=np.int64)] + [ids for ids, _, _ in columns]),
+            "x": np.concatenate([np.empty(0)] + [x for _, x, _ in columns]),
+            "y": np.concatenate([np.empty(0)] + [y for _, _, y in columns]),
+        }
+
+    def annulus(
+        self,
+        amenity: str,
+        x: float,
+        y: float,
+        min_distance: float,
+        max_distance: float,
+        radius: float,
+        exclude_id: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Finds the points of an amenity type between two distances of a point.
+
+        Distances are measured the same way as in DB.get_valid_points, in degrees times 111320.
+
+        Args:
+            amenity (str): The type of amenity.
+            x (float): The x-coordinate of the point.
+            y (float): The y-coordinate of the point.
+            min_distance (float): The minimum distance in meters.
+            max_distance (float): The maximum distance in meters.
+            radius (float): The maximum distance in degrees.
+            exclude_id (Optional[int]): osm_id of a point to leave out, e.g. the point itself.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: osm_id, x, y and distance in meters of
+            the points, sorted by distance.
+        """
+        if amenity not in self.amenities:
+            return tuple(np.empty(0) for _ in range(4))
+        ids, xs, ys = self.amenities[amenity]
+        radius = min(radius, max_distance / 111320)
+        lo = np.searchsorted(xs, x - radius, side="left")
+        hi = np.searchsorted(xs, x + radius, side="right")
+        ids, xs, ys = ids[lo:hi], xs[lo:hi], ys[lo:hi]
+        degrees = np.hypot(xs - x, ys - y)
+        distances = degrees * 111320
+        mask = (degrees <= radius) & (distances >= min_distance) & (distances <= max_distance)
+        if exclude_id is not None:
+            mask &= ids != exclude_id
+        order = np.argsort(distances[mask], kind="stable")
+        return ids[mask][order], xs[mask][order], ys[mask][order], distances[mask][order]
+
+
+class PoiSnapTable:
+    """
+    Represents the road vertices pre-snapped for the amenity points, so that legs to and from them skip the
+    snapping queries. It is written by `python -m backend.schema` to the poi_road_targets and
+    poi_road_sources tables, or built from a SnapIndex for local maps.
+
+    The source of a point depends on the destination of the leg, so every point keeps all its candidate
+    sources (the road starts within the smallest doubled radius containing any) with their end points, and
+    the tie-break of SnapIndex.nearest_source is made at lookup time. Distances are in EPSG:4326 degrees.
+    The span of a target, the distance to its farthest neighbouring vertex, bounds how far from it the last
+    edge of a leg to the point starts.
+
+    Attributes:
+        ids (np.ndarray): osm_id of the points, sorted.
+        targets (np.ndarray): Target vertex of every point.
+        target_distances (np.ndarray): Distance from every point to the end of the road of its target.
+        target_components (np.ndarray): Connected component of every target, -1 if unknown.
+        target_spans (np.ndarray): Span of every target, infinity if unknown.
+        offsets (np.ndarray): The candidate sources of the i-th point are offsets[i]:offsets[i + 1].
+        sources (np.ndarray): Candidate source vertices.
+        source_distances (np.ndarray): Distance from the point to the start of the road of every candidate.
+        source_components (np.ndarray): Connected component of every candidate, -1 if unknown.
+        end_x (np.ndarray): x-coordinates of the end points of the roads of the candidates.
+        end_y (np.ndarray): y-coordinates of the end points of the roads of the candidates.
+    """
+
+    COLUMNS = ("ids", "targets", "target_distances", "target_components", "target_spans", "offsets")
+    SOURCE_COLUMNS = ("sources", "source_distances", "source_components", "end_x", "end_y")
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        targets: np.ndarray,
+        target_distances: np.ndarray,
+        target_components: np.ndarray,
+        target_spans: np.ndarray,
+        source_ids: np.ndarray,
+        sources: np.ndarray,
+        source_distances: np.ndarray,
+        source_components: np.ndarray,
+        end_x: np.ndarray,
+        end_y: np.ndarray,
+    ) -> None:
+        order = np.argsort(ids, kind="stable")
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.targets = np.asarray(targets, dtype=np.int64)[order]
+        self.target_distances = np.asarray(target_distances, dtype=np.float64)[order]
+        self.target_components = np.asarray(target_components, dtype=np.int64)[order]
+        self.target_spans = np.asarray(target_spans, dtype=np.float64)[order]
+        source_ids = np.asarray(source_ids, dtype=np.int64)
+        # candidates grouped by point, in their original order within a point for the tie-break
+        order = np.argsort(source_ids, kind="stable")
+        self.offsets = np.searchsorted(source_ids[order], np.append(self.ids, np.iinfo(np.int64).max))
+        self.offsets[-1] = len(source_ids)
+        self.sources = np.asarray(sources, dtype=np.int64)[order]
+        self.source_distances = np.asarray(source_distances, dtype=np.float64)[order]
+        self.source_components = np.asarray(source_components, dtype=np.int64)[order]
+        self.end_x = np.asarray(end_x, dtype=np.float64)[order]
+        self.end_y = np.asarray(end_y, dtype=np.float64)[order]
+        self._source_reaches = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_snap_index(
+        cls,
+        snap_index: SnapIndex,
+        ids: np.ndarray,
+        x: np.ndarray,
+        y: np.ndarray,
+        source_radius: float,
+        target_radius: float,
+        max_radius: float,
+        spans: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+    ) -> "PoiSnapTable":
+        """
+        Pre-snaps points with a SnapIndex, the same way as its nearest_source and nearest_target. Points that
+        no road start or end is near enough to are left out.
+
+        Args:
+            snap_index (SnapIndex): The snapping indexes.
+            ids (np.ndarray): osm_id of the points.
+            x (np.ndarray): x-coordinates of the points.
+            y (np.ndarray): y-coordinates of the points.
+            source_radius (float): The initial radius of the doubling radius loop of the sources.
+            target_radius (float): The initial radius of the doubling radius loop of the targets.
+            max_radius (float): The radius at which the doubling radius loops stop.
+            spans (Optional[Callable]): Finds the spans of road vertices, e.g. RoadGraph.spans. The spans
+                are unknown if not given.
+
+        Returns:
+            PoiSnapTable: The table, without components.
+        """
+        columns = {name: [] for name in ("ids", "targets", "target_distances", "source_ids")}
+        positions_of = []
+        for id, px, py in zip(np.asarray(ids).tolist(), np.asarray(x).tolist(), np.asarray(y).tolist()):
+            start, end = snap_index.starts.nearest(px, py), snap_index.ends.nearest(px, py)
+            if start is None or start[1] > last_radius(source_radius, max_radius):
+                continue
+            if end is None or end[1] > last_radius(target_radius, max_radius):
+                continue
+            positions, distances = snap_index.starts.within(px, py, doubled_radius(start[1], source_radius))
+            columns["ids"].append(id)
+            columns["targets"].append(int(snap_index.targets[end[0]]))
+            columns["target_distances"].append(end[1])
+            columns["source_ids"].append(np.full(len(positions), id, dtype=np.int64))
+            positions_of.append((positions, distances))
+        positions = np.concatenate([np.empty(0, dtype=np.int64)] + [p for p, _ in positions_of])
+        distances = np.concatenate([np.empty(0)] + [d for _, d in positions_of])
+        print(f"POI snap table | Pre-snapped {len(columns['ids'])} points")
+        targets = np.array(columns["targets"], dtype=np.int64)
+        return cls(
+            np.array(columns["ids"], dtype=np.int64),
+            targets,
+            np.array(columns["target_distances"]),
+            np.full(len(targets), -1),
+            spans(targets) if spans is not None else np.full(len(targets), np.inf),
+            np.concatenate([np.empty(0, dtype=np.int64)] + columns["source_ids"]),
+            snap_index.sources[positions],
+            distances,
+            np.full(len(positions), -1),
+            snap_index.end_x[positions],
+            snap_index.end_y[positions],
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "PoiSnapTable":
+        """
+        Restores the table from the arrays returned by to_arrays.
+
+        Args:
+            arrays (Dict[str, np.ndarray]): The arrays, e.g. memory-mapped from a map file.
+
+        Returns:
+            PoiSnapTable: The table.
+        """
+        table = cls.__new__(cls)
+        for name in cls.COLUMNS + cls.SOURCE_COLUMNS:
+            setattr(table, name, arrays[name])
+        table._source_reaches = None
+        return table
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Returns the arrays of the table, see from_arrays.
+
+        Returns:
+            Dict[str, np.ndarray]: The arrays by name.
+        """
+        return {name: getattr(self, name) for name in self.COLUMNS + self.SOURCE_COLUMNS}
+
+    def positions(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Finds the points in the table.
+
+        Args:
+            ids (np.ndarray): osm_id of the points.
+
+        Returns:
+            np.ndarray: Position of every point in the table, -1 for the points not in it.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.full(len(ids), -1, dtype=np.int64)
+        positions = np.searchsorted(self.ids, ids).clip(max=len(self.ids) - 1)
+        return np.where(self.ids[positions] == ids, positions, -1)
+
+    def targets_of(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Looks up the target vertices of many points.
+
+        Args:
+            ids (np.ndarray): osm_id of the points.
+
+        Returns:
+            np.ndarray: The target vertex of every point, -1 for the points not in the table.
+        """
+        positions = self.positions(ids)
+        return np.where(positions >= 0, self.targets[positions], -1)
+
+    def reaches(self, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Bounds how far from points in the table the legs from and to them end, see DB.snap_reaches.
+
+        Args:
+            positions (np.ndarray): Positions of the points in the table, see positions.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The largest distance from every point to any of its candidate
+            sources, and its distance to its target plus the span of the target, in EPSG:4326 degrees.
+        """
+        if self._source_reaches is None:
+            # a trailing element, so that the points without candidates at the end have a valid offset
+            distances = np.append(self.source_distances, -np.inf)
+            reaches = np.maximum.reduceat(distances, self.offsets[:-1])
+            self._source_reaches = np.where(np.diff(self.offsets) > 0, reaches, np.inf)
+        return (
+            self._source_reaches[positions],
+            self.target_distances[positions] + self.target_spans[positions],
+        )
+
+    def source(self, id: int, end_x: float, end_y: float) -> Optional[int]:
+        """
+        Looks up the source vertex of a point, as SnapIndex.nearest_source finds it.
+
+        Args:
+            id (int): osm_id of the point.
+            end_x (float): x-coordinate of the destination, for the tie-break.
+            end_y (float): y-coordinate of the destination.
+
+        Returns:
+            Optional[int]: The source vertex, or None if the point is not in the table.
+        """
+        position = int(self.positions([id])[0])
+        return int(self.sources[self._candidate(position, end_x, end_y)]) if position >= 0 else None
+
+    def leg(
+        self, start_id: int, end_id: int, end_x: float, end_y: float
+    ) -> Optional[Tuple[int, int, Optional[bool]]]:
+        """
+        Looks up the road vertices of a leg between two pre-snapped points.
+
+        Args:
+            start_id (int): osm_id of the starting point.
+            end_id (int): osm_id of the ending point.
+            end_x (float): x-coordinate of the ending point, for the tie-break of the sources.
+            end_y (float): y-coordinate of the ending point.
+
+        Returns:
+            Optional[Tuple[int, int, Optional[bool]]]: The source and target vertices and whether they are
+            in the same component (None if a component is unknown), or None if a point is not in the table.
+        """
+        start, end = self.positions([start_id, end_id]).tolist()
+        if start < 0 or end < 0:
+            return None
+        candidate = self._candidate(start, end_x, end_y)
+        components = int(self.source_components[candidate]), int(self.target_components[end])
+        connected = None if -1 in components else components[0] == components[1]
+        return int(self.sources[candidate]), int(self.targets[end]), connected
+
+    def _candidate(self, position: int, end_x: float, end_y: float) -> int:
+        # the candidate source of the point at the position whose road ends closest to the destination
+        lo, hi = int(self.offsets[position]), int(self.offsets[position + 1])
+        return lo + int(np.argmin(np.hypot(self.end_x[lo:hi] - end_x, self.end_y[lo:hi] - end_y)))
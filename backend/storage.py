@@ -0,0 +1,415 @@
+import argparse
+import json
+import os
+from typing import Dict, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from backend.constants import (
+    INIT_BUFFER_DIJKSTRA,
+    INIT_BUFFER_RADIUS,
+    MAX_BUFFER_RADIUS,
+)
+from backend.db import DB, ROAD_TYPES_SQL, Router
+from backend.graph import RoadGraph, haversine_array
+from backend.path import DBPoint, PointArray
+from backend.spatial import AmenityIndex, PoiSnapTable, SnapIndex
+
+# A directory of .npy files holding the built graph and indexes, see LocalDB.save. Bumped whenever the arrays
+# change, so that a map built by another version is rejected instead of misread.
+LOCAL_MAP_FORMAT_VERSION = 5
+LOCAL_MAP_MANIFEST = "manifest.json"
+STORAGE_BACKENDS = ["postgis", "local"]
+# amenity types of the points of synthetic maps
+SYNTHETIC_AMENITIES = ["cafe", "restaurant", "bar", "pharmacy", "atm", "toilets"]
+
+
+def save_arrays(
+    directory: str, arrays: Dict[str, np.ndarray], version: int = LOCAL_MAP_FORMAT_VERSION
+) -> None:
+    """
+    Writes arrays to a directory as one .npy file each, with a manifest of their names, types and shapes.
+
+    The manifest is written last, so a directory without one is an incomplete export.
+
+    Args:
+        directory (str): The path of the directory, created if it does not exist.
+        arrays (Dict[str, np.ndarray]): The arrays by name.
+        version (int): The format version of the directory, a local map's by default.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = {"version": version, "arrays": {}}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        np.save(os.path.join(directory, f"{name}.npy"), array, allow_pickle=False)
+        manifest["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape)}
+    with open(os.path.join(directory, LOCAL_MAP_MANIFEST), "w") as file:
+        json.dump(manifest, file, indent=2)
+
+
+def load_arrays(
+    directory: str, mmap: bool = True, version: int = LOCAL_MAP_FORMAT_VERSION
+) -> Dict[str, np.ndarray]:
+    """
+    Reads the arrays written by save_arrays.
+
+    Args:
+        directory (str): The path of the directory.
+        mmap (bool): Whether to map the files read-only instead of reading them, so all processes mapping
+            them share one copy in the page cache.
+        version (int): The expected format version of the directory, a local map's by default.
+
+    Returns:
+        Dict[str, np.ndarray]: The arrays by name.
+    """
+    with open(os.path.join(directory, LOCAL_MAP_MANIFEST)) as file:
+        manifest = json.load(file)
+    if manifest["version"] != version:
+        raise ValueError(f"Unsupported version {manifest['version']} of {directory}, expected {version}")
+    arrays = {}
+    for name, spec in manifest["arrays"].items():
+        array = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None)
+        if array.dtype.str != spec["dtype"] or list(array.shape) != spec["shape"]:
+            raise ValueError(f"Array {name} of {directory} does not match the manifest")
+        arrays[name] = array
+    return arrays
+
+
+def _group(arrays: Dict[str, np.ndarray], prefix: str) -> Dict[str, np.ndarray]:
+    prefix = f"{prefix}."
+    return {name[len(prefix) :]: array for name, array in arrays.items() if name.startswith(prefix)}
+
+
+class Storage(Protocol):
+    """
+    The map queries used by PathFinder, implemented by DB (PostGIS) and LocalDB (a map file).
+    """
+
+    def get_nearest_point(self, point: DBPoint) -> Optional[DBPoint]:
+        ...
+
+    def find_shortest_path_between(self, A: DBPoint, B: DBPoint) -> Optional[Tuple[PointArray, float]]:
+        ...
+
+    def get_valid_points(
+        self, point: DBPoint, max_distance: float, max_time: float, min_time: float, amenity: str
+    ) -> PointArray:
+        ...
+
+    def get_costs_from(self, origin: DBPoint, points: List[DBPoint], end: DBPoint) -> List[float]:
+        ...
+
+    def get_costs_to(self, points: List[DBPoint], end: DBPoint) -> List[float]:
+        ...
+
+    def get_reachable_points(
+        self, point: DBPoint, max_distance: float, max_time: float, min_time: float, amenity: str
+    ) -> PointArray:
+        ...
+
+    def reachable_within(self, point: DBPoint, max_distance: float) -> Tuple[PointArray, np.ndarray]:
+        ...
+
+    def snap_reaches(self, points: PointArray) -> Tuple[np.ndarray, np.ndarray]:
+        ...
+
+
+class LocalDB(DB):
+    """
+    Represents a map read from files instead of a PostGIS database, answering the same queries as DB.
+
+    The map is held by an in-process routing engine, the snapping indexes and the amenity index, so every
+    query takes the in-memory path of DB and no database connection is needed. Maps are built from plain
+    arrays (see build), exported with save and memory-mapped with load.
+
+    Attributes:
+        _router (Router): The routing engine.
+        _snap_index (SnapIndex): The snapping indexes.
+        _amenity_index (AmenityIndex): The amenity index.
+        _poi_snap (Optional[PoiSnapTable]): The road vertices pre-snapped for the amenity points.
+    """
+
+    def __init__(
+        self,
+        router: Router,
+        snap_index: SnapIndex,
+        amenity_index: AmenityIndex,
+        poi_snap: Optional[PoiSnapTable] = None,
+    ) -> None:
+        # no engine, every query has an in-memory path
+        self._engine = None
+        self._router = router
+        self._snap_index = snap_index
+        self._amenity_index = amenity_index
+        self._poi_snap = poi_snap
+
+    @classmethod
+    def build(
+        cls,
+        vertex_ids: np.ndarray,
+        vertex_x: np.ndarray,
+        vertex_y: np.ndarray,
+        edge_ids: np.ndarray,
+        edge_source: np.ndarray,
+        edge_target: np.ndarray,
+        edge_cost: np.ndarray,
+        edge_road: np.ndarray,
+        point_ids: np.ndarray,
+        point_x: np.ndarray,
+        point_y: np.ndarray,
+        point_amenity: np.ndarray,
+        method: str = "dijkstra",
+    ) -> "LocalDB":
+        """
+        Builds the road graph and the indexes of a map.
+
+        Args:
+            vertex_ids (np.ndarray): pgRouting ids of the road vertices.
+            vertex_x (np.ndarray): Longitudes of the road vertices.
+            vertex_y (np.ndarray): Latitudes of the road vertices.
+            edge_ids (np.ndarray): osm_id of the road segments.
+            edge_source (np.ndarray): Source vertices of the road segments.
+            edge_target (np.ndarray): Target vertices of the road segments.
+            edge_cost (np.ndarray): Costs (EPSG:3857 lengths) of the road segments.
+            edge_road (np.ndarray): Whether every road segment is of one of ROAD_TYPES, used for snapping.
+            point_ids (np.ndarray): osm_id of the points of planet_osm_point.
+            point_x (np.ndarray): Longitudes of the points.
+            point_y (np.ndarray): Latitudes of the points.
+            point_amenity (np.ndarray): Amenity types of the points, "" for points without one.
+            method (str): The search algorithm of the road graph, either "dijkstra" or "astar".
+
+        Returns:
+            LocalDB: The map.
+        """
+        vertex_ids = np.asarray(vertex_ids, dtype=np.int64)
+        vertex_x = np.asarray(vertex_x, dtype=np.float64)
+        vertex_y = np.asarray(vertex_y, dtype=np.float64)
+        edge_source = np.asarray(edge_source, dtype=np.int64)
+        edge_target = np.asarray(edge_target, dtype=np.int64)
+        edge_road = np.asarray(edge_road, dtype=bool)
+        point_ids = np.asarray(point_ids, dtype=np.int64)
+        point_x = np.asarray(point_x, dtype=np.float64)
+        point_y = np.asarray(point_y, dtype=np.float64)
+        point_amenity = np.asarray(point_amenity, dtype=str)
+
+        router = RoadGraph.from_edges(
+            edge_source, edge_target, edge_cost, edge_ids, vertex_ids, vertex_x, vertex_y, method=method
+        )
+        order = np.argsort(vertex_ids)
+        source = order[np.searchsorted(vertex_ids[order], edge_source[edge_road])]
+        target = order[np.searchsorted(vertex_ids[order], edge_target[edge_road])]
+        snap_index = SnapIndex(
+            point_ids,
+            point_x,
+            point_y,
+            edge_source[edge_road],
+            edge_target[edge_road],
+            vertex_x[source],
+            vertex_y[source],
+            vertex_x[target],
+            vertex_y[target],
+        )
+        amenity = point_amenity != ""
+        amenity_index = AmenityIndex(
+            point_ids[amenity], point_amenity[amenity], point_x[amenity], point_y[amenity]
+        )
+        poi_snap = PoiSnapTable.from_snap_index(
+            snap_index,
+            point_ids[amenity],
+            point_x[amenity],
+            point_y[amenity],
+            INIT_BUFFER_RADIUS,
+            INIT_BUFFER_DIJKSTRA,
+            MAX_BUFFER_RADIUS,
+            spans=router.spans,
+        )
+        print(f"Local map | {len(vertex_ids)} vertices, {len(edge_ids)} edges and {len(point_ids)} points")
+        return cls(router, snap_index, amenity_index, poi_snap)
+
+    def get_point_by_id(self, id: int) -> DBPoint:
+        index = self._snap_index
+        position = int(np.flatnonzero(index.point_ids == id)[0])
+        return DBPoint(id, float(index.point_x[position]), float(index.point_y[position]))
+
+    def save(self, directory: str) -> None:
+        """
+        Exports the road graph and the indexes to a directory of versioned, memory-mappable .npy files.
+
+        Args:
+            directory (str): The path of the directory.
+        """
+        if not isinstance(self._router, RoadGraph):
+            raise ValueError("Only maps routed with a RoadGraph can be saved")
+        arrays = {}
+        for prefix, component in (
+            ("graph", self._router),
+            ("snap", self._snap_index),
+            ("amenity", self._amenity_index),
+            ("poi", self._poi_snap),
+        ):
+            if component is None:
+                continue
+            arrays.update({f"{prefix}.{name}": array for name, array in component.to_arrays().items()})
+        save_arrays(directory, arrays)
+
+    @classmethod
+    def load(
+        cls, directory: str, method: str = "dijkstra", router: Optional[Router] = None, mmap: bool = True
+    ) -> "LocalDB":
+        """
+        Reads a map exported by save. Nothing is rebuilt, the arrays are mapped read-only by default, so
+        loading is fast and processes loading the same map share its memory.
+
+        Args:
+            directory (str): The path of the directory.
+            method (str): The search algorithm of the road graph, either "dijkstra" or "astar".
+            router (Optional[Router]): Routing engine to use instead of the road graph of the map, e.g. a
+                contraction hierarchy.
+            mmap (bool): Whether to map the files instead of reading them into memory.
+
+        Returns:
+            LocalDB: The loaded map.
+        """
+        arrays = load_arrays(directory, mmap=mmap)
+        if router is None:
+            router = RoadGraph.from_arrays(_group(arrays, "graph"), method=method)
+        return cls(
+            router,
+            SnapIndex.from_arrays(_group(arrays, "snap")),
+            AmenityIndex.from_arrays(_group(arrays, "amenity")),
+            PoiSnapTable.from_arrays(_group(arrays, "poi")) if "poi.ids" in arrays else None,
+        )
+
+    @classmethod
+    def from_db(cls, db: DB, method: str = "dijkstra") -> "LocalDB":
+        """
+        Reads the road network and the points of a PostGIS database.
+
+        Args:
+            db (DB): The database to read.
+            method (str): The search algorithm of the road graph, either "dijkstra" or "astar".
+
+        Returns:
+            LocalDB: The map of the database.
+        """
+        edges_query = f"""
+        SELECT osm_id, source, target, ST_Length(way) AS cost,
+            highway IN {ROAD_TYPES_SQL} AS road
+        FROM planet_osm_line
+        WHERE highway IS NOT NULL AND source IS NOT NULL AND target IS NOT NULL;
+        """
+        vertices_query = """
+        SELECT id, ST_X(ST_Transform(the_geom, 4326)) AS x, ST_Y(ST_Transform(the_geom, 4326)) AS y
+        FROM planet_osm_line_vertices_pgr;
+        """
+        points_query = """
+        SELECT osm_id, COALESCE(amenity, '') AS amenity, ST_X(geom_4326) AS x, ST_Y(geom_4326) AS y
+        FROM planet_osm_point;
+        """
+        with db._engine.connect() as connection:
+            edges = pd.read_sql(text(edges_query), connection)
+            vertices = pd.read_sql(text(vertices_query), connection)
+            points = pd.read_sql(text(points_query), connection)
+        return cls.build(
+            vertices["id"].to_numpy(),
+            vertices["x"].to_numpy(),
+            vertices["y"].to_numpy(),
+            edges["osm_id"].to_numpy(),
+            edges["source"].to_numpy(),
+            edges["target"].to_numpy(),
+            edges["cost"].to_numpy(),
+            edges["road"].to_numpy(),
+            points["osm_id"].to_numpy(),
+            points["x"].to_numpy(),
+            points["y"].to_numpy(),
+            points["amenity"].to_numpy(),
+            method=method,
+        )
+
+    @classmethod
+    def synthetic(
+        cls,
+        size: int = 30,
+        num_points: int = 600,
+        spacing: float = 0.002,
+        origin: Tuple[float, float] = (21.0, 52.2),
+        amenities: Sequence[str] = SYNTHETIC_AMENITIES,
+        seed: int = 0,
+        method: str = "dijkstra",
+    ) -> "LocalDB":
+        """
+        Generates a map of a jittered grid of roads with random points, to run the solver without a database.
+
+        Args:
+            size (int): Number of vertices along each side of the grid.
+            num_points (int): Number of points, half of them with one of `amenities`.
+            spacing (float): Distance between neighbouring vertices in degrees.
+            origin (Tuple[float, float]): Longitude and latitude of the south-west corner.
+            amenities (Sequence[str]): Amenity types of the points.
+            seed (int): Seed of the random generator.
+            method (str): The search algorithm of the road graph, either "dijkstra" or "astar".
+
+        Returns:
+            LocalDB: The generated map.
+        """
+        rng = np.random.default_rng(seed)
+        i, j = np.meshgrid(np.arange(size), np.arange(size), indexing="ij")
+        vertex_ids = np.arange(1, size * size + 1)
+        vertex_x = origin[0] + (i.ravel() + rng.uniform(-0.2, 0.2, size * size)) * spacing
+        vertex_y = origin[1] + (j.ravel() + rng.uniform(-0.2, 0.2, size * size)) * spacing
+
+        grid = vertex_ids.reshape(size, size)
+        source = np.concatenate([grid[:-1, :].ravel(), grid[:, :-1].ravel()])
+        target = np.concatenate([grid[1:, :].ravel(), grid[:, 1:].ravel()])
+        # EPSG:3857 lengths, like ST_Length(way) of the imported roads
+        length = haversine_array(
+            vertex_x[source - 1], vertex_y[source - 1], vertex_x[target - 1], vertex_y[target - 1]
+        )
+        cost = length / np.cos(np.radians(origin[1]))
+
+        extent = (size - 1) * spacing
+        point_amenity = np.where(
+            rng.random(num_points) < 0.5, rng.choice(np.asarray(amenities), num_points), ""
+        )
+        return cls.build(
+            vertex_ids,
+            vertex_x,
+            vertex_y,
+            np.arange(1, len(source) + 1),
+            source,
+            target,
+            cost,
+            np.ones(len(source), dtype=bool),
+            # point ids apart from the edge ids, like osm_ids of different tables
+            np.arange(1, num_points + 1) + 10**9,
+            origin[0] + rng.random(num_points) * extent,
+            origin[1] + rng.random(num_points) * extent,
+            point_amenity,
+            method=method,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a map directory for STORAGE_BACKEND=local")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser("export", help="Export the map of the PostGIS database")
+    export.add_argument("--output", default="map", help="Path of the map directory")
+    synthetic = subparsers.add_parser("synthetic", help="Generate a synthetic map")
+    synthetic.add_argument("--output", default="map", help="Path of the map directory")
+    synthetic.add_argument("--size", type=int, default=30, help="Vertices along a side of the grid")
+    synthetic.add_argument("--points", type=int, default=600, help="Number of points")
+    synthetic.add_argument("--seed", type=int, default=0, help="Seed of the random generator")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        local_db = LocalDB.from_db(DB())
+    else:
+        local_db = LocalDB.synthetic(size=args.size, num_points=args.points, seed=args.seed)
+    local_db.save(args.output)
+    print(f"Local map | Saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+from backend.constants import BEAM_BRANCHING, BEAM_WIDTH
+
+
+class GreedyStrategy:
+    """
+    Extends the path with the best scored POI candidate that fits, until none does.
+    """
+
+    def solve(self, finder) -> None:
+        """
+        Adds POIs to the path of a PathFinder.
+
+        Args:
+            finder (PathFinder): The PathFinder holding the path, it is updated in place.
+        """
+        while len(finder.curr_pois) < finder.max_pois and not finder.out_of_time():
+            next_poi = finder.select_next_poi()
+            if next_poi is None:
+                break
+            finder.history.append(finder.snapshot())
+
+
+class BeamSearchStrategy:
+    """
+    Keeps the `width` paths with the smallest additional distance after every POI and extends each with up
+    to `branching` of its best scored candidates, so a candidate that does not fit does not end the search.
+
+    The search is anytime: when the PathFinder's time budget runs out, the best path found so far is kept,
+    i.e. the one with the most POIs and then the smallest additional distance.
+
+    Attributes:
+        width (int): Number of paths kept after every POI.
+        branching (int): Number of candidates tried for every kept path.
+    """
+
+    def __init__(self, width: int = BEAM_WIDTH, branching: int = BEAM_BRANCHING) -> None:
+        self.width = width
+        self.branching = branching
+
+    def solve(self, finder) -> None:
+        """
+        Adds POIs to the path of a PathFinder.
+
+        Args:
+            finder (PathFinder): The PathFinder holding the path, it is updated in place.
+        """
+        # the paths tried along the way are not passed to the listener, only the chosen one at the end
+        listener, finder.listener = finder.listener, None
+        try:
+            best = finder.snapshot()
+            beam = [best]
+            while beam and len(best["curr_pois"]) < finder.max_pois and not finder.out_of_time():
+                children = []
+                for state in beam:
+                    finder.restore(state)
+                    candidates = finder.rank_candidates()
+                    finder.count_avoided(self.branching)
+                    for poi in candidates[: self.branching]:
+                        if finder.out_of_time():
+                            break
+                        finder.restore(state)
+                        if finder.update_path(poi):
+                            children.append(finder.snapshot())
+                children.sort(key=lambda child: child["curr_additional_distance"])
+                beam = children[: self.width]
+                if beam:
+                    best = beam[0]
+        finally:
+            finder.listener = listener
+        finder.restore(best)
+        finder.emit_pois()
+
+
+STRATEGIES = {
+    "greedy": GreedyStrategy,
+    "beam": BeamSearchStrategy,
+}
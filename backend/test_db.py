@@ -0,0 +1,38 @@
+import contextvars
+import re
+from unittest import TestCase
+
+import pytest
+from sqlalchemy import create_engine, event, text
+
+from backend.db import (
+    STATEMENTS,
+    _after_cursor_execute,
+    _before_cursor_execute,
+    _positional,
+)
+from backend.metrics import start_request
+
+
+@pytest.mark.health
+class TestStatements(TestCase):
+    def test_positional(self):
+        for name, (query, params) in STATEMENTS.items():
+            prepared = _positional(query, params)
+            self.assertNotRegex(prepared, r"(?<![:\w]):\w", name)
+            self.assertEqual(set(re.findall(r"\$(\d+)", prepared)), {str(i + 1) for i in range(len(params))})
+
+    def test_round_trips(self):
+        engine = create_engine("sqlite://")
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+        def query():
+            timings = start_request()
+            with engine.connect() as connection:
+                for _ in range(3):
+                    connection.execute(text("SELECT 1"))
+            return timings
+
+        timings = contextvars.copy_context().run(query)
+        self.assertEqual(timings["db_round_trip"][1], 3)
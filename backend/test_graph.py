@@ -0,0 +1,140 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pytest
+
+from backend.ch import ContractionHierarchy
+from backend.graph import RoadGraph, haversine, haversine_array
+
+
+def make_grid_graph(size: int = 6, method: str = "dijkstra") -> RoadGraph:
+    """Builds a size x size grid of roads with slightly irregular lengths."""
+    rng = np.random.default_rng(0)
+    vertex_ids = np.arange(1, size * size + 1) * 10
+    x = 20 + np.tile(np.arange(size), size) * 0.01
+    y = 50 + np.repeat(np.arange(size), size) * 0.01
+    source, target = [], []
+    for i in range(size):
+        for j in range(size):
+            v = i * size + j
+            if j + 1 < size:
+                source.append(v)
+                target.append(v + 1)
+            if i + 1 < size:
+                source.append(v)
+                target.append(v + size)
+    source, target = np.array(source), np.array(target)
+    cost = 1100 + rng.random(len(source)) * 500
+    return RoadGraph.from_edges(
+        vertex_ids[source],
+        vertex_ids[target],
+        cost,
+        np.arange(len(source)) + 1000,
+        vertex_ids,
+        x,
+        y,
+        method=method,
+    )
+
+
+@pytest.mark.health
+class TestRoadGraph(TestCase):
+    def test_adjacent_vertices(self):
+        graph = make_grid_graph()
+        nodes, edges, agg_costs = graph.shortest_path(10, 20)
+        self.assertEqual(nodes, [0, 1])
+        self.assertEqual(len(edges), 1)
+        self.assertAlmostEqual(agg_costs[-1], graph.weights[graph.indptr[0]])
+
+    def test_astar_matches_dijkstra(self):
+        dijkstra = make_grid_graph()
+        astar = make_grid_graph(method="astar")
+        for source, target in [(10, 360), (60, 310), (150, 220)]:
+            expected = dijkstra.shortest_path(source, target)
+            result = astar.shortest_path(source, target)
+            self.assertAlmostEqual(result[2][-1], expected[2][-1])
+            self.assertEqual(len(result[0]), len(result[1]) + 1)
+
+    def test_haversine_array(self):
+        x, y = np.array([20.0, 21.5]), np.array([50.0, 52.2])
+        expected = [haversine(x1, y1, 19.0, 51.0) for x1, y1 in zip(x, y)]
+        np.testing.assert_allclose(haversine_array(x, y, 19.0, 51.0), expected)
+
+    def test_no_path(self):
+        graph = make_grid_graph()
+        self.assertIsNone(graph.shortest_path(10, 10))
+        self.assertIsNone(graph.shortest_path(10, 12345))
+
+    def test_components(self):
+        grid = make_grid_graph(size=4)
+        # a second grid, shifted away and not connected to the first one
+        graph = RoadGraph.from_edges(
+            *[np.concatenate([a, b]) for a, b in zip(self.edges(grid), self.edges(grid, shift=1000))],
+            np.concatenate([grid.vertex_ids, grid.vertex_ids + 1000]),
+            np.concatenate([grid.x, grid.x + 1]),
+            np.concatenate([grid.y, grid.y]),
+        )
+        labels = graph.components
+        self.assertEqual(len(set(labels[: len(grid)].tolist())), 1)
+        self.assertEqual(len(set(labels[len(grid) :].tolist())), 1)
+        self.assertNotEqual(labels[0], labels[-1])
+        self.assertIsNone(graph.shortest_path(10, 1010))
+        self.assertIsNotNone(graph.shortest_path(1010, 1160))
+        hierarchy = ContractionHierarchy.build(graph)
+        np.testing.assert_array_equal(hierarchy.components == hierarchy.components[0], labels == labels[0])
+        for router in (graph, hierarchy):
+            self.assertEqual(router.costs_from(10, [20, 1010])[1], float("inf"))
+
+    @staticmethod
+    def edges(graph: RoadGraph, shift: int = 0) -> tuple:
+        """Returns the (source, target, cost, edge id) arrays of every road segment of the graph once."""
+        heads = np.repeat(np.arange(len(graph)), np.diff(graph.indptr))
+        once = heads < graph.indices
+        return (
+            graph.vertex_ids[heads[once]] + shift,
+            graph.vertex_ids[graph.indices[once]] + shift,
+            graph.weights[once],
+            graph.edge_ids[once] + shift,
+        )
+
+
+@pytest.mark.health
+class TestContractionHierarchy(TestCase):
+    def test_matches_dijkstra(self):
+        graph = make_grid_graph(size=8)
+        hierarchy = ContractionHierarchy.build(graph)
+        for source in graph.vertex_ids[::5]:
+            for target in graph.vertex_ids[::7]:
+                expected = graph.shortest_path(source, target)
+                result = hierarchy.shortest_path(source, target)
+                if expected is None:
+                    self.assertIsNone(result)
+                    continue
+                nodes, edges, agg_costs = result
+                self.assertAlmostEqual(agg_costs[-1], expected[2][-1])
+                self.assertEqual(nodes[0], graph.index_of(source))
+                self.assertEqual(nodes[-1], graph.index_of(target))
+                self.assertEqual(len(nodes), len(edges) + 1)
+
+    def test_costs_from(self):
+        graph = make_grid_graph()
+        hierarchy = ContractionHierarchy.build(graph)
+        targets = [20, 150, 360, 10, 12345]
+        expected = [graph.shortest_path(10, t)[2][-1] if t not in (10, 12345) else None for t in targets]
+        for costs in (graph.costs_from(10, targets), hierarchy.costs_from(10, targets)):
+            for cost, expected_cost in zip(costs[:3], expected[:3]):
+                self.assertAlmostEqual(cost, expected_cost)
+            self.assertEqual(costs[3], 0.0)
+            self.assertEqual(costs[4], float("inf"))
+
+    def test_save_and_load(self):
+        hierarchy = ContractionHierarchy.build(make_grid_graph())
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "graph.ch")
+            hierarchy.save(path)
+            loaded = ContractionHierarchy.load(path)
+            self.assertIsInstance(loaded.indices, np.memmap)
+            np.testing.assert_array_equal(loaded.components, hierarchy.components)
+            self.assertEqual(loaded.shortest_path(10, 360), hierarchy.shortest_path(10, 360))
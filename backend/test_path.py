@@ -0,0 +1,61 @@
+from unittest import TestCase
+
+import numpy as np
+import pytest
+
+from backend.db import points_from_rows
+from backend.path import DBPoint, PointArray, Route, encode_polyline, simplify
+
+
+@pytest.mark.health
+class TestPointArray(TestCase):
+    def test_behaves_like_list_of_points(self):
+        path = PointArray([1, 2, 3], [20.0, 20.1, 20.2], [50.0, 50.1, 50.2])
+        self.assertEqual(path[-1], DBPoint(3, 20.2, 50.2))
+        self.assertEqual([p.id for p in path[:-1] + [DBPoint(9, 0.0, 0.0)]], [1, 2, 9])
+        self.assertIn(DBPoint(2, 0.0, 0.0), path)
+        self.assertEqual(path[np.array([True, False, True])].ids.tolist(), [1, 3])
+        self.assertEqual(len(PointArray.concat([path, [], path[1:]])), 5)
+
+    def test_route_shares_legs(self):
+        route = Route([DBPoint(1, 20.0, 50.0)])
+        extended = route.append(PointArray([2, 3], [20.1, 20.2], [50.1, 50.2]))
+        branch = route.append([DBPoint(4, 20.3, 50.3)])
+        self.assertEqual((len(route), len(extended), len(branch)), (1, 3, 2))
+        self.assertEqual(extended.ids.tolist(), [1, 2, 3])
+        self.assertEqual(extended[-1], DBPoint(3, 0.0, 0.0))
+        self.assertEqual(extended.since(1).ids.tolist(), [2, 3])
+        self.assertEqual(extended.visited(np.array([4, 3, 1])).tolist(), [False, True, True])
+        self.assertIn(DBPoint(4, 0.0, 0.0), branch)
+        self.assertNotIn(DBPoint(4, 0.0, 0.0), extended)
+        self.assertEqual(len({DBPoint(1, 0.0, 0.0), DBPoint(1, 1.0, 1.0)}), 1)
+
+    def test_points_from_rows_transforms_to_4326(self):
+        path = points_from_rows([(1, 2226389.8, 6446275.8, 3857), (2, 0.0, 0.0, 3857)])
+        self.assertEqual(path.ids.tolist(), [1, 2])
+        np.testing.assert_allclose(path.x, [20.0, 0.0], atol=1e-6)
+        np.testing.assert_allclose(path.y, [50.0, 0.0], atol=1e-6)
+        self.assertEqual(len(points_from_rows([])), 0)
+
+    def test_encode_polyline(self):
+        x, y = np.array([-120.2, -120.95, -126.453]), np.array([38.5, 40.7, 43.252])
+        self.assertEqual(encode_polyline(x, y), "_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+        self.assertEqual(encode_polyline(np.array([]), np.array([])), "")
+
+    def test_simplify(self):
+        rng = np.random.default_rng(0)
+        x, y = 20 + np.cumsum(rng.normal(0, 1e-4, 2000)), 50 + np.cumsum(rng.normal(0, 1e-4, 2000))
+        keep = np.zeros(2000, dtype=bool)
+        keep[700] = True
+        mask = simplify(x, y, 20, keep)
+        self.assertTrue(mask[[0, 700, -1]].all())
+        self.assertLess(mask.sum(), 2000)
+        # every dropped point is within the tolerance of the segment of the kept points around it
+        kept = np.flatnonzero(mask)
+        scale = 111320 * np.cos(np.radians((y.min() + y.max()) / 2))
+        for lo, hi in zip(kept[:-1], kept[1:]):
+            a, b = np.array([x[lo] * scale, y[lo] * 111320]), np.array([x[hi] * scale, y[hi] * 111320])
+            points = np.column_stack([x[lo + 1 : hi] * scale, y[lo + 1 : hi] * 111320])
+            t = np.clip((points - a) @ (b - a) / max((b - a) @ (b - a), 1e-12), 0, 1)
+            self.assertTrue(np.all(np.linalg.norm(points - a - t[:, None] * (b - a), axis=1) <= 20 + 1e-6))
+        self.assertEqual(simplify(x[:2], y[:2], 20).tolist(), [True, True])
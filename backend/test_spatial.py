@@ -0,0 +1,97 @@
+from unittest import TestCase
+
+import numpy as np
+import pytest
+
+from backend.spatial import AmenityIndex, KDTree, PoiSnapTable, SnapIndex
+
+
+@pytest.mark.health
+class TestKDTree(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.x = 20 + rng.random(5000)
+        self.y = 50 + rng.random(5000)
+        self.tree = KDTree(self.x, self.y)
+        self.queries = 20 + rng.random((50, 2)) + [0, 30]
+
+    def test_nearest(self):
+        for qx, qy in self.queries:
+            distances = np.hypot(self.x - qx, self.y - qy)
+            position, distance = self.tree.nearest(qx, qy)
+            self.assertEqual(position, int(np.argmin(distances)))
+            self.assertAlmostEqual(distance, distances.min())
+
+    def test_within(self):
+        for qx, qy in self.queries:
+            distances = np.hypot(self.x - qx, self.y - qy)
+            positions, _ = self.tree.within(qx, qy, 0.05)
+            self.assertEqual(sorted(positions.tolist()), np.flatnonzero(distances <= 0.05).tolist())
+
+
+@pytest.mark.health
+class TestSnapIndex(TestCase):
+    def test_nearest_source_prefers_road_towards_destination(self):
+        # two roads start next to the point, the farther one leads towards the destination
+        index = SnapIndex(
+            point_ids=np.array([1]),
+            point_x=np.array([20.0]),
+            point_y=np.array([50.0]),
+            sources=np.array([10, 20, 30]),
+            targets=np.array([11, 21, 31]),
+            start_x=np.array([20.0002, 20.0005, 21.0]),
+            start_y=np.array([50.0, 50.0, 50.0]),
+            end_x=np.array([19.9, 20.1, 21.1]),
+            end_y=np.array([50.0, 50.0, 50.0]),
+        )
+        self.assertEqual(index.nearest_source(20.0, 50.0, 20.5, 50.0, 0.001, 5), 20)
+        self.assertEqual(index.nearest_target(20.09, 50.0, 0.01, 5), 21)
+        self.assertEqual(index.nearest_point(20.0001, 50.0, 0.5), (1, 20.0, 50.0))
+        self.assertIsNone(index.nearest_point(25.0, 50.0, 0.5))
+
+
+@pytest.mark.health
+class TestAmenityIndex(TestCase):
+    def test_annulus(self):
+        rng = np.random.default_rng(0)
+        x, y = 20 + rng.random(2000) * 0.2, 50 + rng.random(2000) * 0.2
+        amenities = rng.choice(["cafe", "bar"], 2000)
+        index = AmenityIndex(np.arange(2000), amenities, x, y)
+        ids, _, _, distances = index.annulus("cafe", 20.1, 50.1, 1000, 5000, 0.05, exclude_id=0)
+
+        meters = np.hypot(x - 20.1, y - 50.1) * 111320
+        expected = (amenities == "cafe") & (meters >= 1000) & (meters <= 5000) & (np.arange(2000) != 0)
+        self.assertEqual(sorted(ids.tolist()), np.flatnonzero(expected).tolist())
+        self.assertTrue(np.all(np.diff(distances) >= 0))
+        self.assertEqual(len(index.annulus("pub", 20.1, 50.1, 0, 5000, 0.05)[0]), 0)
+
+
+@pytest.mark.health
+class TestPoiSnapTable(TestCase):
+    def test_matches_snap_index(self):
+        rng = np.random.default_rng(0)
+        start_x, start_y = 20 + rng.random(500) * 0.1, 50 + rng.random(500) * 0.1
+        index = SnapIndex(
+            point_ids=np.arange(200),
+            point_x=20 + rng.random(200) * 0.1,
+            point_y=50 + rng.random(200) * 0.1,
+            sources=np.arange(500),
+            targets=np.arange(500, 1000),
+            start_x=start_x,
+            start_y=start_y,
+            end_x=start_x + rng.normal(0, 0.002, 500),
+            end_y=start_y + rng.normal(0, 0.002, 500),
+        )
+        points = index.point_ids, index.point_x, index.point_y
+        table = PoiSnapTable.from_snap_index(index, *points, 0.001, 0.01, 5)
+        self.assertEqual(len(table), 200)
+        for start, end in rng.integers(0, 200, (100, 2)).tolist():
+            x, y = index.point_x[end], index.point_y[end]
+            expected = (
+                index.nearest_source(index.point_x[start], index.point_y[start], x, y, 0.001, 5),
+                index.nearest_target(x, y, 0.01, 5),
+                None,
+            )
+            self.assertEqual(table.leg(start, end, x, y), expected)
+        self.assertIsNone(table.leg(0, 1000, 20.0, 50.0))
+        self.assertEqual(table.targets_of([1000, 3])[0], -1)
@@ -0,0 +1,56 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pytest
+
+from backend.db import leg_cache
+from backend.path import DBPoint
+from backend.storage import LocalDB
+
+
+@pytest.mark.health
+class TestLocalDB(TestCase):
+    def setUp(self):
+        leg_cache.invalidate()
+        self.db = LocalDB.synthetic(size=20, num_points=300)
+
+    def test_save_and_load(self):
+        start = self.db.get_nearest_point(DBPoint(0, 21.001, 52.201))
+        end = self.db.get_nearest_point(DBPoint(0, 21.03, 52.23))
+        path, cost = self.db.find_shortest_path_between(start, end)
+        self.assertGreater(len(path), 0)
+        with tempfile.TemporaryDirectory() as directory:
+            self.db.save(os.path.join(directory, "map"))
+            loaded = LocalDB.load(os.path.join(directory, "map"), method="astar")
+            self.assertIsInstance(loaded._router.indptr, np.memmap)
+            self.assertEqual(loaded.get_point_by_id(start.id), start)
+            self.assertEqual(loaded.get_nearest_point(start), start)
+            leg_cache.invalidate()
+            loaded_path, loaded_cost = loaded.find_shortest_path_between(start, end)
+            self.assertAlmostEqual(loaded_cost, cost)
+            np.testing.assert_array_equal(loaded_path.ids, path.ids)
+            cafes = loaded.get_valid_points(start, 3000, 3600, 60, "cafe")
+            expected = self.db.get_valid_points(start, 3000, 3600, 60, "cafe")
+            np.testing.assert_array_equal(cafes.ids, expected.ids)
+
+    def test_valid_points(self):
+        point = self.db.get_nearest_point(DBPoint(0, 21.02, 52.22))
+        points = self.db.get_valid_points(point, 3000, 3600, 60, "cafe")
+        self.assertGreater(len(points), 0)
+        self.assertTrue(np.all(np.isin(points.ids, self.db._amenity_index.amenities["cafe"][0])))
+        self.assertNotIn(point, points)
+
+    def test_reachable_points(self):
+        point = self.db.get_nearest_point(DBPoint(0, 21.02, 52.22))
+        vertices, costs = self.db.reachable_within(point, 2000)
+        self.assertTrue(np.all(np.diff(costs) >= 0))
+        self.assertLessEqual(costs[-1], 2000)
+        source = self.db._find_nearest_source(point, point)
+        all_costs = self.db._router.costs_from(source, vertices.ids)
+        np.testing.assert_allclose(all_costs, costs)
+        points = self.db.get_reachable_points(point, 3000, 3600, 60, "cafe")
+        self.assertGreater(len(points), 0)
+        self.assertTrue(np.all(np.isin(points.ids, self.db._amenity_index.amenities["cafe"][0])))
+        self.assertNotIn(point, points)
@@ -6,6 +6,8 @@ let MAP_BOUNDS = {
 };
 let MINZOOM = 6;
 let MAXZOOM = 18;
+// zoom levels above the one fitting the start and end at which a simplified path still shows every detail
+let SIMPLIFY_ZOOM_MARGIN = 2;
 
 let greenIcon = new L.Icon({
     iconUrl: 'https://raw.githubusercontent.com/pointhi/leaflet-color-markers/master/img/marker-icon-green.png',
@@ -213,30 +215,128 @@ function createPath() {
         },
         "additional_time": additional_time,
         "additional_distance": additional_distance,
-        "pois": pois
+        "pois": pois,
+        // the path is simplified on the server for the zoom level the map is fitted to once it is drawn, the
+        // route being at least as large as the box of its start and end
+        "zoom": Math.min(
+            map.getBoundsZoom(L.latLngBounds([markers[0].getLatLng(), markers[1].getLatLng()])) + SIMPLIFY_ZOOM_MARGIN,
+            MAXZOOM
+        )
     };
 
 
-    fetch('http://localhost:8000/route/', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify(data)
-    })
-        .then(response => response.json())
-        .then(data => {
-            console.log("Successfully created path: ");
-            console.log(data);
-            drawPaths(data);
+    streamPath(data);
+};
 
-        })
-        .catch(error => {
-            console.error('Error:', error);
+async function streamPath(data) {
+    // The path is streamed as newline-delimited JSON chunks, drawn as soon as they arrive
+    try {
+        const response = await fetch('http://localhost:8000/route/stream/?format=polyline', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(data)
         });
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { done, value } = await reader.read();
+            buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+            let lines = buffer.split('\n');
+            buffer = lines.pop();
+            lines.filter(line => line.trim()).forEach(line => drawChunk(JSON.parse(line)));
+            if (done) {
+                break;
+            }
+        }
+    } catch (error) {
+        console.error('Error:', error);
+    }
 };
 
+function decodePolyline(encoded, precision) {
+    // Decodes an Encoded Polyline Algorithm Format string into [lat, lng] pairs
+    let factor = Math.pow(10, precision);
+    let latlngs = [];
+    let index = 0, lat = 0, lng = 0;
+    while (index < encoded.length) {
+        let deltas = [];
+        for (let k = 0; k < 2; k++) {
+            let result = 0, shift = 0, byte;
+            do {
+                byte = encoded.charCodeAt(index++) - 63;
+                result += (byte & 0x1f) * Math.pow(2, shift);
+                shift += 5;
+            } while (byte >= 0x20);
+            deltas.push(result % 2 ? -(result + 1) / 2 : result / 2);
+        }
+        lat += deltas[0];
+        lng += deltas[1];
+        latlngs.push([lat / factor, lng / factor]);
+    }
+    return latlngs;
+}
+
+function decodePoints(points, pois, precision) {
+    // Turns the points of a compact response (encoded polyline and POI indexes) into PathPoints
+    if (typeof points !== 'string') {
+        return points;
+    }
+    let decoded = decodePolyline(points, precision).map(latlng => ({
+        map_point: { y: latlng[0], x: latlng[1] },
+        is_poi: false
+    }));
+    (pois || []).forEach(poi => Object.assign(decoded[poi.index], poi, { is_poi: true }));
+    return decoded;
+}
+
+function drawChunk(chunk) {
+    if (chunk.type === 'shortest') {
+        if (polyline_shortest) {
+            map.removeLayer(polyline_shortest);
+        }
+        if (polyline) {
+            map.removeLayer(polyline);
+        }
+        let shortest_points = decodePoints(chunk.shortest_points, [], chunk.precision);
+        polyline_shortest = L.polyline(shortest_points.map(point => [point.map_point.y, point.map_point.x]), { color: 'blue' }).addTo(map);
+        polyline = L.polyline([], { color: 'orange' }).addTo(map);
+        map.fitBounds(polyline_shortest.getBounds());
+    } else if (chunk.type === 'poi' || chunk.type === 'end') {
+        decodePoints(chunk.points, chunk.pois, chunk.precision).forEach(point => {
+            polyline.addLatLng([point.map_point.y, point.map_point.x]);
+            drawPOI(point);
+        });
+        if (chunk.type === 'end') {
+            console.log("Successfully created path: ");
+            console.log(chunk);
+            map.fitBounds(polyline.getBounds());
+            drawTotals(chunk);
+        }
+    } else if (chunk.type === 'error') {
+        console.error('Error:', chunk.error);
+    }
+}
+
+function drawPOI(point) {
+    if (point.is_poi) {
+        let marker = L.marker([point.map_point.y, point.map_point.x], {
+            draggable: false,
+            icon: orangeIcon
+        })
+        marker.addTo(map).bindTooltip(point.poi_details.type + "(" + point.dist_from_start + " km)", { permanent: true, offset: [0, 0] });
+    };
+}
+
+function drawTotals(response_data) {
+    markers[1].bindTooltip("End\n" + response_data.path_distance + " (+" + response_data.additional_distance+ ") km\n" + response_data.path_time + "(+" + response_data.additional_time +") min", { permanent: true, offset: [0, 0] });
+}
+
 function drawPaths(response_data) {
+    let shortest_points = decodePoints(response_data.shortest_points, [], response_data.precision);
+    let points = decodePoints(response_data.points, response_data.pois, response_data.precision);
     if (polyline_shortest) {
         map.removeLayer(polyline_shortest);
     }
@@ -244,22 +344,14 @@ function drawPaths(response_data) {
         map.removeLayer(polyline);
     }
 
-    let latlngs_shortest = response_data.shortest_points.map(point => [point.map_point.y, point.map_point.x]);
-    let latlngs = response_data.points.map(point => [point.map_point.y, point.map_point.x]);
+    let latlngs_shortest = shortest_points.map(point => [point.map_point.y, point.map_point.x]);
+    let latlngs = points.map(point => [point.map_point.y, point.map_point.x]);
 
     polyline_shortest = L.polyline(latlngs_shortest, { color: 'blue' }).addTo(map);
     polyline = L.polyline(latlngs, { color: 'orange' }).addTo(map);
     map.fitBounds(polyline_shortest.getBounds());
     map.fitBounds(polyline.getBounds());
 
-    response_data.points.forEach(point => {
-        if (point.is_poi) {
-            let marker = L.marker([point.map_point.y, point.map_point.x], {
-                draggable: false,
-                icon: orangeIcon
-            })
-            marker.addTo(map).bindTooltip(point.poi_details.type + "(" + point.dist_from_start + " km)", { permanent: true, offset: [0, 0] });
-        };}
-    );
-    markers[1].bindTooltip("End\n" + response_data.path_distance + " (+" + response_data.additional_distance+ ") km\n" + response_data.path_time + "(+" + response_data.additional_time +") min", { permanent: true, offset: [0, 0] });
+    points.forEach(drawPOI);
+    drawTotals(response_data);
 }